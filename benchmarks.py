@@ -0,0 +1,566 @@
+import os
+import sys
+import json
+import shutil
+import time
+import platform
+import tempfile
+import argparse
+import resource
+import importlib
+import multiprocessing
+import numpy as np
+from sympy import *
+from ramjet.math import *
+from ramjet.util import *
+
+'''
+Benchmark suite for derivations and numeric kernels
+
+Every derivation found by run_derivations and every numeric evaluator in
+ramjet gets timed in a fresh process, recording:
+
+- seconds: wall time (best of a few repeats for numeric benchmarks)
+- peak_rss_kb: peak resident memory of the process
+- ops: count_ops of everything handed to print_code (derivations only)
+
+Results go to a JSON baseline. Re-running against that baseline flags
+anything that got slower, hungrier or longer by more than the threshold.
+
+    python benchmarks.py --save                       # record a baseline
+    python benchmarks.py                              # compare against it
+    python benchmarks.py 'numeric.*' --threshold 0.5
+    python benchmarks.py --to-polynomial              # to_polynomial paths
+
+Numeric benchmarks run on seeded random control nets, so they're the same
+from run to run.
+'''
+
+BASELINE_PATH = 'benchmarks.json'
+SEED = 1234
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return (result, time.perf_counter() - start)
+
+
+''' Deterministic random control nets '''
+
+
+def random_curves(count, degree, dimensions=3, seed=SEED):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(-1, 1, (count, degree+1, dimensions))
+
+
+def random_patches(count, degree_u, degree_v, dimensions=3, seed=SEED):
+    '''
+    Perturbed planar grids, so patches look like surfaces rather than noise.
+    Homogeneous patches get weights in [0.5, 2].
+    '''
+    rng = np.random.default_rng(seed)
+    u, v = np.meshgrid(np.linspace(0, 1, degree_u+1), np.linspace(0, 1, degree_v+1))
+    grid = np.stack([u, v, np.zeros_like(u)], axis=-1)
+    points = grid[np.newaxis] + rng.normal(0, 0.25, (count, degree_v+1, degree_u+1, 3))
+    if dimensions == 4:
+        weights = rng.uniform(0.5, 2, (count, degree_v+1, degree_u+1, 1))
+        points = np.concatenate([points * weights, weights], axis=-1)
+    return points
+
+
+def random_triangles(count, degree, dimensions=3, seed=SEED):
+    rng = np.random.default_rng(seed)
+    num_points = (degree+1) * (degree+2) // 2
+    return rng.uniform(-1, 1, (count, num_points, dimensions))
+
+
+def random_barycentric(count, seed=SEED):
+    rng = np.random.default_rng(seed)
+    return rng.dirichlet([1, 1, 1], size=count)
+
+
+def quadratic_patch_3d():
+    return [
+        [symbolic_vector_3d('p1'), symbolic_vector_3d('p2'), symbolic_vector_3d('p3')],
+        [symbolic_vector_3d('p4'), symbolic_vector_3d('p5'), symbolic_vector_3d('p6')],
+        [symbolic_vector_3d('p7'), symbolic_vector_3d('p8'), symbolic_vector_3d('p9')]
+    ]
+
+
+def silhouette_cubic_2d_expr():
+    # Same setup as silhouettes.silhouette_cubic_2d, vectorized
+    t = symbols('t')
+
+    points = [symbolic_vector_2d('p%i' % i) for i in range(1, 5)]
+    points_d = differentiate_curve_points(points)
+
+    p = make_bezier(points, bezier_bases(3, t))(t)
+    pd = make_bezier(points_d, bezier_bases(2, t))(t)
+
+    normal = Matrix([-pd[1], pd[0]])
+    return (p.dot(normal), t)
+
+
+def silhouette_quadratic_3d_edge_expr():
+    # Same setup as silhouettes.silhouette_quadratic_3d_edge
+    u, v = symbols('u v')
+
+    patch = quadratic_patch_3d()
+    pos = make_bezier_patch_with_points(patch, u, v)
+
+    patch_du = [
+        [symbolic_vector_3d('du1'), symbolic_vector_3d('du2')],
+        [symbolic_vector_3d('du3'), symbolic_vector_3d('du4')],
+        [symbolic_vector_3d('du5'), symbolic_vector_3d('du6')]
+    ]
+    patch_dv = [
+        [symbolic_vector_3d('dv1'), symbolic_vector_3d('dv2'), symbolic_vector_3d('dv3')],
+        [symbolic_vector_3d('dv4'), symbolic_vector_3d('dv5'), symbolic_vector_3d('dv6')]
+    ]
+
+    tangents_u = make_bezier_patch_with_points(patch_du, u, v)
+    tangents_v = make_bezier_patch_with_points(patch_dv, u, v)
+    normal = tangents_u.cross(tangents_v)
+
+    solution = pos.dot(normal)
+    solution = solution.subs(v, 0)
+    return (solution, u)
+
+
+def cubic_curve_on_quadratic_patch_expr():
+    # Same setup as silhouettes.cubic_curve_on_quadratic_patch
+    u, v, t = symbols('u v t')
+
+    patch = make_bezier_patch_with_points(quadratic_patch_3d(), u, v)
+
+    uvs = [symbolic_vector_2d('uv%i' % i) for i in range(1, 5)]
+    uv = make_bezier(uvs, bezier_bases(3, t))(t)
+
+    p = patch.subs(u, uv[0]).subs(v, uv[1])
+    return (p[0], t)
+
+
+def benchmark_to_polynomial():
+    '''
+    to_polynomial (simplify + collect) against polynomial_coeffs and
+    polynomial_degree on expressions from the repo's derivations
+    '''
+    cases = [
+        ('silhouette_cubic_2d', silhouette_cubic_2d_expr),
+        ('silhouette_quadratic_3d_edge', silhouette_quadratic_3d_edge_expr),
+        ('cubic_curve_on_quadratic_patch', cubic_curve_on_quadratic_patch_expr),
+    ]
+
+    print("%-32s %12s %12s %12s %8s" % ("derivation", "to_poly", "fast", "degree", "deg"))
+    for name, build in cases:
+        expr, param = build()
+
+        poly_slow, time_slow = timed(to_polynomial, expr, param)
+        poly_fast, time_fast = timed(to_polynomial_fast, expr, param)
+        degree, time_degree = timed(polynomial_degree, expr, param)
+
+        if poly_slow.degree() != poly_fast.degree():
+            raise Exception("Degree mismatch for %s: %i vs %i" % (
+                name, poly_slow.degree(), poly_fast.degree()))
+
+        print("%-32s %11.3fs %11.3fs %11.3fs %8i" % (
+            name, time_slow, time_fast, time_degree, poly_fast.degree()))
+
+
+''' Numeric benchmarks: name -> (setup, run), run(*setup()) gets timed '''
+
+
+def setup_curves():
+    return (random_curves(100000, 3), np.linspace(0, 1, 16))
+
+
+def run_curves(points, t):
+    from ramjet.curves import evaluate_curves
+    evaluate_curves(points, t, order=2)
+
+
+def setup_patches():
+    u, v = np.meshgrid(np.linspace(0, 1, 8), np.linspace(0, 1, 8))
+    return (random_patches(10000, 2, 2), u.ravel(), v.ravel())
+
+
+def run_patches(points, u, v):
+    from ramjet.patches import evaluate_patches
+    evaluate_patches(points, u, v)
+
+
+def setup_patches_rational():
+    u, v = np.meshgrid(np.linspace(0, 1, 8), np.linspace(0, 1, 8))
+    return (random_patches(10000, 4, 4, dimensions=4), u.ravel(), v.ravel())
+
+
+def setup_triangles():
+    return (random_triangles(10000, 3), random_barycentric(64))
+
+
+def run_triangles(points, uvw):
+    from ramjet.triangles import evaluate_triangles
+    evaluate_triangles(points, uvw)
+
+
+def setup_silhouettes():
+    return (random_patches(5000, 2, 2), np.array([0.5, 0.5, -3.0]))
+
+
+def run_silhouettes(points, viewpoint):
+    from ramjet.silhouette_solver import solve_silhouettes
+    solve_silhouettes(points, viewpoint)
+
+
+def setup_roots():
+    rng = np.random.default_rng(SEED)
+    return (rng.normal(size=(20000, 9)),)
+
+
+def run_roots(coeffs):
+    from ramjet.roots import bernstein_roots
+    bernstein_roots(coeffs)
+
+
+def setup_kernel(make_kernel=None):
+    if make_kernel is None:
+        from ramjet.kernels import make_kernel
+    u, v = symbols('u v')
+    patch = quadratic_patch_3d()
+    pos = make_bezier_patch_with_points(patch, u, v)
+    normal = diff(pos, u).cross(diff(pos, v))
+    common, exprs = cse(normal, numbered_symbols('a'))
+    kernel = make_kernel(common, exprs)
+
+    rng = np.random.default_rng(SEED)
+    count = 100000
+    return (kernel, random_patches(count, 2, 2).reshape(count, 9, 3), rng.random(count), rng.random(count))
+
+
+def setup_native_kernel():
+    from ramjet.native import make_native_kernel
+    return setup_kernel(make_native_kernel)
+
+
+def run_kernel(kernel, points, u, v):
+    kernel(points, u, v)
+
+
+def setup_split_patches():
+    points = random_patches(10000, 4, 4)
+    return (points, tuple(np.empty_like(points) for _ in range(0, 4)))
+
+
+def run_split_patches(points, out):
+    from ramjet.subdivision import split_patches
+    split_patches(points, 0.5, 0.5, out=out)
+
+
+def setup_subdivide_triangles():
+    points = random_triangles(10000, 4)
+    return (points, tuple(np.empty_like(points) for _ in range(0, 4)))
+
+
+def run_subdivide_triangles(points, out):
+    from ramjet.subdivision import subdivide_triangles
+    subdivide_triangles(points, out=out)
+
+
+def setup_tessellate_patches():
+    return (random_patches(2000, 2, 2), np.array([0.5, 0.5, -3.0]))
+
+
+def run_tessellate_patches(points, view_point):
+    from ramjet.tessellate import tessellate_patch_chunks
+    for chunk in tessellate_patch_chunks(points, 1e-3, view_point=view_point):
+        pass
+
+
+def setup_bvh_rays():
+    from ramjet.bvh import BVH
+    rng = np.random.default_rng(SEED)
+    count = 20000
+    points = random_patches(count, 2, 2) + rng.uniform(-20, 20, (count, 1, 1, 3))
+    return (BVH(points), rng.uniform(-25, 25, (1000, 3)), rng.normal(size=(1000, 3)))
+
+
+def run_bvh_rays(bvh, origins, directions):
+    bvh.intersect_rays(origins, directions, refine_depth=2)
+
+
+def setup_intersect_rays():
+    from ramjet.bvh import BVH
+    rng = np.random.default_rng(SEED)
+    count = 2000
+    points = random_patches(count, 2, 2) + rng.uniform(-10, 10, (count, 1, 1, 3))
+    return (points, BVH(points), rng.uniform(-12, 12, (1000, 3)), rng.normal(size=(1000, 3)))
+
+
+def run_intersect_rays(points, bvh, origins, directions):
+    from ramjet.intersect import intersect_rays
+    intersect_rays(points, origins, directions, bvh)
+
+
+def setup_arc_length():
+    return (random_curves(10000, 3),)
+
+
+def run_arc_length(points):
+    from ramjet.arclength import ArcLengthTable
+    ArcLengthTable(points).uniform_parameters(32)
+
+
+def setup_inflections():
+    return (random_curves(1000000, 3, dimensions=2),)
+
+
+def run_inflections(points):
+    from ramjet.inflections import inflections
+    inflections(points)
+
+
+def setup_curvature_extrema():
+    return (random_curves(20000, 3, dimensions=2),)
+
+
+def run_curvature_extrema(points):
+    from ramjet.curvature import curvature_extrema
+    curvature_extrema(points)
+
+
+NUMERIC_BENCHMARKS = {
+    'evaluate_curves': (setup_curves, run_curves),
+    'evaluate_patches': (setup_patches, run_patches),
+    'evaluate_patches_rational': (setup_patches_rational, run_patches),
+    'evaluate_triangles': (setup_triangles, run_triangles),
+    'solve_silhouettes': (setup_silhouettes, run_silhouettes),
+    'bernstein_roots': (setup_roots, run_roots),
+    'kernel_quadratic_patch_normals': (setup_kernel, run_kernel),
+    'native_kernel_quadratic_patch_normals': (setup_native_kernel, run_kernel),
+    'split_patches': (setup_split_patches, run_split_patches),
+    'subdivide_triangles': (setup_subdivide_triangles, run_subdivide_triangles),
+    'tessellate_patches': (setup_tessellate_patches, run_tessellate_patches),
+    'bvh_rays': (setup_bvh_rays, run_bvh_rays),
+    'intersect_rays': (setup_intersect_rays, run_intersect_rays),
+    'arc_length': (setup_arc_length, run_arc_length),
+    'inflections': (setup_inflections, run_inflections),
+    'curvature_extrema': (setup_curvature_extrema, run_curvature_extrema),
+}
+
+
+''' Running benchmarks in isolated processes '''
+
+
+def peak_rss_kb():
+    # ru_maxrss is in kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def count_generated_ops(common, exprs):
+    ops = sum(count_ops(expr) for _, expr in common)
+    ops += sum(count_ops(expr) for expr in exprs)
+    return ops
+
+
+def run_benchmark(name, repeat, connection):
+    '''
+    Worker process entry point, sends a result dict back over connection
+    '''
+    result = {}
+    try:
+        kind, func_name = name.split('.', 1)
+        if kind == 'numeric':
+            setup, run = NUMERIC_BENCHMARKS[func_name]
+            args = setup()
+            best = None
+            for i in range(0, repeat):
+                _, seconds = timed(run, *args)
+                best = seconds if best is None else min(best, seconds)
+            result['seconds'] = best
+        else:
+            module = importlib.import_module(kind)
+            original_print_code = module.print_code
+            ops = []
+
+            # Count what would be shipped, then print it as usual
+            def counting_print_code(common, exprs, *args, **kwargs):
+                ops.append(count_generated_ops(common, exprs))
+                original_print_code(common, exprs, *args, **kwargs)
+            module.print_code = counting_print_code
+
+            with open(os.devnull, 'w') as devnull:
+                stdout = sys.stdout
+                sys.stdout = devnull
+                try:
+                    _, seconds = timed(getattr(module, func_name))
+                finally:
+                    sys.stdout = stdout
+
+            result['seconds'] = seconds
+            if ops:
+                result['ops'] = sum(ops)
+
+        result['peak_rss_kb'] = peak_rss_kb()
+        result['status'] = 'ok'
+    except Exception as e:
+        result = {'status': 'failed', 'error': '%s: %s' % (type(e).__name__, e)}
+
+    connection.send(result)
+    connection.close()
+
+
+def run_benchmarks(names, timeout=None, repeat=3):
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for name in names:
+        # Derivations going through cached_cse would otherwise be timed
+        # against whatever the on-disk cache holds; each worker gets an
+        # empty one, through the environment it's spawned with
+        cache_dir = tempfile.mkdtemp(prefix='ramjet-bench-')
+        previous_cache_dir = os.environ.get('RAMJET_CACHE_DIR')
+        os.environ['RAMJET_CACHE_DIR'] = cache_dir
+
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=run_benchmark, args=(name, repeat, sender))
+        start = time.perf_counter()
+        try:
+            process.start()
+        finally:
+            if previous_cache_dir is None:
+                del os.environ['RAMJET_CACHE_DIR']
+            else:
+                os.environ['RAMJET_CACHE_DIR'] = previous_cache_dir
+        sender.close()
+
+        if receiver.poll(timeout):
+            try:
+                result = receiver.recv()
+            except EOFError:
+                result = {'status': 'failed', 'error': 'worker exited with %s' % process.exitcode}
+        else:
+            process.terminate()
+            result = {'status': 'timeout', 'seconds': time.perf_counter() - start}
+        process.join()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+        results[name] = result
+        print(format_result(name, result))
+        sys.stdout.flush()
+    return results
+
+
+def format_result(name, result):
+    if result['status'] == 'failed':
+        return "%-8s %-72s %s" % ('failed', name, result.get('error', ''))
+    return "%-8s %-72s %9.3fs %9i KB %9s ops" % (
+        result['status'], name, result.get('seconds', 0), result.get('peak_rss_kb', 0),
+        result.get('ops', '-'))
+
+
+''' Baselines '''
+
+
+def environment():
+    import sympy
+    return {
+        'python': platform.python_version(),
+        'sympy': sympy.__version__,
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+    }
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_baseline(path, results, previous=None):
+    # Keep entries we didn't re-run this time
+    benchmarks = dict(previous['benchmarks']) if previous else {}
+    benchmarks.update(results)
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'benchmarks': benchmarks}, f, indent=2, sort_keys=True)
+
+
+def find_regressions(results, baseline, threshold, min_seconds=0.05):
+    '''
+    Returns [(name, metric, before, after)] for every metric that grew by
+    more than threshold (0.2 = 20%). Timings under min_seconds are too
+    noisy to judge and get skipped.
+    '''
+    regressions = []
+    for name, result in sorted(results.items()):
+        before = baseline['benchmarks'].get(name)
+        if before is None:
+            continue
+
+        if before.get('status') == 'ok' and result.get('status') != 'ok':
+            regressions.append((name, 'status', before['status'], result['status']))
+            continue
+
+        for metric in ('seconds', 'peak_rss_kb', 'ops'):
+            if metric not in before or metric not in result:
+                continue
+            if metric == 'seconds' and max(before[metric], result[metric]) < min_seconds:
+                continue
+            if result[metric] > before[metric] * (1 + threshold):
+                regressions.append((name, metric, before[metric], result[metric]))
+    return regressions
+
+
+def main():
+    from run_derivations import discover_derivations
+    from fnmatch import fnmatch
+
+    parser = argparse.ArgumentParser(description="Benchmark derivations and numeric kernels")
+    parser.add_argument('patterns', nargs='*',
+                        help="fnmatch patterns on module.function or numeric.name, default all")
+    parser.add_argument('-b', '--baseline', default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument('-s', '--save', action='store_true', help="write results to the baseline")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="relative growth that counts as a regression, default 0.2")
+    parser.add_argument('-t', '--timeout', type=float, default=None,
+                        help="seconds before a benchmark is killed, default none")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="repeats for numeric benchmarks")
+    parser.add_argument('--to-polynomial', action='store_true',
+                        help="compare the to_polynomial paths instead")
+    args = parser.parse_args()
+
+    if args.to_polynomial:
+        benchmark_to_polynomial()
+        return 0
+
+    names = ['%s.%s' % d for d in discover_derivations()]
+    names += ['numeric.%s' % name for name in NUMERIC_BENCHMARKS]
+    if args.patterns:
+        names = [n for n in names if any(fnmatch(n, p) or fnmatch(n.split('.', 1)[1], p) for p in args.patterns)]
+
+    results = run_benchmarks(names, args.timeout, args.repeat)
+    baseline = load_baseline(args.baseline)
+
+    if args.save:
+        save_baseline(args.baseline, results, baseline)
+        print("\nSaved %i results to %s" % (len(results), args.baseline))
+        return 0
+
+    if baseline is None:
+        print("\nNo baseline at %s, run with --save to record one" % args.baseline)
+        return 0
+
+    regressions = find_regressions(results, baseline, args.threshold)
+    if not regressions:
+        print("\nNo regressions beyond %i%%" % (args.threshold * 100))
+        return 0
+
+    print("\nRegressions beyond %i%%:" % (args.threshold * 100))
+    for name, metric, before, after in regressions:
+        print("  %-72s %-12s %s -> %s" % (name, metric, before, after))
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
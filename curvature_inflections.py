@@ -4,6 +4,8 @@ from sympy.physics.vector import *
 from functools import reduce
 from ramjet.math import *
 from ramjet.util import *
+from ramjet.controlnet import symbolic_net, CURVE
+from ramjet.hodograph import evaluate_derivative
 
 
 def prove_curve_derives():
@@ -236,22 +238,12 @@ def bezier_ddt_partials():
 def inflections_cubic_3d():
     t = symbols('t')
 
-    p1 = symbolic_vector_3d('p1')
-    p2 = symbolic_vector_3d('p2')
-    p3 = symbolic_vector_3d('p3')
-    p4 = symbolic_vector_3d('p4')
-
-    points = [p1, p2, p3, p4]
-    points_d = differentiate_curve_points(points)
-    points_dd = differentiate_curve_points(points_d)
-
-    bases_d = bezier_bases(2, t)
-    bases_dd = bezier_bases(1, t)
-
-    pd = make_bezier(points_d, bases_d)
-    pdd = make_bezier(points_dd, bases_dd)
+    # p1..p4, differenced once for both derivatives
+    points = symbolic_net('p', CURVE, (4,))
+    pd = evaluate_derivative(points, 1, t)
+    pdd = evaluate_derivative(points, 2, t)
 
-    curvature = pd(t).cross(pdd(t))
+    curvature = pd.cross(pdd)
     curvature = expand(curvature)
     solutions = map(lambda partial: solveset(partial, t).args[0], curvature)
 
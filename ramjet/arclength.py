@@ -0,0 +1,177 @@
+import numpy as np
+from functools import lru_cache
+from ramjet.curves import bernstein_matrix, differentiate_curve_points_np
+
+'''
+Arc length of Bezier curves, batched
+
+The length of a curve up to t is the integral of its speed |p'(t)|, and p'
+is the Bezier curve of the hodograph net (differentiate_curve_points). The
+speed is a square root of a polynomial, which Gauss-Legendre quadrature
+integrates very well over short pieces: an ArcLengthTable cuts [0, 1] into
+equal segments, integrates each with a fixed number of nodes and keeps the
+running sums, segments+1 floats per curve.
+
+Inverse queries, the parameter at which a curve has travelled a given
+length, find their segment in the table, start from linear interpolation
+within it, and polish with safeguarded Newton on the integral. That's what
+moving at constant speed along make_bezier curves wants: uniform_parameters
+gives evenly spaced points along every curve at once.
+
+Curves are (N, degree+1, dim) as in ramjet.curves; 4d points are
+homogeneous, with the speed of the projected curve
+(X' w - X w') / w^2.
+'''
+
+SEGMENTS = 16
+ORDER = 8
+NEWTON_ITERATIONS = 8
+
+
+@lru_cache(maxsize=None)
+def gauss_legendre(order):
+    '''
+    Nodes and weights of order point Gauss-Legendre quadrature over [0, 1]
+    '''
+    nodes, weights = np.polynomial.legendre.leggauss(order)
+    nodes, weights = (nodes + 1) / 2, weights / 2
+    nodes.flags.writeable = False
+    weights.flags.writeable = False
+    return (nodes, weights)
+
+
+class ArcLengthTable:
+    '''
+    Cumulative arc lengths of N curves at segments+1 equally spaced
+    parameters, lengths (N, segments+1), for lengths and inverse queries
+    '''
+
+    def __init__(self, points, segments=SEGMENTS, order=ORDER):
+        points = np.asarray(points, dtype=np.float64)
+        if points.ndim != 3:
+            raise Exception("Expected points of shape (N, degree+1, dim), got %s" % (points.shape,))
+        if segments < 1 or order < 1:
+            raise Exception("Expected at least one segment and one node, got %i and %i" % (segments, order))
+
+        self.points = points
+        self.hodograph = differentiate_curve_points_np(points)
+        self.rational = points.shape[-1] == 4
+        self.segments = segments
+        self.order = order
+
+        nodes, weights = gauss_legendre(order)
+        starts = np.arange(0, segments) / segments
+        t = (starts[:, np.newaxis] + nodes / segments).ravel()
+        speeds = self.speeds(t).reshape(len(points), segments, order)
+        pieces = speeds @ weights / segments
+
+        self.lengths = np.zeros((len(points), segments+1))
+        np.cumsum(pieces, axis=1, out=self.lengths[:, 1:])
+
+    @property
+    def total(self):
+        '''
+        Length of every curve, (N,)
+        '''
+        return self.lengths[:, -1]
+
+    def speeds(self, t):
+        '''
+        |p'(t)| at parameters (T,) shared by all curves or (N, T) per curve
+        '''
+        t = np.asarray(t, dtype=np.float64)
+        if t.ndim == 1:
+            return self._speeds(self.points, self.hodograph, t)
+        t = self._per_curve(t, "parameters")
+        return self._speeds(self.points[:, np.newaxis], self.hodograph[:, np.newaxis], t[..., np.newaxis])[..., 0]
+
+    def _speeds(self, points, hodograph, t):
+        # t (..., k) against nets (..., b, d) broadcasting, as (..., k)
+        degree = self.points.shape[1] - 1
+        tangents = bernstein_matrix(max(degree-1, 0), t) @ hodograph
+        if self.rational:
+            positions = bernstein_matrix(degree, t) @ points
+            w, dw = positions[..., 3:], tangents[..., 3:]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                tangents = (tangents[..., :3] * w - positions[..., :3] * dw) / (w * w)
+        return np.sqrt(np.einsum('...d,...d->...', tangents, tangents))
+
+    def _per_curve(self, values, name):
+        values = np.asarray(values, dtype=np.float64)
+        if values.ndim == 1:
+            return np.broadcast_to(values, (len(self.points),) + values.shape)
+        if values.ndim != 2 or len(values) != len(self.points):
+            raise Exception("Expected %s of shape (T,) or (%i, T), got %s" % (name, len(self.points), values.shape))
+        return values
+
+    def _integrate(self, rows, start, end):
+        # Lengths from start to end (Q,) of curves rows (Q,), within one segment
+        nodes, weights = gauss_legendre(self.order)
+        t = start[:, np.newaxis] + (end - start)[:, np.newaxis] * nodes
+        speeds = self._speeds(self.points[rows], self.hodograph[rows], t)
+        return (end - start) * (speeds @ weights)
+
+    def _segment_of(self, t):
+        return np.clip((t * self.segments).astype(np.int64), 0, self.segments-1)
+
+    def lengths_at(self, t):
+        '''
+        Arc length from 0 to t, t (T,) shared or (N, T) per curve
+        '''
+        t = np.clip(self._per_curve(t, "parameters"), 0, 1)
+        rows = np.repeat(np.arange(0, len(self.points)), t.shape[1])
+        t = t.ravel()
+        segment = self._segment_of(t)
+        lengths = self.lengths[rows, segment] + self._integrate(rows, segment / self.segments, t)
+        return lengths.reshape(len(self.points), -1)
+
+    def parameters(self, s, iterations=NEWTON_ITERATIONS, tolerance=1e-12):
+        '''
+        Parameters (N, T) at which each curve has travelled lengths s, (T,)
+        shared or (N, T) per curve, clamped to [0, total]. Queries stop
+        once within tolerance times their curve's length.
+        '''
+        s = np.clip(self._per_curve(s, "lengths"), 0, self.total[:, np.newaxis])
+        shape = s.shape
+
+        # First segment reaching s, so zero length pieces are skipped
+        inner = self.lengths[:, np.newaxis, 1:-1]
+        segment = (inner < s[..., np.newaxis]).sum(axis=-1).ravel()
+        rows = np.repeat(np.arange(0, shape[0]), shape[1])
+        s = s.ravel()
+        below = self.lengths[rows, segment]
+        above = self.lengths[rows, segment+1]
+        start = segment / self.segments
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            fraction = np.where(above > below, (s - below) / (above - below), 0.0)
+        t = start + fraction / self.segments
+
+        # Lengths are increasing in t, so every evaluation narrows a bracket
+        # [low, high] around the answer; Newton steps leaving it bisect
+        # instead. Converged queries drop out of the active set.
+        low, high = start.copy(), start + 1 / self.segments
+        active = np.arange(0, len(t))
+        for _ in range(0, iterations):
+            r, a_t = rows[active], t[active]
+            error = below[active] + self._integrate(r, start[active], a_t) - s[active]
+            pending = np.abs(error) > tolerance * self.total[r]
+            active, r, a_t, error = active[pending], r[pending], a_t[pending], error[pending]
+            if not len(active):
+                break
+
+            a_low = np.where(error < 0, a_t, low[active])
+            a_high = np.where(error > 0, a_t, high[active])
+            speed = self._speeds(self.points[r], self.hodograph[r], a_t[:, np.newaxis])[:, 0]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                a_t = a_t - error / speed
+            t[active] = np.where((a_t >= a_low) & (a_t <= a_high), a_t, (a_low + a_high) / 2)
+            low[active], high[active] = a_low, a_high
+        return t.reshape(shape)
+
+    def uniform_parameters(self, count):
+        '''
+        Parameters (N, count) of count points evenly spaced along each
+        curve, both ends included
+        '''
+        return self.parameters(self.total[:, np.newaxis] * np.linspace(0, 1, count))
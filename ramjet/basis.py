@@ -0,0 +1,172 @@
+import os
+from functools import lru_cache, reduce
+import numpy as np
+from sympy import ImmutableMatrix, Rational, binomial, kronecker_product, zeros
+
+'''
+Bernstein <-> power basis conversion
+
+A degree n Bezier with control values b_i is also a plain polynomial
+sum(c_j * t^j). The coefficients are related by a fixed lower triangular
+matrix per degree:
+
+c_j = sum_i (-1)^(j-i) * C(n,j) * C(j,i) * b_i
+
+So rather than expanding binomial(n,i) * t^i * (1-t)^(n-i) trees, we can
+get monomial coefficients as a matrix product. Tables are exact (sympy
+Integers / Rationals) and cached per degree, with float64 copies for
+numeric callers. Tensor product patches use the Kronecker product of the
+u and v tables.
+'''
+
+
+@lru_cache(maxsize=None)
+def bernstein_to_power(n):
+    '''
+    (n+1, n+1) matrix M with power coefficients = M * bernstein coefficients
+    '''
+    m = zeros(n+1, n+1)
+    for j in range(0, n+1):
+        for i in range(0, j+1):
+            m[j, i] = (-1)**(j-i) * binomial(n, j) * binomial(j, i)
+    return ImmutableMatrix(m)
+
+
+@lru_cache(maxsize=None)
+def power_to_bernstein(n):
+    '''
+    Inverse of bernstein_to_power: b_i = sum_{j<=i} C(i,j) / C(n,j) * c_j
+    '''
+    m = zeros(n+1, n+1)
+    for i in range(0, n+1):
+        for j in range(0, i+1):
+            m[i, j] = Rational(binomial(i, j), binomial(n, j))
+    return ImmutableMatrix(m)
+
+
+@lru_cache(maxsize=None)
+def bernstein_to_power_np(n):
+    m = np.array(bernstein_to_power(n).tolist(), dtype=np.float64)
+    m.flags.writeable = False
+    return m
+
+
+@lru_cache(maxsize=None)
+def power_to_bernstein_np(n):
+    m = np.array(power_to_bernstein(n).tolist(), dtype=np.float64)
+    m.flags.writeable = False
+    return m
+
+
+@lru_cache(maxsize=None)
+def patch_bernstein_to_power(degree_u, degree_v):
+    '''
+    Conversion for tensor product patches, acting on control points
+    flattened in make_bezier_patch_with_points order (v major, u minor).
+    Row v_pow * (degree_u+1) + u_pow holds the coefficient of u^u_pow * v^v_pow.
+    '''
+    mu = bernstein_to_power(degree_u)
+    mv = bernstein_to_power(degree_v)
+    return ImmutableMatrix(kronecker_product(mv, mu))
+
+
+@lru_cache(maxsize=None)
+def patch_bernstein_to_power_np(degree_u, degree_v):
+    m = np.kron(bernstein_to_power_np(degree_v), bernstein_to_power_np(degree_u))
+    m.flags.writeable = False
+    return m
+
+
+''' Symbolic callers '''
+
+
+def curve_power_coefficients(points):
+    '''
+    Given curve control points (scalars or Matrix vectors), returns the
+    coefficients of t^0 .. t^n, in the same type as the points.
+    '''
+    m = bernstein_to_power(len(points)-1)
+    coeffs = []
+    for j in range(0, m.rows):
+        terms = [m[j, i] * points[i] for i in range(0, j+1)]
+        coeffs.append(reduce(lambda a, b: a + b, terms))
+    return coeffs
+
+
+def make_bezier_power(points, param):
+    '''
+    Same curve as make_bezier(points, bezier_bases(n, param)), but built
+    directly in monomial form, so there's nothing left to expand in param.
+    '''
+    coeffs = curve_power_coefficients(points)
+    terms = [c * param**j for j, c in enumerate(coeffs)]
+    return reduce(lambda a, b: a + b, terms)
+
+
+def patch_power_coefficients(patch):
+    '''
+    Given a patch as used by make_bezier_patch_with_points, returns
+    coeffs[v_pow][u_pow], the coefficient of u^u_pow * v^v_pow.
+    '''
+    degree_u = len(patch[0])-1
+    degree_v = len(patch)-1
+    mv = bernstein_to_power(degree_v)
+
+    # Rows first, then columns: Mv * P * Mu^T, with P holding points
+    rows = [curve_power_coefficients(row) for row in patch]
+    coeffs = []
+    for v_pow in range(0, degree_v+1):
+        coeffs_v = []
+        for u_pow in range(0, degree_u+1):
+            column = [mv[v_pow, i] * rows[i][u_pow] for i in range(0, v_pow+1)]
+            coeffs_v.append(reduce(lambda a, b: a + b, column))
+        coeffs.append(coeffs_v)
+    return coeffs
+
+
+def make_bezier_patch_power(patch, u, v):
+    coeffs = patch_power_coefficients(patch)
+    terms = []
+    for v_pow, row in enumerate(coeffs):
+        for u_pow, c in enumerate(row):
+            terms.append(c * u**u_pow * v**v_pow)
+    return reduce(lambda a, b: a + b, terms)
+
+
+''' Numeric callers '''
+
+
+def curve_power_coefficients_np(points):
+    '''
+    points: (..., degree+1, dim) -> (..., degree+1, dim) monomial coefficients
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    m = bernstein_to_power_np(points.shape[-2]-1)
+    return np.einsum('jb,...bd->...jd', m, points)
+
+
+def patch_power_coefficients_np(points):
+    '''
+    points: (..., degree_v+1, degree_u+1, dim) -> same shape, holding the
+    coefficient of u^j * v^i at [..., i, j, :]
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    mv = bernstein_to_power_np(points.shape[-3]-1)
+    mu = bernstein_to_power_np(points.shape[-2]-1)
+    return np.einsum('ia,jb,...abd->...ijd', mv, mu, points)
+
+
+def export_tables(directory, max_degree):
+    '''
+    Writes bernstein_to_power_<n>.npy and power_to_bernstein_<n>.npy for
+    every degree up to max_degree. Returns the written paths.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for n in range(0, max_degree+1):
+        for name, table in (('bernstein_to_power', bernstein_to_power_np(n)),
+                            ('power_to_bernstein', power_to_bernstein_np(n))):
+            path = os.path.join(directory, '%s_%i.npy' % (name, n))
+            np.save(path, table)
+            paths.append(path)
+    return paths
@@ -0,0 +1,357 @@
+import numpy as np
+from ramjet.controlnet import CURVE, PATCH, TRIANGLE
+from ramjet.subdivision import split_curves, split_patches, subdivide_triangles
+from ramjet.triangles import triangle_degree
+
+'''
+Bounding volume hierarchy over control nets
+
+A Bezier curve or patch lies inside the convex hull of its control net, so
+the axis aligned box of the net bounds it too. BVH builds a binary tree of
+those boxes over a whole scene of nets, so ray, frustum and nearest queries
+only look at the few nets whose boxes they reach instead of all of them.
+
+Net boxes can be loose, a net bulges well past its surface. Queries take a
+refine depth: nets that survive the tree are subdivided that many times
+(ramjet.subdivision, 2 pieces per level for curves, 4 for patches and
+triangles) and tested piece by piece against the much tighter boxes of
+the pieces. Pieces are computed on first use and kept, per net and depth.
+
+When control points move, refit recomputes the boxes of the nets that
+changed and of their ancestors, keeping the tree as it is. That stays
+correct for any motion, but the tree gets slower as nets wander off from
+where it was built; build a new BVH when that happens.
+
+Nets are laid out as elsewhere: (K, degree+1, dim) curves, (K, rows,
+cols, dim) patches or (K, M, dim) triangles, with homogeneous 4d points
+projected for their boxes (fine for positive weights).
+
+Queries are batched and walk the tree breadth first, one level of
+(query, node) pairs at a time, leaves included, so the python loop runs
+once per tree level rather than per query or node.
+'''
+
+LEAF_SIZE = 4
+
+
+def _projected(points):
+    if points.shape[-1] == 4:
+        return points[..., :3] / points[..., 3:]
+    return points
+
+
+def net_boxes(points):
+    '''
+    (lower, upper), each (K, 3), of K nets of any layout
+    '''
+    points = _projected(np.asarray(points, dtype=np.float64))
+    flat = points.reshape(points.shape[0], -1, points.shape[-1])
+    return (flat.min(axis=1), flat.max(axis=1))
+
+
+def net_corners(points, kind):
+    '''
+    (K, C, 3) control points that lie on the curves or surfaces themselves:
+    curve ends, patch and triangle corners
+    '''
+    points = _projected(np.asarray(points, dtype=np.float64))
+    if kind == CURVE:
+        return points[:, [0, -1]]
+    if kind == PATCH:
+        return np.stack([points[:, 0, 0], points[:, 0, -1], points[:, -1, 0], points[:, -1, -1]], axis=1)
+    # 00n, 0n0 and n00, first and last of the i = 0 row and the very last
+    degree = triangle_degree(points.shape[1])
+    return points[:, [0, degree, points.shape[1] - 1]]
+
+
+def _subdivide(points, kind):
+    if kind == CURVE:
+        return np.stack(split_curves(points), axis=1)
+    if kind == PATCH:
+        return np.stack(split_patches(points), axis=1)
+    return np.stack(subdivide_triangles(points), axis=1)
+
+
+def _ray_boxes(origins, inverse, lower, upper, t_max):
+    # Slab test of ray i against box i, all arrays (P, 3) but t_max (P,).
+    # fmin/fmax drop the nan of 0 * inf for rays in a slab's plane.
+    with np.errstate(invalid='ignore'):
+        t1 = (lower - origins) * inverse
+        t2 = (upper - origins) * inverse
+    t_near = np.fmax.reduce(np.fmin(t1, t2), axis=1)
+    t_far = np.fmin.reduce(np.fmax(t1, t2), axis=1)
+    t_near = np.maximum(t_near, 0.0)
+    return (t_near <= np.minimum(t_far, t_max), t_near)
+
+
+def _ranges(starts, counts):
+    # Concatenated aranges start:start+count
+    ends = np.cumsum(counts)
+    return np.repeat(starts - ends + counts, counts) + np.arange(0, ends[-1] if len(ends) else 0)
+
+
+def _box_distances(points, lower, upper):
+    # Distance from point i to box i, 0 inside
+    outside = np.maximum(lower - points, 0.0) + np.maximum(points - upper, 0.0)
+    return np.linalg.norm(outside, axis=-1)
+
+
+class BVH:
+    '''
+    Tree over K control nets. Nodes are stored flat, parents before
+    children: lower and upper bounds (N, 3), children (N, 2) with -1 at
+    leaves, and at leaves the slice start:start+count of order, which
+    holds net indices.
+    '''
+
+    def __init__(self, points, kind=None, leaf_size=LEAF_SIZE):
+        self.points = np.asarray(points, dtype=np.float64)
+        if kind is None:
+            kind = PATCH if self.points.ndim == 4 else CURVE
+        if kind not in (CURVE, PATCH, TRIANGLE):
+            raise Exception("Unknown control net kind %s" % kind)
+        self.kind = kind
+        self.leaf_size = leaf_size
+        self.net_lower, self.net_upper = net_boxes(self.points)
+        self.net_corners = net_corners(self.points, kind)
+        self._refined = {}  # depth -> (lower, upper) (K, pieces, 3) of the pieces, filled (K,)
+        self._build()
+
+    def __len__(self):
+        return self.points.shape[0]
+
+    def _build(self):
+        # Median splits along the widest axis of the box centers
+        centers = (self.net_lower + self.net_upper) / 2
+        order = np.arange(0, len(self))
+        nodes = []  # (start, count, depth, parent)
+        children = []
+        stack = [(0, len(self), 0, -1, None)]
+        while stack:
+            start, count, depth, parent, side = stack.pop()
+            node = len(nodes)
+            nodes.append((start, count, depth, parent))
+            children.append([-1, -1])
+            if parent >= 0:
+                children[parent][side] = node
+            if count <= self.leaf_size:
+                continue
+
+            members = order[start:start+count]
+            extent = centers[members].max(axis=0) - centers[members].min(axis=0)
+            axis = int(np.argmax(extent))
+            half = count // 2
+            split = np.argpartition(centers[members, axis], half)
+            order[start:start+count] = members[split]
+            # Right pushed first, so left children come right after parents
+            stack.append((start + half, count - half, depth + 1, node, 1))
+            stack.append((start, half, depth + 1, node, 0))
+
+        nodes = np.array(nodes, dtype=np.int64).reshape(-1, 4)
+        self.order = order
+        self.start = nodes[:, 0]
+        self.count = nodes[:, 1]
+        self.depth = nodes[:, 2]
+        self.parent = nodes[:, 3]
+        self.children = np.array(children, dtype=np.int64).reshape(-1, 2)
+        self.is_leaf = self.children[:, 0] < 0
+
+        leaves = np.flatnonzero(self.is_leaf)
+        leaves = leaves[np.argsort(self.start[leaves])]
+        self.leaf_of = np.empty(len(self), dtype=np.int64)
+        self.leaf_of[order] = np.repeat(leaves, self.count[leaves])
+
+        self.lower = np.empty((len(nodes), 3))
+        self.upper = np.empty((len(nodes), 3))
+        self.sample = np.empty((len(nodes), 3))
+        self._refit_nodes(np.arange(0, len(nodes)))
+
+    def _refit_nodes(self, nodes):
+        # Leaves from their nets, then internal nodes deepest first
+        # Leaves cover order in contiguous runs, so one reduceat does them all
+        leaves = nodes[self.is_leaf[nodes]]
+        if len(leaves):
+            all_leaves = np.flatnonzero(self.is_leaf)
+            all_leaves = all_leaves[np.argsort(self.start[all_leaves])]
+            starts = self.start[all_leaves]
+            lower = np.minimum.reduceat(self.net_lower[self.order], starts)
+            upper = np.maximum.reduceat(self.net_upper[self.order], starts)
+            position = np.empty(len(self.is_leaf), dtype=np.int64)
+            position[all_leaves] = np.arange(0, len(all_leaves))
+            self.lower[leaves] = lower[position[leaves]]
+            self.upper[leaves] = upper[position[leaves]]
+            self.sample[leaves] = self.net_corners[self.order[self.start[leaves]], 0]
+
+        internal = nodes[~self.is_leaf[nodes]]
+        for depth in np.unique(self.depth[internal])[::-1]:
+            level = internal[self.depth[internal] == depth]
+            left, right = self.children[level].T
+            self.lower[level] = np.minimum(self.lower[left], self.lower[right])
+            self.upper[level] = np.maximum(self.upper[left], self.upper[right])
+            self.sample[level] = self.sample[left]
+
+    def refit(self, points, changed=None):
+        '''
+        Takes moved control points, (K, ...) like the ones built from, and
+        updates the boxes of the changed nets (indices, default all) and
+        every node above them
+        '''
+        points = np.asarray(points, dtype=np.float64)
+        if points.shape != self.points.shape:
+            raise Exception("Expected points of shape %s, got %s" % (self.points.shape, points.shape))
+        self.points = points
+        changed = np.arange(0, len(self)) if changed is None else np.unique(np.asarray(changed, dtype=np.int64))
+
+        lower, upper = net_boxes(points[changed])
+        self.net_lower[changed] = lower
+        self.net_upper[changed] = upper
+        self.net_corners[changed] = net_corners(points[changed], self.kind)
+        for _, _, filled in self._refined.values():
+            filled[changed] = False
+
+        dirty = set()
+        nodes = np.unique(self.leaf_of[changed])
+        while len(nodes):
+            dirty.update(nodes.tolist())
+            nodes = np.unique(self.parent[nodes])
+            nodes = nodes[nodes >= 0]
+        self._refit_nodes(np.array(sorted(dirty), dtype=np.int64))
+
+    def piece_boxes(self, nets, depth):
+        '''
+        (lower, upper), each (len(nets), pieces, 3), of the nets
+        subdivided depth times. Computed for the nets that haven't been yet,
+        and kept in dense (K, pieces, 3) arrays per depth.
+        '''
+        nets = np.asarray(nets, dtype=np.int64)
+        if depth not in self._refined:
+            pieces = (2 if self.kind == CURVE else 4) ** depth
+            self._refined[depth] = (np.empty((len(self), pieces, 3)), np.empty((len(self), pieces, 3)),
+                                    np.zeros(len(self), dtype=bool))
+        lower, upper, filled = self._refined[depth]
+
+        missing = np.unique(nets[~filled[nets]])
+        if len(missing):
+            pieces = self.points[missing][:, np.newaxis]
+            for _ in range(0, depth):
+                pieces = _subdivide(pieces.reshape((-1,) + pieces.shape[2:]), self.kind).reshape(
+                    (len(missing), -1) + pieces.shape[2:])
+            missing_lower, missing_upper = net_boxes(pieces.reshape((-1,) + pieces.shape[2:]))
+            lower[missing] = missing_lower.reshape(len(missing), -1, 3)
+            upper[missing] = missing_upper.reshape(len(missing), -1, 3)
+            filled[missing] = True
+        return (lower[nets], upper[nets])
+
+    def _traverse(self, num_queries, test):
+        # Breadth first over (query, node) pairs. test(queries, nodes) gives
+        # a keep mask; returns the (query, net) pairs of the leaves reached.
+        queries = np.arange(0, num_queries)
+        nodes = np.zeros(num_queries, dtype=np.int64)
+        found_queries = []
+        found_nets = []
+        while len(queries):
+            keep = test(queries, nodes)
+            queries = queries[keep]
+            nodes = nodes[keep]
+
+            # Every net of every leaf reached, in one go
+            leaf = self.is_leaf[nodes]
+            leaves = nodes[leaf]
+            found_queries.append(np.repeat(queries[leaf], self.count[leaves]))
+            found_nets.append(self.order[_ranges(self.start[leaves], self.count[leaves])])
+
+            queries = np.repeat(queries[~leaf], 2)
+            nodes = self.children[nodes[~leaf]].reshape(-1)
+
+        if not found_queries:
+            return (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64))
+        return (np.concatenate(found_queries), np.concatenate(found_nets))
+
+    def intersect_rays(self, origins, directions, t_max=np.inf, refine_depth=0):
+        '''
+        Candidate (ray, net) pairs of R rays, origins and directions (R, 3),
+        whose boxes the rays enter before t_max. Returns (rays, nets, t)
+        sorted by ray then by t, the ray parameter where the box (or the
+        nearest hit piece, when refined) is entered.
+        '''
+        origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+        directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+        t_max = np.broadcast_to(np.asarray(t_max, dtype=np.float64), origins.shape[:1])
+        with np.errstate(divide='ignore'):
+            inverse = 1 / directions
+
+        def test(rays, nodes):
+            hit, _ = _ray_boxes(origins[rays], inverse[rays], self.lower[nodes], self.upper[nodes], t_max[rays])
+            return hit
+        rays, nets = self._traverse(len(origins), test)
+
+        hit, t = _ray_boxes(origins[rays], inverse[rays], self.net_lower[nets], self.net_upper[nets], t_max[rays])
+        rays, nets, t = rays[hit], nets[hit], t[hit]
+
+        if refine_depth > 0 and len(rays):
+            lower, upper = self.piece_boxes(nets, refine_depth)
+            pieces = lower.shape[1]
+            hit, t_pieces = _ray_boxes(np.repeat(origins[rays], pieces, axis=0), np.repeat(inverse[rays], pieces, axis=0),
+                                       lower.reshape(-1, 3), upper.reshape(-1, 3), np.repeat(t_max[rays], pieces))
+            hit = hit.reshape(-1, pieces)
+            t_pieces = np.where(hit, t_pieces.reshape(-1, pieces), np.inf)
+            keep = hit.any(axis=1)
+            rays, nets, t = rays[keep], nets[keep], t_pieces[keep].min(axis=1)
+
+        by_ray = np.lexsort((t, rays))
+        return (rays[by_ray], nets[by_ray], t[by_ray])
+
+    def frustum(self, planes, refine_depth=0):
+        '''
+        Indices of nets that may be inside a convex region, given as (P, 4)
+        planes (n, d) with n.x + d >= 0 inside, a view frustum say
+        '''
+        planes = np.asarray(planes, dtype=np.float64).reshape(-1, 4)
+
+        def outside(lower, upper):
+            # A box is out if even its corner furthest along n is behind a plane
+            furthest = np.where(planes[:, np.newaxis, :3] >= 0, upper, lower)
+            return (np.einsum('pnd,pd->pn', furthest, planes[:, :3]) + planes[:, 3:] < 0).any(axis=0)
+
+        _, nets = self._traverse(1, lambda queries, nodes: ~outside(self.lower[nodes], self.upper[nodes]))
+        nets = nets[~outside(self.net_lower[nets], self.net_upper[nets])]
+
+        if refine_depth > 0 and len(nets):
+            lower, upper = self.piece_boxes(nets, refine_depth)
+            inside = ~outside(lower.reshape(-1, 3), upper.reshape(-1, 3))
+            nets = nets[inside.reshape(len(nets), -1).any(axis=1)]
+        return np.sort(nets)
+
+    def nearest(self, points):
+        '''
+        Nearest net to each of Q points, (Q, 3), as (nets, lower, upper):
+        the distance to the surface is at least lower and at most upper.
+        The upper bound comes from net corners, which lie on the surface,
+        so the returned net is the one with the nearest corner among those
+        that could hold the nearest surface point.
+        '''
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        best = np.full(len(points), np.inf)
+
+        def test(queries, nodes):
+            # Every node holds a surface point, sample, bounding from above
+            sample = np.linalg.norm(points[queries] - self.sample[nodes], axis=-1)
+            np.minimum.at(best, queries, sample)
+            return _box_distances(points[queries], self.lower[nodes], self.upper[nodes]) <= best[queries]
+        queries, nets = self._traverse(len(points), test)
+
+        lower = _box_distances(points[queries], self.net_lower[nets], self.net_upper[nets])
+        upper = np.linalg.norm(points[queries, np.newaxis] - self.net_corners[nets], axis=-1).min(axis=1)
+
+        result = np.full(len(points), -1, dtype=np.int64)
+        result_lower = np.full(len(points), np.inf)
+        result_upper = np.full(len(points), np.inf)
+        # Smallest upper bound per query wins
+        by_query = np.lexsort((upper, queries))
+        queries, nets, lower, upper = queries[by_query], nets[by_query], lower[by_query], upper[by_query]
+        first = np.flatnonzero(np.r_[True, queries[1:] != queries[:-1]]) if len(queries) else np.empty(0, dtype=np.int64)
+        result[queries[first]] = nets[first]
+        result_upper[queries[first]] = upper[first]
+        # The nearest point is on some surviving net, so at least their smallest lower bound
+        np.minimum.at(result_lower, queries, lower)
+        return (result, result_lower, result_upper)
@@ -0,0 +1,190 @@
+import os
+import glob
+import pickle
+import hashlib
+import inspect
+import sympy
+from sympy import cse, numbered_symbols, srepr
+
+'''
+Persistent cse() cache
+
+The big derivations (cubic triangular patch silhouettes, gradients wrt
+embedded curves) spend minutes building patches, differentiating and
+running cse(). The (common, exprs) pair that comes out is all print_code
+needs, so we store it on disk, content-addressed by a hash of:
+
+- the derivation name and its symbolic inputs
+- the source of the derive function, and of the whole module defining it,
+  as derive usually calls builders that live next to it
+- the sympy version and the ramjet sources
+
+Change any of those and the key changes with it. Stale entries are never
+read again, and get evicted oldest-first once the cache outgrows its budget,
+along with the shared objects ramjet.native keeps under native/.
+'''
+
+CACHE_DIR = os.environ.get(
+    'RAMJET_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'ramjet'))
+CACHE_MAX_BYTES = int(os.environ.get('RAMJET_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+
+_ramjet_version = None
+
+
+def ramjet_version():
+    '''
+    There's no version number to go by, so hash the package sources.
+    Any edit to ramjet invalidates everything derived with it.
+    '''
+    global _ramjet_version
+    if _ramjet_version is None:
+        h = hashlib.sha256()
+        package_dir = os.path.dirname(os.path.abspath(__file__))
+        for path in sorted(glob.glob(os.path.join(package_dir, '*.py'))):
+            with open(path, 'rb') as f:
+                h.update(os.path.basename(path).encode())
+                h.update(f.read())
+        _ramjet_version = h.hexdigest()
+    return _ramjet_version
+
+
+def derive_source(derive):
+    try:
+        return inspect.getsource(derive)
+    except (OSError, TypeError):
+        return repr(derive.__code__.co_code)
+
+
+def module_source(derive):
+    '''
+    Source of the module derive is defined in, empty when there's none to
+    read (the interpreter, a notebook)
+    '''
+    module = inspect.getmodule(derive)
+    try:
+        return inspect.getsource(module) if module is not None else ''
+    except (OSError, TypeError):
+        return ''
+
+
+def derivation_key(name, inputs, derive=None, prefix='a'):
+    h = hashlib.sha256()
+    for part in (name, srepr(inputs), prefix, sympy.__version__, ramjet_version()):
+        h.update(part.encode())
+        h.update(b'\0')
+    if derive is not None:
+        h.update(derive_source(derive).encode())
+        h.update(b'\0')
+        h.update(module_source(derive).encode())
+    return h.hexdigest()
+
+
+def cache_path(key, cache_dir=None):
+    return os.path.join(cache_dir or CACHE_DIR, key + '.pickle')
+
+
+def load_cached(key, cache_dir=None):
+    path = cache_path(key, cache_dir)
+    try:
+        with open(path, 'rb') as f:
+            result = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError, ValueError, TypeError):
+        # Truncated write or an entry from an incompatible sympy, drop it,
+        # unless another process got there first
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        return None
+
+    # Mark as recently used, for eviction; it may have been evicted meanwhile
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return result
+
+
+def store_cached(key, result, cache_dir=None, max_bytes=None):
+    cache_dir = cache_dir or CACHE_DIR
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # write to a temp file and swap it in, so readers never see half an entry
+    path = cache_path(key, cache_dir)
+    tmp_path = '%s.%i.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+    evict(cache_dir, max_bytes)
+
+
+def _entries(cache_dir):
+    # (last used, size, paths) of cse entries and of native builds, whose
+    # C source goes with the shared object
+    entries = []
+    native = [(path, [path[:path.rindex('.')] + '.c'])
+              for pattern in ('*.so', '*.dylib')
+              for path in glob.glob(os.path.join(cache_dir, 'native', pattern))]
+    pickles = [(path, []) for path in glob.glob(os.path.join(cache_dir, '*.pickle'))]
+    for path, extras in pickles + native:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        size = stat.st_size
+        for extra in extras:
+            try:
+                size += os.stat(extra).st_size
+            except FileNotFoundError:
+                pass
+        entries.append((stat.st_mtime, size, [path] + extras))
+    return entries
+
+
+def evict(cache_dir=None, max_bytes=None):
+    '''
+    Remove least recently used entries until the cache fits in max_bytes
+    '''
+    cache_dir = cache_dir or CACHE_DIR
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+
+    entries = _entries(cache_dir)
+    total = sum(size for _, size, _ in entries)
+    for _, size, paths in sorted(entries):
+        if total <= max_bytes:
+            break
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        total -= size
+
+
+def clear_cache(cache_dir=None):
+    evict(cache_dir, 0)
+
+
+def cached_cse(name, inputs, derive, prefix='a', cache_dir=None, max_bytes=None):
+    '''
+    Returns cse(derive(), numbered_symbols(prefix)), from disk if we've seen
+    this derivation before. Inputs should hold every symbolic ingredient of
+    the derivation (points, parameters, degrees, bases) so that the key
+    tracks them.
+
+    Set RAMJET_CACHE_DIR / RAMJET_CACHE_MAX_BYTES to relocate or resize
+    the cache, or pass cache_dir and max_bytes explicitly.
+    '''
+    key = derivation_key(name, inputs, derive, prefix)
+
+    result = load_cached(key, cache_dir)
+    if result is not None:
+        return result
+
+    result = cse(derive(), numbered_symbols(prefix))
+    store_cached(key, result, cache_dir, max_bytes)
+    return result
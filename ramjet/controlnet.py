@@ -0,0 +1,288 @@
+import math
+from functools import lru_cache
+import numpy as np
+from sympy import Matrix, Symbol, Add
+
+'''
+Control nets
+
+Derivations pass patches around as lists of lists of 3x1 Matrix, one
+Matrix per control point, and every builder and derivative helper walks
+them with nested loops. ControlNet keeps a whole net in one flat buffer
+instead, with its kind, shape and dimension alongside:
+
+- curve:    shape (degree+1,)
+- patch:    shape (degree_v+1, degree_u+1), indexed [v][u] like the lists
+- triangle: shape (M,), points in triangular_indices order
+
+Numeric nets hold a read-only float64 view of the caller's array, shape +
+(dimensions,), with no copy made, and hand it back through .array or
+np.asarray(net). Symbolic nets hold a flat tuple of coordinates, row-major
+with the coordinate axis last. Either way a net is treated as never
+changing once made, which is what lets derivative memoize on it: the view
+can't be written through, and callers must not write to the array they
+made a numeric net from either. Symbolic nets made by symbolic_net are interned: asking for the same
+name and shape twice gives the same object, symbols, derivatives and all.
+
+The ramjet.math builders take a ControlNet wherever they take points, and
+indexing it like the old lists (net[v][u], net[i]) still gives Matrix
+points for code that hasn't moved over.
+'''
+
+CURVE = 'curve'
+PATCH = 'patch'
+TRIANGLE = 'triangle'
+
+
+class ControlNet:
+    __slots__ = ('kind', 'shape', 'dimensions', 'data', '_derivatives')
+
+    def __init__(self, kind, shape, dimensions, data):
+        if kind not in (CURVE, PATCH, TRIANGLE):
+            raise Exception("Unknown control net kind %s" % kind)
+        self.kind = kind
+        self.shape = tuple(shape)
+        self.dimensions = dimensions
+        self.data = data
+        self._derivatives = {}  # order -> derivative net, see derivative
+
+    @property
+    def is_symbolic(self):
+        return not isinstance(self.data, np.ndarray)
+
+    @property
+    def num_points(self):
+        return math.prod(self.shape)
+
+    @property
+    def degree(self):
+        '''
+        n for curves and triangles, (degree_u, degree_v) for patches
+        '''
+        if self.kind == CURVE:
+            return self.shape[0] - 1
+        if self.kind == PATCH:
+            return (self.shape[1] - 1, self.shape[0] - 1)
+        return int(round((math.sqrt(8 * self.shape[0] + 1) - 3) / 2))
+
+    @property
+    def array(self):
+        '''
+        Numeric nets: the float64 buffer itself, shape + (dimensions,),
+        read-only
+        '''
+        if self.is_symbolic:
+            raise Exception("Symbolic control nets have no numeric buffer")
+        return self.data
+
+    def __array__(self, dtype=None, copy=None):
+        if copy or (dtype is not None and np.dtype(dtype) != self.array.dtype):
+            return self.array.astype(dtype or self.array.dtype)
+        return self.array
+
+    def coordinates(self, flat_index):
+        '''
+        Tuple of coordinates of one point, by flat (row-major) index
+        '''
+        start = flat_index * self.dimensions
+        if self.is_symbolic:
+            return self.data[start:start + self.dimensions]
+        return tuple(self.data.reshape(-1, self.dimensions)[flat_index])
+
+    def point(self, *index):
+        if len(index) == 1:
+            flat_index = index[0]
+        else:
+            flat_index = index[0] * self.shape[1] + index[1]
+        return Matrix(self.coordinates(flat_index))
+
+    def points(self):
+        '''
+        The old layout: a list of Matrix, or a list of rows of them for patches
+        '''
+        if self.kind == PATCH:
+            return [[self.point(v, u) for u in range(0, self.shape[1])] for v in range(0, self.shape[0])]
+        return [self.point(i) for i in range(0, self.shape[0])]
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, index):
+        if isinstance(index, tuple):
+            return self.point(*index)
+        if self.kind == PATCH:
+            return [self.point(index, u) for u in range(0, self.shape[1])]
+        return self.point(index)
+
+    def __iter__(self):
+        for i in range(0, len(self)):
+            yield self[i]
+
+    def __repr__(self):
+        return 'ControlNet(%s, shape=%s, dimensions=%i, %s)' % (
+            self.kind, self.shape, self.dimensions, 'symbolic' if self.is_symbolic else 'numeric')
+
+    @property
+    def num_axes(self):
+        # Parametric directions: t, (u, v), or barycentric (u, v, w)
+        return {CURVE: 1, PATCH: 2, TRIANGLE: 3}[self.kind]
+
+    def derivative(self, order):
+        '''
+        Derivative net of any order, memoized on this net so every order is
+        differenced once. Nets don't change, so neither do their
+        derivatives, and interned symbolic nets share theirs with everyone
+        asking. order is n for curves, (order_u, order_v) for
+        patches and (order_u, order_v, order_w) for triangles, the latter
+        being partials along barycentric coordinates like triangle_derivative.
+        Orders past the degree give an empty net, which evaluates to zero.
+        '''
+        order = (order,) if isinstance(order, int) else tuple(order)
+        if len(order) != self.num_axes:
+            raise Exception("A %s takes derivative orders of length %i, got %s" % (
+                self.kind, self.num_axes, order))
+        if not any(order):
+            return self
+
+        if order not in self._derivatives:
+            # Peel one order off the first axis that has some, so mixed
+            # partials share their lower orders with the pure ones
+            axis = [i for i, o in enumerate(order) if o > 0][0]
+            lower = list(order)
+            lower[axis] -= 1
+            self._derivatives[order] = self.derivative(tuple(lower)).differentiate(axis)
+        return self._derivatives[order]
+
+    def differentiate(self, axis=0):
+        '''
+        Hodograph net along a parametric axis: 0 along a curve or along u
+        of a patch, 1 along v of a patch, 0, 1, 2 for u, v, w of a triangle.
+        Not memoized, use derivative for that.
+        '''
+        if self.kind == TRIANGLE:
+            return self._differentiate_triangle(axis)
+
+        # Axis of the buffer that runs along the parameter
+        grid_axis = 0 if self.kind == CURVE else 1 - axis
+        degree = self.shape[grid_axis] - 1
+        shape = list(self.shape)
+        shape[grid_axis] = max(0, shape[grid_axis] - 1)
+
+        if not self.is_symbolic:
+            data = _read_only(degree * np.diff(self.data, axis=grid_axis))
+            return ControlNet(self.kind, shape, self.dimensions, data)
+
+        # Flat offset between neighbours along the axis, in coordinates
+        stride = self.dimensions * (self.shape[1] if self.kind == PATCH and grid_axis == 0 else 1)
+        data = []
+        for flat in _flat_indices(shape):
+            index = _source_index(flat, shape, self.shape)
+            start = index * self.dimensions
+            for d in range(0, self.dimensions):
+                data.append(degree * (self.data[start + stride + d] - self.data[start + d]))
+        return ControlNet(self.kind, shape, self.dimensions, tuple(data))
+
+    def _differentiate_triangle(self, axis):
+        # n * p_(ijk + e_axis) over all ijk of degree n-1
+        from ramjet.triangles import shifted_point_indices
+
+        degree = self.degree
+        if degree == 0:
+            data = _read_only(np.zeros((0, self.dimensions))) if not self.is_symbolic else ()
+            return ControlNet(TRIANGLE, (0,), self.dimensions, data)
+
+        shifted = shifted_point_indices(degree, axis)
+        if not self.is_symbolic:
+            return ControlNet(TRIANGLE, (len(shifted),), self.dimensions, _read_only(degree * self.data[shifted]))
+
+        data = []
+        for index in shifted:
+            data.extend(degree * c for c in self.coordinates(int(index)))
+        return ControlNet(TRIANGLE, (len(shifted),), self.dimensions, tuple(data))
+
+
+def _read_only(array):
+    array.flags.writeable = False
+    return array
+
+
+def _flat_indices(shape):
+    return range(0, math.prod(shape))
+
+
+def _source_index(flat, shape, source_shape):
+    # Same (row, col) in a grid with more rows or columns
+    if len(shape) == 1:
+        return flat
+    row, col = divmod(flat, shape[1])
+    return row * source_shape[1] + col
+
+
+def point_names(name, kind, shape):
+    '''
+    Point names the way the derivations number them: p1, p2, ... row by
+    row for curves and patches, p002, p011, ... for triangles
+    '''
+    if kind == TRIANGLE:
+        # ramjet.math imports this module, so not at the top
+        from ramjet.math import triangular_indices
+        degree = int(round((math.sqrt(8 * shape[0] + 1) - 3) / 2))
+        return ['%s%i%i%i' % ((name,) + ijk) for ijk in triangular_indices(degree)]
+    return ['%s%i' % (name, i) for i in range(1, math.prod(shape) + 1)]
+
+
+@lru_cache(maxsize=None)
+def symbolic_net(name, kind, shape, basis=('x', 'y', 'z')):
+    '''
+    Interned symbolic net with coordinates named like symbolic_vector:
+    symbolic_net('p', PATCH, (3, 3)) holds p1_x, p1_y, ... p9_z
+    '''
+    shape = tuple(shape)
+    data = tuple(Symbol('%s_%s' % (point, b)) for point in point_names(name, kind, shape) for b in basis)
+    return ControlNet(kind, shape, len(basis), data)
+
+
+def numeric_net(array, kind=None):
+    '''
+    Net over a read-only view of an array of control points, without
+    copying float64 arrays. The net shares its memory, so don't write to
+    the array afterwards: memoized derivatives would go stale. Kind
+    defaults to a curve for (n+1, dim) and a patch for (rows, cols, dim).
+    '''
+    array = _read_only(np.asarray(array, dtype=np.float64).view())
+    if kind is None:
+        kind = CURVE if array.ndim == 2 else PATCH
+    return ControlNet(kind, array.shape[:-1], array.shape[-1], array)
+
+
+def as_net(points, kind=None):
+    '''
+    ControlNet from the old layout, a list of Matrix points or a list of
+    rows of them. ControlNets pass through as they are.
+    '''
+    if isinstance(points, ControlNet):
+        return points
+
+    if isinstance(points[0], (list, tuple)):
+        kind = PATCH if kind is None else kind
+        shape = (len(points), len(points[0]))
+        rows = points
+    else:
+        kind = CURVE if kind is None else kind
+        shape = (len(points),)
+        rows = [points]
+
+    data = tuple(c for row in rows for p in row for c in p)
+    return ControlNet(kind, shape, len(data) // math.prod(shape), data)
+
+
+def combine(net, weights):
+    '''
+    Coordinates of sum(weights[k] * point k) over the flat point order,
+    summed with one Add per coordinate rather than one Matrix per term
+    '''
+    dims = net.dimensions
+    data = net.data
+    if not net.is_symbolic:
+        data = data.reshape(-1).tolist()
+    return [Add(*[w * data[k * dims + d] for k, w in enumerate(weights)]) for d in range(0, dims)]
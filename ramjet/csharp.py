@@ -0,0 +1,256 @@
+import re
+from sympy import MatrixBase
+from sympy.printing.c import C99CodePrinter
+from sympy.printing.precedence import precedence
+
+'''
+C# code printer
+
+Prints sympy expressions as C# for Unity.Mathematics in one pass over the
+expression tree: floats get an f suffix, math functions go through math.*,
+and control point coordinates are printed as array accesses.
+
+Control point symbols are named <name><index>_<x|y|z|w> by symbolic_vector.
+Which of them map to arrays, and how, is up to the point_indexing setting:
+a list of functions taking a symbol name and returning its C# access, or
+None to leave it to the next one. By default they come from the points
+setting, a layout like ramjet.kernels uses, and only the point names it
+lists are indexed:
+
+- triangular nets, p101_x -> p[3].x, in triangular_indices order
+- numbered nets,   p1_x -> p[0].x
+
+Any other symbol, uv1_x say, is printed as it is. Without either setting
+nothing is indexed.
+'''
+
+
+def quad_point_indexing(name='p', array=None, offset=-1, points=None):
+    '''
+    <name><n>_<c> or <name>_<n>_<c> -> <array>[n + offset].c, 1-based
+    names by default. With points, only those point names are indexed.
+    '''
+    array = name if array is None else array
+    pattern = re.compile(r'^(%s_?(\d+))_([xyzw])$' % re.escape(name))
+
+    def index(symbol_name):
+        match = pattern.match(symbol_name)
+        if match is None or (points is not None and match.group(1) not in points):
+            return None
+        return '%s[%i].%s' % (array, int(match.group(2)) + offset, match.group(3))
+    return index
+
+
+def triangle_point_indexing(name='p', array=None, points=None):
+    '''
+    <name><i><j><k>_<c> -> <array>[n].c, with n the position of ijk in
+    triangular_indices(i+j+k): 002, 011, 020, 101, 110, 200 for quadratics.
+    With points, only those point names are indexed.
+    '''
+    array = name if array is None else array
+    pattern = re.compile(r'^(%s(\d)(\d)(\d))_([xyzw])$' % re.escape(name))
+
+    def index(symbol_name):
+        match = pattern.match(symbol_name)
+        if match is None or (points is not None and match.group(1) not in points):
+            return None
+        i, j, k = (int(d) for d in match.groups()[1:4])
+        degree = i + j + k
+        # Rows of constant i hold degree - i + 1 points each
+        n = i * (degree + 1) - i * (i - 1) // 2 + j
+        return '%s[%i].%s' % (array, n, match.group(5))
+    return index
+
+
+def _is_triangular(name, point_names):
+    # Every point <name><i><j><k> with one degree i+j+k between them
+    pattern = re.compile(r'^%s(\d)(\d)(\d)$' % re.escape(name))
+    degrees = set()
+    for point_name in point_names:
+        match = pattern.match(point_name)
+        if match is None:
+            return False
+        degrees.add(sum(int(d) for d in match.groups()))
+    return len(degrees) == 1
+
+
+def layout_point_indexing(layout):
+    '''
+    Indexing for the point lists of a layout, see ramjet.kernels: each
+    entry with a list of point names becomes an array named after its
+    argument, triangular if all its points are <arg><i><j><k> of one
+    degree and numbered otherwise. Single points and scalars stay as they
+    are.
+    '''
+    point_indexing = []
+    for arg, point_names, basis in layout:
+        if basis is None or isinstance(point_names, str):
+            continue
+        points = frozenset(point_names)
+        if _is_triangular(arg, point_names):
+            point_indexing.append(triangle_point_indexing(arg, points=points))
+        else:
+            point_indexing.append(quad_point_indexing(arg, points=points))
+    return point_indexing
+
+
+class CSharpCodePrinter(C99CodePrinter):
+    printmethod = '_csharpcode'
+    language = 'C#'
+
+    _default_settings = dict(
+        C99CodePrinter._default_settings,
+        point_indexing=None,
+        points=None,  # layout whose point lists are indexed, see above
+        float_precision=9,  # enough to round trip a float32
+        max_pow_expansion=0,  # print x**n as x*x*...*x up to this n
+    )
+
+    _math_functions = {
+        'Abs': 'abs',
+        'acos': 'acos',
+        'asin': 'asin',
+        'atan': 'atan',
+        'atan2': 'atan2',
+        'ceiling': 'ceil',
+        'cos': 'cos',
+        'cosh': 'cosh',
+        'exp': 'exp',
+        'exp2': 'exp2',
+        'floor': 'floor',
+        'log': 'log',
+        'log10': 'log10',
+        'log2': 'log2',
+        'sign': 'sign',
+        'sin': 'sin',
+        'sinh': 'sinh',
+        'sqrt': 'sqrt',
+        'tan': 'tan',
+        'tanh': 'tanh',
+    }
+
+    def __init__(self, settings={}):
+        super().__init__(settings)
+        self.known_functions = {k: 'math.' + v for k, v in self._math_functions.items()}
+        self.known_functions.update(settings.get('user_functions', {}))
+
+        point_indexing = self._settings['point_indexing']
+        if point_indexing is None:
+            point_indexing = layout_point_indexing(self._settings['points'] or [])
+        self._point_indexing = point_indexing
+
+    @property
+    def max_pow_expansion(self):
+        '''
+        Highest integer power of an atom printed as a product
+        '''
+        return self._settings['max_pow_expansion']
+
+    def _print_Symbol(self, expr):
+        for index in self._point_indexing:
+            access = index(expr.name)
+            if access is not None:
+                return access
+        return super()._print_Symbol(expr)
+
+    def _print_Float(self, expr):
+        num = str(expr.evalf(self._settings['float_precision']))
+        if 'e' not in num and '.' not in num:
+            num += '.0'
+        parts = num.split('e')
+        parts[0] = parts[0].rstrip('0')
+        if parts[0].endswith('.'):
+            parts[0] += '0'
+        return 'e'.join(parts) + 'f'
+
+    def _print_Rational(self, expr):
+        return '%i.0f/%i.0f' % (expr.p, expr.q)
+
+    def _print_Integer(self, expr):
+        return str(expr.p)
+
+    def _print_Pow(self, expr):
+        PREC = precedence(expr)
+        # Float and Rational exponents alike
+        exp = float(expr.exp) if expr.exp.is_Number else None
+        if exp == -1:
+            return '1.0f/%s' % self.parenthesize(expr.base, PREC)
+        elif exp == 0.5:
+            return 'math.sqrt(%s)' % self._print(expr.base)
+        elif exp == -0.5:
+            return '1.0f/math.sqrt(%s)' % self._print(expr.base)
+        elif expr.exp.is_Integer and expr.base.is_Atom and 2 <= abs(exp) <= self._settings['max_pow_expansion']:
+            # Parenthesized, as a denominator x/(x*x) would otherwise read x/x*x
+            product = '(%s)' % '*'.join([self._print(expr.base)] * int(abs(exp)))
+            return product if exp > 0 else '1.0f/%s' % product
+        return 'math.pow(%s, %s)' % (self._print(expr.base), self._print(expr.exp))
+
+    def _print_Max(self, expr):
+        if len(expr.args) == 1:
+            return self._print(expr.args[0])
+        return 'math.max(%s, %s)' % (self._print(expr.args[0]), self._print(expr.func(*expr.args[1:])))
+
+    def _print_Min(self, expr):
+        if len(expr.args) == 1:
+            return self._print(expr.args[0])
+        return 'math.min(%s, %s)' % (self._print(expr.args[0]), self._print(expr.func(*expr.args[1:])))
+
+    def _print_Pi(self, expr):
+        return 'math.PI'
+
+    def _print_Exp1(self, expr):
+        return 'math.E'
+
+    def _print_Infinity(self, expr):
+        return 'float.PositiveInfinity'
+
+    def _print_NegativeInfinity(self, expr):
+        return 'float.NegativeInfinity'
+
+    def _print_NaN(self, expr):
+        return 'float.NaN'
+
+    def declaration_type(self, expr):
+        '''
+        C# type declaration() uses for expr: floatN for column vectors of 2
+        to 4 entries, floatRxC for 2 to 4 matrices, float otherwise. Bigger
+        matrices are declared as one float per entry.
+        '''
+        if not isinstance(expr, MatrixBase):
+            return 'float'
+        rows, cols = expr.shape
+        if cols == 1 and 2 <= rows <= 4:
+            return 'float%i' % rows
+        if 2 <= rows <= 4 and 2 <= cols <= 4:
+            return 'float%ix%i' % (rows, cols)
+        return 'float'
+
+    def declaration(self, name, expr):
+        '''
+        C# declaration of name holding expr, using Unity.Mathematics'
+        row-major constructors for vectors and matrices. Matrices without a
+        matching type fall back to one float per entry, name_row_col.
+        '''
+        name = self._print(name) if not isinstance(name, str) else name
+        type_name = self.declaration_type(expr)
+
+        if not isinstance(expr, MatrixBase):
+            return '%s %s = %s;' % (type_name, name, self._print(expr))
+
+        if type_name != 'float':
+            entries = ', '.join(self._print(e) for e in expr)
+            return '%s %s = new %s(%s);' % (type_name, name, type_name, entries)
+
+        rows, cols = expr.shape
+        lines = []
+        for r in range(0, rows):
+            for c in range(0, cols):
+                lines.append('float %s_%i_%i = %s;' % (name, r, c, self._print(expr[r, c])))
+        return '\n'.join(lines)
+
+
+def csharp_code(expr, **settings):
+    '''
+    C# for a single expression
+    '''
+    return CSharpCodePrinter(settings).doprint(expr)
@@ -0,0 +1,139 @@
+import numpy as np
+from ramjet.curves import bernstein_matrix, differentiate_curve_points_np
+from ramjet.roots import bernstein_product, reduce_bernstein, bernstein_roots
+
+'''
+Curvature extrema of Bezier curves, batched
+
+curvature_maxima_cubic_2d and curvature_maxima_3d try to solve dk/dt = 0
+in closed form, and for cubics that's a degree 7 polynomial.
+Numerically it's a root finding problem like any other: with d1, d2, d3
+the derivatives and C = d1 x d2 (a scalar for 2d curves), curvature is
+k = |C| / |d1|^3, and
+
+d(k^2)/dt = 2 |d1|^4 N / |d1|^12,  N = (C.C') (d1.d1) - 3 (C.C) (d1.d2)
+
+where C' = d1 x d3 as d2 x d2 vanishes. N is a polynomial, built here
+in Bernstein form straight from the derivative nets (products of Bernstein
+polynomials are Bernstein polynomials), degree 6n - 11 for a degree n
+curve. Its roots in [0,1] are where |k| is stationary, found for the whole
+batch at once by ramjet.roots.bernstein_roots.
+
+Each root is classified by the sign of N on either side, halfway to the
+neighbouring roots (or the ends): + to - is a maximum of |k|, - to + a
+minimum. Zero curvature points (inflections of 2d curves) come out as
+minima, and cusps, where d1 vanishes and k blows up, as maxima.
+
+Work per curve is bounded: N has a fixed degree, bernstein_roots runs at
+most max_rounds clipping rounds, and results are fixed width.
+'''
+
+MAXIMUM = 1
+MINIMUM = -1
+STATIONARY = 0
+
+
+def _curve_points(points):
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 3 or points.shape[2] not in (2, 3):
+        raise Exception("Expected points of shape (N, degree+1, 2 or 3), got %s" % (points.shape,))
+    return points
+
+
+def _dot(a, b):
+    # Bernstein vectors (N, m+1, dim) and (N, n+1, dim) to scalars (N, m+n+1)
+    return sum(bernstein_product(a[..., d], b[..., d]) for d in range(0, a.shape[-1]))
+
+
+def _cross(a, b):
+    # Bernstein vectors to (N, m+n+1, 1) for 2d, (N, m+n+1, 3) for 3d
+    x = lambda i, j: bernstein_product(a[..., i], b[..., j]) - bernstein_product(a[..., j], b[..., i])
+    if a.shape[-1] == 2:
+        return x(0, 1)[..., np.newaxis]
+    return np.stack([x(1, 2), x(2, 0), x(0, 1)], axis=-1)
+
+
+def _reduce(vectors, degree):
+    # reduce_bernstein along the control point axis of (N, m+1, dim)
+    return np.moveaxis(reduce_bernstein(np.moveaxis(vectors, -2, -1), degree), -1, -2)
+
+
+def curvature_numerator(points):
+    '''
+    Bernstein coefficients (N, 6 degree - 10) of N, the polynomial numerator
+    of d(k^2)/dt, for N curves (N, degree+1, 2 or 3) of degree 2 or more
+    '''
+    points = _curve_points(points)
+    degree = points.shape[1] - 1
+    if degree < 2:
+        raise Exception("Curves of degree %i have no curvature to speak of" % degree)
+
+    # Leading terms of d1 and d2 are parallel, so C is of degree 2n - 4
+    # rather than 2n - 3, and C' = d1 x d3 of degree 2n - 5: reducing both
+    # keeps N at its true degree 6n - 11
+    pd = differentiate_curve_points_np(points, 1)
+    pdd = differentiate_curve_points_np(points, 2)
+    c = _reduce(_cross(pd, pdd), 2*degree - 4)
+    numerator = -3 * bernstein_product(_dot(c, c), _dot(pd, pdd))
+
+    # Quadratics have no third derivative, so no C' either
+    if degree > 2:
+        c_d = _reduce(_cross(pd, differentiate_curve_points_np(points, 3)), 2*degree - 5)
+        numerator += bernstein_product(_dot(c, c_d), _dot(pd, pd))
+    return numerator
+
+
+def curvatures(points, t):
+    '''
+    Unsigned curvature of N curves at parameters (T,) shared or (N, T)
+    per curve, as (N, T); inf at cusps
+    '''
+    points = _curve_points(points)
+    t = np.asarray(t, dtype=np.float64)
+    degree = points.shape[1] - 1
+    pd = bernstein_matrix(degree-1, t) @ differentiate_curve_points_np(points, 1)
+    pdd = bernstein_matrix(max(degree-2, 0), t) @ differentiate_curve_points_np(points, 2)
+
+    if points.shape[-1] == 2:
+        cross = np.abs(pd[..., 0] * pdd[..., 1] - pd[..., 1] * pdd[..., 0])
+    else:
+        cross = np.linalg.norm(np.cross(pd, pdd), axis=-1)
+    speed = np.linalg.norm(pd, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(speed > 0, cross / speed**3, np.inf)
+
+
+def curvature_extrema(points, tolerance=1e-10, max_rounds=200):
+    '''
+    Local extrema of |curvature| in (0,1) for N curves (N, degree+1, 2 or
+    3), degree 2 or more. Returns (roots, counts, kinds) like
+    bernstein_roots: roots (N, 6 degree - 11) ascending and padded with NaN,
+    counts (N,), -1 for straight curves, whose curvature is constant, and
+    kinds (N, 6 degree - 11) holding MAXIMUM, MINIMUM, or STATIONARY where
+    |curvature| only levels off.
+    '''
+    numerator = curvature_numerator(points)
+    roots, counts = bernstein_roots(numerator, tolerance, max_rounds)
+
+    # Sign of N halfway to the neighbouring roots, or to the ends
+    found = ~np.isnan(roots)
+    before = np.concatenate([np.zeros((len(roots), 1)), roots[:, :-1]], axis=1)
+    after = np.concatenate([roots[:, 1:], np.ones((len(roots), 1))], axis=1)
+    after = np.where(np.isnan(after), 1.0, after)
+    samples = np.stack([(before + roots) / 2, (roots + after) / 2], axis=-1)
+    samples = np.where(found[..., np.newaxis], samples, 0.5)
+
+    bases = bernstein_matrix(numerator.shape[1] - 1, samples)
+    signs = np.sign(np.einsum('nrsb,nb->nrs', bases, numerator))
+    kinds = np.where(signs[..., 0] > signs[..., 1], MAXIMUM,
+                     np.where(signs[..., 0] < signs[..., 1], MINIMUM, STATIONARY))
+    kinds = np.where(found, kinds, STATIONARY)
+
+    # Extrema at the very ends aren't local ones
+    interior = found & (roots > tolerance) & (roots < 1 - tolerance)
+    order = np.argsort(~interior, axis=1, kind='stable')
+    roots = np.where(interior, roots, np.nan)
+    roots = np.take_along_axis(roots, order, axis=1)
+    kinds = np.take_along_axis(kinds, order, axis=1)
+    counts = np.where(counts < 0, counts, interior.sum(axis=1))
+    return (roots, counts, kinds)
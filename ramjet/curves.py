@@ -0,0 +1,94 @@
+import math
+import numpy as np
+
+'''
+Numeric Bezier curves
+
+Counterpart to make_bezier / differentiate_curve_points in ramjet.math, for
+evaluating the same curves in bulk. Control points are laid out as
+(N, degree+1, dim) arrays: N curves, their control points, and the spatial
+basis (x, y, z, w). Everything is vectorized over curves and parameters.
+'''
+
+
+def bernstein_matrix(n, t):
+    '''
+    Samples all degree n Bernstein bases at the given parameters.
+
+    Returns an array of shape t.shape + (n+1,)
+    '''
+    t = np.asarray(t, dtype=np.float64)
+
+    # t^i and (1-t)^i by repeated products, much cheaper than float powers
+    s = 1 - t
+    powers_t = [np.ones_like(t)]
+    powers_s = [np.ones_like(t)]
+    for i in range(1, n+1):
+        powers_t.append(powers_t[-1] * t)
+        powers_s.append(powers_s[-1] * s)
+
+    bases = [math.comb(n, i) * powers_t[i] * powers_s[n-i] for i in range(0, n+1)]
+    return np.stack(bases, axis=-1)
+
+
+def differentiate_curve_points_np(points, order=1):
+    '''
+    Hodograph control points, like differentiate_curve_points, applied
+    order times: degree * (p[i+1] - p[i]) along the control point axis.
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    degree = points.shape[-2] - 1
+    if order > degree:
+        shape = points.shape[:-2] + (1, points.shape[-1])
+        return np.zeros(shape)
+
+    scale = math.perm(degree, order)  # n * (n-1) * ... * (n-order+1)
+    return scale * np.diff(points, n=order, axis=-2)
+
+
+def evaluate_curves(points, t, order=0, out=None):
+    '''
+    Evaluates N curves of arbitrary degree and dimension, together with
+    their derivatives up to the requested order.
+
+    points: (N, degree+1, dim)
+    t: (T,) parameters shared by all curves, or (N, T) per curve
+    out: optional (order+1, N, T, dim) buffer to write into
+
+    Returns (order+1, N, T, dim): out[0] holds positions, out[k] the k-th
+    derivative with respect to t.
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    t = np.asarray(t, dtype=np.float64)
+
+    if points.ndim != 3:
+        raise Exception("Expected points of shape (N, degree+1, dim), got %s" % (points.shape,))
+    if t.ndim not in (1, 2):
+        raise Exception("Expected parameters of shape (T,) or (N, T), got %s" % (t.shape,))
+
+    num_curves, num_points, dimensions = points.shape
+    degree = num_points - 1
+    num_params = t.shape[-1]
+
+    shape = (order+1, num_curves, num_params, dimensions)
+    if out is None:
+        out = np.empty(shape)
+    elif out.shape != shape:
+        raise Exception("Output buffer has shape %s, expected %s" % (out.shape, shape))
+
+    # Curve index only shows up in the bases if each curve has its own parameters
+    subscripts = 'tb,nbd->ntd' if t.ndim == 1 else 'ntb,nbd->ntd'
+
+    points_d = points
+    for k in range(0, order+1):
+        if k > degree:
+            out[k] = 0.0
+            continue
+
+        if k > 0:
+            points_d = differentiate_curve_points_np(points_d)
+
+        bases = bernstein_matrix(degree - k, t)
+        np.einsum(subscripts, bases, points_d, out=out[k])
+
+    return out
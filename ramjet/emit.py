@@ -0,0 +1,178 @@
+import json
+from contextlib import contextmanager
+from ramjet.csharp import CSharpCodePrinter
+
+'''
+Streaming C# emission
+
+The big derivations (quartic rational triangular patches, curves on
+patches) come out of cse() with thousands of terms. emit_code writes them
+to a file or file-like object one declaration at a time, so the generated
+source never exists as one string, and doesn't need capturing from stdout.
+
+Each kernel starts with a header comment holding JSON: what the inputs
+are and how the code indexes them, the outputs and their types, and the
+flop counts. read_header gets it back without reading the rest of the
+file, so tooling can consume a kernel without loading it.
+
+    /* ramjet-kernel
+    {"name": "...", "inputs": {"p[0]": ["p1_x", "p1_y", "p1_z"]}, ...}
+    */
+'''
+
+HEADER_START = '/* ramjet-kernel'
+HEADER_END = '*/'
+
+# [name, kernels emitted so far] for each kernel_name block, innermost last
+_kernel_names = []
+
+
+@contextmanager
+def _opened(target, mode):
+    # Paths get opened and closed here, file objects are left to the caller
+    if isinstance(target, str):
+        with open(target, mode) as f:
+            yield f
+    else:
+        yield target
+
+
+@contextmanager
+def kernel_name(name):
+    '''
+    Default name for the kernels emitted inside the block: name for the
+    first, then name_2, name_3, ... run_derivations names each
+    derivation's kernels after it this way.
+    '''
+    _kernel_names.append([name, 0])
+    try:
+        yield
+    finally:
+        _kernel_names.pop()
+
+
+def _default_name():
+    if not _kernel_names:
+        return None
+    entry = _kernel_names[-1]
+    entry[1] += 1
+    return entry[0] if entry[1] == 1 else '%s_%i' % tuple(entry)
+
+
+def symbol_layout(common, exprs, printer):
+    '''
+    Input symbols grouped by the array element they're printed as:
+    ({'p[0]': ['p1_x', 'p1_y', 'p1_z']}, ['u', 'v']) with everything
+    that isn't a control point coordinate as a scalar.
+    '''
+    from ramjet.kernels import free_input_symbols
+
+    arrays = {}
+    scalars = []
+    for symbol in sorted(free_input_symbols(common, exprs), key=lambda s: s.name):
+        access = printer.doprint(symbol)
+        if access == symbol.name or '.' not in access:
+            scalars.append(symbol.name)
+        else:
+            element = access.rsplit('.', 1)[0]
+            arrays.setdefault(element, []).append(symbol.name)
+
+    # p[2] before p[10]
+    def natural(element):
+        name, _, index = element.partition('[')
+        return (name, int(index.rstrip(']')) if index.rstrip(']').isdigit() else index)
+    arrays = dict((k, arrays[k]) for k in sorted(arrays, key=natural))
+    return (arrays, scalars)
+
+
+def write_header(out, common, exprs, printer, name=None, flops=None, flops_optimized=None):
+    arrays, scalars = symbol_layout(common, exprs, printer)
+    header = {
+        'name': name,
+        'terms': len(common),
+        'inputs': arrays,
+        'scalars': scalars,
+        'outputs': [{'name': 'output_%d' % i, 'type': printer.declaration_type(expr)}
+                    for i, expr in enumerate(exprs)],
+    }
+    if flops is not None:
+        header['flops'] = flops
+    if flops_optimized is not None:
+        header['flops_optimized'] = flops_optimized
+
+    # One key per line, readable yet still one JSON object
+    out.write(HEADER_START + '\n{\n')
+    out.write(',\n'.join(' %s: %s' % (json.dumps(k), json.dumps(v)) for k, v in header.items()))
+    out.write('\n}\n' + HEADER_END + '\n')
+
+
+def read_header(source):
+    '''
+    The header dict of a kernel written by emit_code, from a path or an
+    open file. Only reads up to the end of the header.
+    '''
+    with _opened(source, 'r') as f:
+        lines = None
+        for line in f:
+            line = line.rstrip('\n')
+            if lines is None:
+                if line == HEADER_START:
+                    lines = []
+            elif line == HEADER_END:
+                return json.loads('\n'.join(lines))
+            else:
+                lines.append(line)
+    raise Exception("No ramjet-kernel header in %s" % source)
+
+
+def control_layout(common, exprs):
+    '''
+    Layout of the control points a derivation declares, the p net: the
+    entries of ramjet.kernels.infer_layout named p. Other numbered
+    symbols, du1_x, uv3_y, are left alone unless a layout says otherwise.
+    '''
+    from ramjet.kernels import infer_layout
+    return [entry for entry in infer_layout(common, exprs) if entry[0] == 'p']
+
+
+def emit_code(common, exprs, out, printer=None, optimize=None, name=None, header=True, layout=None):
+    '''
+    Writes cse() output as C# to out, a path or anything with write(), one
+    declaration at a time. See print_code for printer, optimize and layout.
+    name defaults to the enclosing kernel_name block's, if any.
+    '''
+    from ramjet.util import OPTIMIZE_CODE
+    from ramjet.optimize import MAX_POW_EXPANSION, optimize_terms, count_flops, flatten_terms, format_flops
+
+    if name is None:
+        name = _default_name()
+    if optimize is None:
+        optimize = OPTIMIZE_CODE
+    if printer is None:
+        if layout is None:
+            layout = control_layout(common, exprs)
+        printer = CSharpCodePrinter({
+            'max_pow_expansion': MAX_POW_EXPANSION if optimize else 0,
+            'points': layout,
+        })
+    max_pow_expansion = printer.max_pow_expansion
+
+    flops = count_flops(flatten_terms(common, exprs), 0 if optimize else max_pow_expansion)
+    flops_optimized = None
+    if optimize:
+        common, exprs = optimize_terms(common, exprs, max_pow_expansion=max_pow_expansion)
+        flops_optimized = count_flops(flatten_terms(common, exprs), max_pow_expansion)
+
+    with _opened(out, 'w') as f:
+        if header:
+            write_header(f, common, exprs, printer, name, flops, flops_optimized)
+        else:
+            f.write(format_flops(flops, flops_optimized) + '\n')
+
+        f.write("\n/*----------------terms-------------------*/\n\n")
+        for symbol, expr in common:
+            f.write(printer.declaration(symbol, expr) + '\n')
+
+        f.write("\n/*--------------solutions------------------*/\n\n")
+        for i, expr in enumerate(exprs):
+            f.write(printer.declaration("output_%d" % i, expr) + '\n')
@@ -0,0 +1,131 @@
+import numpy as np
+from sympy import Matrix
+from ramjet.controlnet import combine, CURVE, PATCH, TRIANGLE
+from ramjet.math import bezier_bases, make_bezier, make_bezier_patch_with_points, trinomial, triangular_indices
+from ramjet.curves import bernstein_matrix
+from ramjet.triangles import triangle_bases
+
+'''
+Hodograph pyramids
+
+Every derivative of a Bezier curve or patch is another Bezier net of lower
+degree, made by differencing the control points. ControlNet.derivative
+memoizes those nets per order on the net itself, so a derivation asking
+for the tangent, the second derivative and the mixed partial of the same
+patch differences each level once:
+
+    (0, 0) -u-> (1, 0) -u-> (2, 0)
+    (0, 0) -v-> (0, 1) -u-> (1, 1)
+                (0, 1) -v-> (0, 2)
+
+Orders are n for curves, (order_u, order_v) for patches and (order_u,
+order_v, order_w) for triangles, along the barycentric coordinates.
+
+The helpers here evaluate those nets: as sympy Matrix for symbolic nets,
+sharing the Bernstein bases of ramjet.math, or as float arrays for numeric
+ones. Numeric parameters are (S,) arrays, (S, 3) for barycentric samples,
+and results (S, dim).
+'''
+
+
+def pyramid(net, max_order):
+    '''
+    {order: derivative net} for every order with total up to max_order
+    '''
+    if net.kind == CURVE:
+        orders = [(n,) for n in range(0, max_order+1)]
+    elif net.kind == PATCH:
+        orders = [(i, n-i) for n in range(0, max_order+1) for i in range(n, -1, -1)]
+    else:
+        orders = [ijk for n in range(0, max_order+1) for ijk in triangular_indices(n)]
+
+    result = {}
+    for order in orders:
+        key = order[0] if net.kind == CURVE else order
+        result[key] = net.derivative(order)
+    return result
+
+
+def evaluate_derivative(net, order, *params):
+    '''
+    Derivative of the given order at params: t for curves, u, v for
+    patches, and u, v, w for symbolic triangles or one (S, 3) array of
+    barycentric samples for numeric ones
+    '''
+    d = net.derivative(order)
+    if net.is_symbolic:
+        return _evaluate_symbolic(d, params)
+    return _evaluate_numeric(d, params)
+
+
+def _evaluate_symbolic(net, params):
+    if net.num_points == 0:
+        return Matrix([0] * net.dimensions)
+
+    if net.kind == CURVE:
+        t, = params
+        return make_bezier(net, bezier_bases(net.degree, t))(t)
+    if net.kind == PATCH:
+        u, v = params
+        return make_bezier_patch_with_points(net, u, v)
+
+    u, v, w = params
+    weights = [trinomial(net.degree, i, j, k) * u**i * v**j * w**k for i, j, k in triangular_indices(net.degree)]
+    return Matrix(combine(net, weights))
+
+
+def _evaluate_numeric(net, params):
+    params = [np.asarray(p, dtype=np.float64) for p in params]
+    samples = params[0].shape[:-1] if net.kind == TRIANGLE else params[0].shape
+    if net.num_points == 0:
+        return np.zeros(samples + (net.dimensions,))
+
+    points = net.array
+    if net.kind == CURVE:
+        return bernstein_matrix(net.degree, params[0]) @ points
+    if net.kind == PATCH:
+        degree_u, degree_v = net.degree
+        bases_u = bernstein_matrix(degree_u, params[0])
+        bases_v = bernstein_matrix(degree_v, params[1])
+        return np.einsum('...b,...a,bad->...d', bases_v, bases_u, points, optimize=True)
+    return triangle_bases(net.degree, params[0]) @ points
+
+
+def _cross(a, b):
+    if isinstance(a, np.ndarray):
+        return np.cross(a, b)
+    return a.cross(b)
+
+
+def curve_derivatives(net, t, max_order):
+    '''
+    [position, first, ..., max_order-th derivative] at t
+    '''
+    return [evaluate_derivative(net, n, t) for n in range(0, max_order+1)]
+
+
+def patch_normal(net, u, v):
+    '''
+    Unnormalized normal S_u x S_v of a 3d patch
+    '''
+    return _cross(evaluate_derivative(net, (1, 0), u, v), evaluate_derivative(net, (0, 1), u, v))
+
+
+def patch_hessian(net, u, v):
+    '''
+    Second partials (S_uu, S_uv, S_vv) of a patch, as used by the second
+    fundamental form
+    '''
+    return tuple(evaluate_derivative(net, order, u, v) for order in [(2, 0), (1, 1), (0, 2)])
+
+
+def triangle_normal(net, *params):
+    '''
+    Unnormalized normal of a 3d triangular patch, along the parameter
+    directions (1, 0, -1) and (0, 1, -1): (S_u - S_w) x (S_v - S_w).
+    Takes u, v, w or (S, 3) samples like evaluate_derivative.
+    '''
+    du = evaluate_derivative(net, (1, 0, 0), *params)
+    dv = evaluate_derivative(net, (0, 1, 0), *params)
+    dw = evaluate_derivative(net, (0, 0, 1), *params)
+    return _cross(du - dw, dv - dw)
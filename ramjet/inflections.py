@@ -0,0 +1,138 @@
+import numpy as np
+from ramjet.basis import curve_power_coefficients_np
+
+'''
+Inflections of cubic Bezier curves, batched
+
+curvature_inflections.inflections_cubic_2d/3d solve cross(pd, pdd) = 0
+symbolically, and solveset(...).args[0] keeps one root of whatever case
+sympy picked. Numerically it's simpler: with the curve in power form,
+p = p0 + c t + b t^2 + a t^3,
+
+cross(pd, pdd) = cross(c + 2b t + 3a t^2, 2b + 6a t)
+               = 2 (-3 cross(a, b) t^2 + 3 cross(c, a) t + cross(c, b))
+
+as the t^3 terms cancel. So inflections are roots of one quadratic per
+curve, scalar for 2d curves and one per component for 3d ones, where all
+three have to vanish together (a 3d cubic only inflects where it's locally
+planar).
+
+The quadratics are solved in closed form, side by side for the whole
+batch, with the cases solveset hides made explicit:
+
+- all coefficients vanish: the curve is straight (or a point), and every t
+  is an inflection; count -1, like bernstein_roots
+- the t^2 coefficient vanishes: one linear root
+- the discriminant vanishes: a double root, which is where the two
+  inflections of an S curve merge into a cusp (or the curve touches zero
+  curvature without crossing it)
+
+otherwise the two roots come from q = -(B + sign(B) sqrt(D)) / 2 as q / A
+and C / q, which doesn't cancel catastrophically. Everything is measured
+against the size of the control polygon, so tolerances don't depend on
+the scale of the curves.
+'''
+
+
+def inflection_coefficients(points):
+    '''
+    Coefficients (A, B, C) of A t^2 + B t + C = cross(pd, pdd) / 2, for N
+    cubics (N, 4, dim): (N, 3) for 2d curves, (N, 3, 3) for 3d, one row
+    per component of the cross product
+    '''
+    points = _cubics(points)
+    _, c, b, a = np.moveaxis(curve_power_coefficients_np(points), -2, 0)
+
+    cross = _cross_2d if points.shape[-1] == 2 else np.cross
+    return np.stack([-3 * cross(a, b), 3 * cross(c, a), cross(c, b)], axis=-1)
+
+
+def _cubics(points):
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 3 or points.shape[1] != 4 or points.shape[2] not in (2, 3):
+        raise Exception("Expected cubics of shape (N, 4, 2 or 3), got %s" % (points.shape,))
+    return points
+
+
+def _cross_2d(a, b):
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def solve_quadratics(coeffs, tolerance=1e-9):
+    '''
+    Real roots in [0,1] of N quadratics (N, 3), highest power first, as
+    (roots, counts): roots (N, 2) ascending and padded with NaN. Coefficients
+    below tolerance times the largest one count as zero; quadratics that are
+    identically zero get a count of -1.
+    '''
+    coeffs = np.asarray(coeffs, dtype=np.float64)
+    scale = np.abs(coeffs).max(axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        A, B, C = np.moveaxis(np.where(scale[:, np.newaxis] > 0, coeffs / scale[:, np.newaxis], 0.0), -1, 0)
+
+    quadratic = np.abs(A) > tolerance
+    linear = ~quadratic & (np.abs(B) > tolerance)
+
+    discriminant = B * B - 4 * A * C
+    double = quadratic & (np.abs(discriminant) <= tolerance)
+    simple = quadratic & (discriminant > tolerance)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        q = -0.5 * (B + np.copysign(np.sqrt(np.maximum(discriminant, 0)), B))
+        first = np.select([simple, double, linear], [q / A, -B / (2 * A), -C / B], np.nan)
+        second = np.where(simple, C / q, np.nan)
+
+    # Roots just outside [0,1] are the ends of the curve, up to rounding
+    roots = np.stack([first, second], axis=-1)
+    inside = (roots >= -tolerance) & (roots <= 1 + tolerance)
+    roots = np.where(inside, np.clip(roots, 0, 1), np.nan)
+    roots = np.sort(roots, axis=-1)
+
+    counts = inside.sum(axis=-1)
+    counts[scale == 0] = -1
+    return (roots, counts)
+
+
+def inflections(points, tolerance=1e-9):
+    '''
+    All inflection parameters in [0,1] of N cubics (N, 4, 2 or 3). Returns
+    (roots, counts, cusps): roots (N, 2) ascending, padded with NaN, counts
+    (N,) with -1 for straight curves, and cusps (N, 2), True where the root
+    is a cusp, a point where the curve stops (pd = 0) rather than one where
+    it changes turning direction.
+    '''
+    points = _cubics(points)
+    coeffs = inflection_coefficients(points)
+
+    # cross(pd, pdd) is in squared length units of the control polygon
+    extent = np.linalg.norm(points - points[:, :1], axis=-1).max(axis=1)
+    size = extent * extent
+
+    if points.shape[-1] == 2:
+        straight = np.abs(coeffs).max(axis=-1) <= tolerance * size
+        roots, counts = solve_quadratics(coeffs, tolerance)
+    else:
+        straight = np.abs(coeffs).max(axis=(1, 2)) <= tolerance * size
+
+        # Roots of the largest component, kept where the others vanish too
+        component = np.abs(coeffs).max(axis=-1).argmax(axis=-1)
+        dominant = coeffs[np.arange(0, len(points)), component]
+        roots, counts = solve_quadratics(dominant, tolerance)
+
+        powers = np.stack([roots * roots, roots, np.ones_like(roots)], axis=-1)
+        residual = np.linalg.norm(np.einsum('nck,nrk->nrc', coeffs, powers), axis=-1)
+        common = residual <= tolerance * size[:, np.newaxis]
+        roots = np.sort(np.where(common, roots, np.nan), axis=-1)
+        counts = np.where(counts < 0, counts, (~np.isnan(roots)).sum(axis=-1))
+
+    roots[straight] = np.nan
+    counts[straight] = -1
+
+    # pd at the roots, relative to the control polygon
+    found = ~np.isnan(roots)
+    t = np.where(found, roots, 0.0)
+    _, c, b, a = np.moveaxis(curve_power_coefficients_np(points), -2, 0)
+    pd = c[:, np.newaxis] + 2 * b[:, np.newaxis] * t[..., np.newaxis] + 3 * a[:, np.newaxis] * (t * t)[..., np.newaxis]
+    speed = np.linalg.norm(pd, axis=-1)
+    cusps = found & (speed <= np.sqrt(tolerance) * extent[:, np.newaxis])
+    return (roots, counts, cusps)
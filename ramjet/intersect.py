@@ -0,0 +1,260 @@
+import numpy as np
+from ramjet.patches import evaluate_patches, evaluate_patch_derivatives
+from ramjet.subdivision import split_patches
+
+'''
+Batched ray / tensor product patch intersection
+
+A ray is where two planes through it meet, n1.x + d1 = 0 and n2.x + d2 = 0.
+Putting the patch's control points through both plane equations gives a 2d
+Bezier patch of the same degrees, and the ray hits the patch exactly where
+that one is (0, 0). For homogeneous (BASIS_4D) patches the plane equations
+are applied to (X, w) as n.X + d w, which is still polynomial, so rational
+patches need nothing special.
+
+Roots of the 2d patch are found in two steps, for every (ray, patch) pair
+at once:
+
+- isolation: subdivide, keeping only pieces whose net box, and slabs
+  across its edge chords, hold the origin (no piece without it can hold a
+  root), down to max_depth
+- Newton from the middle of every surviving piece, on the whole patch,
+  accepting results with a small residual that stay within their piece
+
+Newton from a piece that isn't small enough yet for the patch's curvature
+can run off to another root, or nowhere, and a piece can hold more than
+one root. Either way a root, the nearer one say, would be lost. So a piece
+is only done when Newton lands in it and it can't hold a second root:
+when every cross product of its u and v hodograph vectors has the same
+sign, F(p) - F(q) = du x + dv y with x and y never parallel, which only
+vanishes for p = q. Other pieces are split again and retried, up to
+refine_depth levels past max_depth. Pieces still left after that fall
+back to whatever root on the patch Newton found, if any, so work per pair
+stays bounded.
+
+Several pieces near one hit converge to the same (u, v), which doesn't
+matter as only the nearest hit per ray is kept. Works for any degrees, the
+quadratic and quartic patches of silhouettes.py included.
+
+Pairs come from a ramjet.bvh.BVH when given one, every ray against every
+patch otherwise, and are processed in chunks of chunk_size to bound memory.
+'''
+
+MAX_DEPTH = 5
+REFINE_DEPTH = 6
+NEWTON_ITERATIONS = 8
+CHUNK_SIZE = 1 << 15
+
+
+def ray_planes(origins, directions):
+    '''
+    Two planes meeting in each ray, as unit normals (R, 2, 3) and offsets
+    (R, 2), orthogonal to each other and to the ray
+    '''
+    origins = np.asarray(origins, dtype=np.float64)
+    directions = np.asarray(directions, dtype=np.float64)
+
+    # Anything orthogonal to the direction, from its two largest components
+    x, y, z = directions.T
+    mostly_x = np.abs(x) > np.abs(y)
+    first = np.where(mostly_x[:, np.newaxis],
+                     np.stack([-z, np.zeros_like(x), x], axis=-1),
+                     np.stack([np.zeros_like(x), z, -y], axis=-1))
+    first /= np.linalg.norm(first, axis=-1, keepdims=True)
+    second = np.cross(directions, first)
+    second /= np.linalg.norm(second, axis=-1, keepdims=True)
+
+    normals = np.stack([first, second], axis=1)
+    offsets = -np.einsum('rkd,rd->rk', normals, origins)
+    return (normals, offsets)
+
+
+def plane_nets(points, normals, offsets):
+    '''
+    The 2d patches (P, rows, cols, 2) of P patches against P ray plane
+    pairs, homogeneous patches through their weights
+    '''
+    distances = np.einsum('prcd,pkd->prck', points[..., :3], normals)
+    if points.shape[-1] == 4:
+        return distances + points[..., 3:] * offsets[:, np.newaxis, np.newaxis, :]
+    return distances + offsets[:, np.newaxis, np.newaxis, :]
+
+
+def _pieces(nets):
+    # Whole nets as pieces, kept one coordinate per row, (2 P, rows, cols, 1),
+    # so the box tests reduce over contiguous memory
+    rows, cols = nets.shape[1:3]
+    return np.ascontiguousarray(np.moveaxis(nets, -1, 1)).reshape(-1, rows, cols, 1)
+
+
+def _cull(pieces, pairs, corner):
+    # Only pieces whose box holds (0, 0), and whose slabs across the chords
+    # of their first row and column do too, which is much tighter once
+    # pieces flatten out
+    rows, cols = pieces.shape[1:3]
+    flat = pieces.reshape(-1, 2, rows * cols)
+    keep = ((flat.min(axis=2) <= 0) & (flat.max(axis=2) >= 0)).all(axis=1)
+    for end in (cols - 1, (rows - 1) * cols):
+        chord = flat[:, :, end] - flat[:, :, 0]
+        across = chord[:, 0, np.newaxis] * flat[:, 1] - chord[:, 1, np.newaxis] * flat[:, 0]
+        keep &= (across.min(axis=1) <= 0) & (across.max(axis=1) >= 0)
+    return (flat[keep].reshape(-1, rows, cols, 1), pairs[keep], corner[keep])
+
+
+def _split(pieces, pairs, corner, size):
+    # Quarters of every piece, size being that of the quarters, in the same
+    # order as split_patches: low u low v, high u low v, low u high v, high u high v
+    rows, cols = pieces.shape[1:3]
+    offsets = np.array([[0, 0], [size, 0], [0, size], [size, size]])
+    pieces = np.stack(split_patches(pieces), axis=1).reshape(-1, 2, 4, rows, cols)
+    pieces = np.ascontiguousarray(np.swapaxes(pieces, 1, 2)).reshape(-1, rows, cols, 1)
+    return (pieces, np.repeat(pairs, 4), (corner[:, np.newaxis] + offsets).reshape(-1, 2))
+
+
+def _single_root(pieces):
+    # True for pieces that hold at most one root, see above
+    rows, cols = pieces.shape[1:3]
+    nets = pieces.reshape(-1, 2, rows, cols)
+    du = np.diff(nets, axis=3).reshape(len(nets), 2, rows * (cols - 1))
+    dv = np.diff(nets, axis=2).reshape(len(nets), 2, (rows - 1) * cols)
+    cross = du[:, 0, :, np.newaxis] * dv[:, 1, np.newaxis] - du[:, 1, :, np.newaxis] * dv[:, 0, np.newaxis]
+    return (cross > 0).all(axis=(1, 2)) | (cross < 0).all(axis=(1, 2))
+
+
+def _isolate(nets, max_depth):
+    # Pieces that may hold (0, 0) at max_depth, as (pieces, pair, u0 v0, size)
+    pieces = _pieces(nets)
+    pairs = np.arange(0, len(nets))
+    corner = np.zeros((len(nets), 2))
+    size = 1.0
+    for depth in range(0, max_depth+1):
+        pieces, pairs, corner = _cull(pieces, pairs, corner)
+        if depth == max_depth or not len(pairs):
+            break
+        size /= 2
+        pieces, pairs, corner = _split(pieces, pairs, corner, size)
+    return (pieces, pairs, corner, size)
+
+
+def _newton(nets, pairs, u, v, iterations):
+    # Newton on F(u, v) = net(u, v) of each pair, returns (u, v, |F|)
+    for _ in range(0, iterations):
+        f, f_u, f_v = evaluate_patch_derivatives(nets[pairs], u[:, np.newaxis], v[:, np.newaxis],
+                                                 [(0, 0), (1, 0), (0, 1)])
+        f, f_u, f_v = f[:, 0], f_u[:, 0], f_v[:, 0]
+        det = f_u[:, 0] * f_v[:, 1] - f_u[:, 1] * f_v[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            du = (f[:, 0] * f_v[:, 1] - f[:, 1] * f_v[:, 0]) / det
+            dv = (f_u[:, 0] * f[:, 1] - f_u[:, 1] * f[:, 0]) / det
+        # Singular Jacobians stay put and fail the residual test below
+        u = u - np.where(np.isfinite(du), du, 0.0)
+        v = v - np.where(np.isfinite(dv), dv, 0.0)
+
+    f = evaluate_patch_derivatives(nets[pairs], u[:, np.newaxis], v[:, np.newaxis], [(0, 0)])[0][:, 0]
+    return (u, v, np.linalg.norm(f, axis=-1))
+
+
+def _within(u, v, low, high):
+    return (u >= low[:, 0]) & (u <= high[:, 0]) & (v >= low[:, 1]) & (v <= high[:, 1])
+
+
+def intersect_pairs(points, origins, directions, rays, patches, max_depth=MAX_DEPTH,
+                    iterations=NEWTON_ITERATIONS, tolerance=1e-9, refine_depth=REFINE_DEPTH):
+    '''
+    Hits of rays[i] with patches[i], for P candidate pairs. Returns
+    (pair, t, u, v) per hit, with t such that the hit is origin + t * direction;
+    a pair can show up more than once for the same hit.
+    '''
+    normals, offsets = ray_planes(origins[rays], directions[rays])
+    nets = plane_nets(points[patches], normals, offsets)
+
+    # Residuals are distances to the ray, relative to the size of the patch
+    flat = nets.reshape(len(nets), -1, 2)
+    scale = 1 + np.abs(flat).max(axis=(1, 2))
+    if points.shape[-1] == 4:
+        scale *= points[patches][..., 3].reshape(len(nets), -1).max(axis=1)
+
+    pieces, pairs, corner, size = _isolate(nets, max_depth)
+    found = []
+    for depth in range(0, refine_depth+1):
+        u, v, residual = _newton(nets, pairs, corner[:, 0] + size / 2, corner[:, 1] + size / 2, iterations)
+
+        # Roots within the piece, give or take a quarter of it for roots on
+        # its edges; anything further off belongs to another piece, if any.
+        # Past the last level any root on the patch beats none.
+        converged = residual <= tolerance * scale[pairs]
+        margin = size / 4 + tolerance if depth < refine_depth else 1.0
+        good = converged & _within(u, v, np.maximum(corner - margin, -tolerance),
+                                   np.minimum(corner + size + margin, 1 + tolerance))
+        found.append((pairs[good], u[good], v[good]))
+        if depth == refine_depth:
+            break
+
+        done = converged & _within(u, v, corner - tolerance, corner + size + tolerance)
+        done[done] = _single_root(pieces[done.repeat(2)])
+        size /= 2
+        pieces, pairs, corner = _cull(*_split(pieces[~done.repeat(2)], pairs[~done], corner[~done], size))
+        if not len(pairs):
+            break
+
+    pairs, u, v = [np.concatenate(f) for f in zip(*found)]
+    u, v = np.clip(u, 0, 1), np.clip(v, 0, 1)
+
+    pos = evaluate_patches(points[patches[pairs]], u[:, np.newaxis], v[:, np.newaxis])[0][:, 0]
+    d = directions[rays[pairs]]
+    t = np.einsum('pd,pd->p', pos - origins[rays[pairs]], d) / np.einsum('pd,pd->p', d, d)
+    return (pairs, t, u, v)
+
+
+def intersect_rays(points, origins, directions, bvh=None, t_min=0.0, t_max=np.inf, max_depth=MAX_DEPTH,
+                   iterations=NEWTON_ITERATIONS, tolerance=1e-9, chunk_size=CHUNK_SIZE,
+                   refine_depth=REFINE_DEPTH):
+    '''
+    Nearest hit of R rays, origins and directions (R, 3), with K patches
+    (K, degree_v+1, degree_u+1, 3 or 4). Returns (t, patch, u, v, normal):
+    t, u, v (R,), patch (R,) with -1 and t inf for misses, and the
+    unnormalized normal (R, 3), zero for misses.
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+    directions = np.asarray(directions, dtype=np.float64).reshape(-1, 3)
+    if points.ndim != 4 or points.shape[-1] not in (3, 4):
+        raise Exception("Expected points of shape (K, degree_v+1, degree_u+1, 3 or 4), got %s" % (points.shape,))
+
+    if bvh is not None:
+        rays, patches, _ = bvh.intersect_rays(origins, directions, t_max, refine_depth=1)
+    else:
+        rays = np.repeat(np.arange(0, len(origins)), len(points))
+        patches = np.tile(np.arange(0, len(points)), len(origins))
+
+    best_t = np.full(len(origins), np.inf)
+    best_patch = np.full(len(origins), -1, dtype=np.int64)
+    best_uv = np.zeros((len(origins), 2))
+    for start in range(0, len(rays), chunk_size):
+        chunk_rays = rays[start:start+chunk_size]
+        chunk_patches = patches[start:start+chunk_size]
+        pairs, t, u, v = intersect_pairs(points, origins, directions, chunk_rays, chunk_patches,
+                                         max_depth, iterations, tolerance, refine_depth)
+        hit_rays = chunk_rays[pairs]
+        hit_patches = chunk_patches[pairs]
+
+        valid = (t >= t_min) & (t <= t_max)
+        hit_rays, hit_patches, t, u, v = hit_rays[valid], hit_patches[valid], t[valid], u[valid], v[valid]
+
+        # Nearest per ray, then merged with earlier chunks
+        order = np.lexsort((t, hit_rays))
+        hit_rays, hit_patches, t, u, v = hit_rays[order], hit_patches[order], t[order], u[order], v[order]
+        first = np.r_[True, hit_rays[1:] != hit_rays[:-1]] if len(hit_rays) else np.zeros(0, dtype=bool)
+        hit_rays, hit_patches, t, u, v = hit_rays[first], hit_patches[first], t[first], u[first], v[first]
+        closer = t < best_t[hit_rays]
+        hit_rays = hit_rays[closer]
+        best_t[hit_rays] = t[closer]
+        best_patch[hit_rays] = hit_patches[closer]
+        best_uv[hit_rays] = np.stack([u[closer], v[closer]], axis=-1)
+
+    normal = np.zeros((len(origins), 3))
+    hit = np.flatnonzero(best_patch >= 0)
+    if len(hit):
+        uv = best_uv[hit]
+        normal[hit] = evaluate_patches(points[best_patch[hit]], uv[:, :1], uv[:, 1:])[3][:, 0]
+    return (best_t, best_patch, best_uv[:, 0], best_uv[:, 1], normal)
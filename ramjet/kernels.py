@@ -0,0 +1,175 @@
+import re
+import numpy as np
+from sympy import MatrixBase
+from sympy.printing.numpy import NumPyPrinter
+
+'''
+Batched NumPy kernels from cse() output
+
+print_code turns (common, exprs) into C# for shipping. This turns the very
+same pair into a Python function over arrays of control nets, so the
+formulas can be tested and run over whole scenes without hand porting.
+
+Common subexpressions stay shared intermediates: each one is evaluated
+once per batch, in cse order, and outputs refer to them by name.
+
+Inputs are described by a layout, a list of (argument, point_names, basis):
+
+    [('p', ['p1', 'p2', ..., 'p9'], BASIS_3D),
+     ('viewPoint', 'viewPoint', BASIS_3D),
+     ('u', 'u', None)]
+
+An argument with a list of point names takes an (N, points, dim) array,
+a single point name takes (N, dim), and a scalar (basis None) takes (N,).
+Point symbols are named like symbolic_vector makes them: p1_x, du3_y, ...
+'''
+
+_vector_symbol = re.compile(r'^(?P<point>(?P<prefix>[A-Za-z_]*?[A-Za-z])_?(?P<index>\d*))_(?P<basis>[xyzw])$')
+
+
+def point_layout(prefix, count, basis, start=1):
+    '''
+    Layout entry for points named prefix1, prefix2, ... like the patches
+    in silhouettes.py
+    '''
+    return (prefix, ['%s%i' % (prefix, i) for i in range(start, start+count)], basis)
+
+
+def infer_layout(common, exprs, symbols=None):
+    '''
+    Groups the free symbols of a cse result into a layout. Vector symbols
+    of the form <name><n>_<x|y|z|w> are gathered per name and sorted by n,
+    anything else becomes a scalar argument. Names whose numbers only
+    differ in leading zeros, p1 and p01, are an error.
+
+    Points no expression refers to are left out, so pass a layout
+    explicitly when the kernel should take a fixed control net shape.
+    '''
+    if symbols is None:
+        symbols = free_input_symbols(common, exprs)
+
+    points = {}
+    bases = {}
+    scalars = []
+    for s in sorted(symbols, key=lambda s: s.name):
+        match = _vector_symbol.match(s.name)
+        if match is None:
+            scalars.append(s.name)
+            continue
+        prefix = match.group('prefix')
+        index = int(match.group('index')) if match.group('index') else None
+        points.setdefault(prefix, set()).add((index, match.group('point')))
+        bases.setdefault(prefix, set()).add(match.group('basis'))
+
+    layout = []
+    for prefix in sorted(points):
+        basis = [b for b in ['x', 'y', 'z', 'w'] if b in bases[prefix]]
+        entries = sorted(points[prefix], key=lambda e: -1 if e[0] is None else e[0])
+        # p1 and p01 would land in the same slot, and p1 would silently
+        # stand in for p01
+        indices = [index for index, _ in entries]
+        if len(set(indices)) != len(indices):
+            clashes = sorted(name for index, name in entries if indices.count(index) > 1)
+            raise Exception("Points %s share an index, pass a layout explicitly" % ', '.join(clashes))
+        if len(entries) == 1 and entries[0][0] is None:
+            layout.append((prefix, entries[0][1], basis))
+        else:
+            layout.append((prefix, [name for _, name in entries], basis))
+
+    for name in scalars:
+        layout.append((name, name, None))
+
+    return layout
+
+
+def free_input_symbols(common, exprs):
+    defined = set(s for s, _ in common)
+    symbols = set()
+    for _, expr in common:
+        symbols |= expr.free_symbols
+    for expr in exprs:
+        symbols |= expr.free_symbols
+    return symbols - defined
+
+
+def kernel_source(common, exprs, layout, name='kernel'):
+    '''
+    Generates the Python source of a batched kernel, see make_kernel
+    '''
+    printer = NumPyPrinter({'fully_qualified_modules': True})
+
+    args = [arg for arg, _, _ in layout]
+    lines = ['def %s(%s):' % (name, ', '.join(args))]
+
+    # Unpack input arrays into one column per symbol
+    for arg, point_names, basis in layout:
+        if basis is None:
+            if point_names != arg:
+                lines.append('    %s = %s' % (point_names, arg))
+            continue
+        if isinstance(point_names, str):
+            for axis, b in enumerate(basis):
+                lines.append('    %s_%s = %s[..., %i]' % (point_names, b, arg, axis))
+        else:
+            for i, point_name in enumerate(point_names):
+                for axis, b in enumerate(basis):
+                    lines.append('    %s_%s = %s[..., %i, %i]' % (point_name, b, arg, i, axis))
+
+    lines.append('')
+    lines.append('    # terms')
+    for symbol, expr in common:
+        lines.append('    %s = %s' % (printer.doprint(symbol), printer.doprint(expr)))
+
+    lines.append('')
+    lines.append('    # solutions')
+    outputs = []
+    for i, expr in enumerate(exprs):
+        if isinstance(expr, MatrixBase):
+            elements = ['_broadcast(%s, shape)' % printer.doprint(e) for e in expr]
+            lines.append('    output_%i = numpy.stack([%s], axis=-1).reshape(shape + %s)' % (
+                i, ', '.join(elements), (expr.shape if expr.shape[1] != 1 else (expr.shape[0],))))
+        else:
+            lines.append('    output_%i = _broadcast(%s, shape)' % (i, printer.doprint(expr)))
+        outputs.append('output_%i' % i)
+
+    # Batch shape is whatever all the inputs broadcast to
+    batch_shapes = []
+    for arg, point_names, basis in layout:
+        if basis is None:
+            batch_shapes.append('numpy.shape(%s)' % arg)
+        elif isinstance(point_names, str):
+            batch_shapes.append('numpy.shape(%s)[:-1]' % arg)
+        else:
+            batch_shapes.append('numpy.shape(%s)[:-2]' % arg)
+    lines.insert(1, '    shape = numpy.broadcast_shapes(%s)' % ', '.join(batch_shapes))
+
+    lines.append('    return (%s,)' % ', '.join(outputs))
+    return '\n'.join(lines) + '\n'
+
+
+def _broadcast(value, shape):
+    return np.broadcast_to(np.asarray(value, dtype=np.float64), shape)
+
+
+def make_kernel(common, exprs, layout=None, name='kernel'):
+    '''
+    Compiles (common, exprs) from cse() into a function over batches of
+    control nets. Returns a function taking one array per layout entry (in
+    order, or by keyword) and returning a tuple with one array per output:
+    (N,) for scalar outputs, (N, rows) for vector outputs.
+
+    The generated source is kept on the function as .source, and the
+    layout it expects as .layout.
+    '''
+    exprs = list(exprs)
+    if layout is None:
+        layout = infer_layout(common, exprs)
+
+    source = kernel_source(common, exprs, layout, name)
+    namespace = {'numpy': np, '_broadcast': _broadcast}
+    exec(compile(source, '<ramjet kernel %s>' % name, 'exec'), namespace)
+
+    kernel = namespace[name]
+    kernel.source = source
+    kernel.layout = layout
+    return kernel
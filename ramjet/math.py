@@ -1,7 +1,9 @@
+import math
 from sympy import *
 from sympy.physics.vector import *
-from functools import reduce
+from functools import reduce, lru_cache
 from ramjet.util import *
+from ramjet.controlnet import ControlNet, as_net, combine, CURVE, PATCH
 
 ''' Polynomial helpers '''
 
@@ -11,6 +13,120 @@ def to_polynomial(expr, param):
     poly = Poly(expr, param)
     return poly
 
+def _equation_numerator(expr):
+    if isinstance(expr, Equality):
+        return (expr.lhs - expr.rhs).as_numer_denom()[0]
+    return expr
+
+def polynomial_coeffs(expr, param, expand_coeffs=True):
+    '''
+    Coefficients of expr as a polynomial in param, highest power first,
+    like Poly.all_coeffs(). Unlike to_polynomial this never simplifies:
+    it walks the expression tree once, multiplying out only the powers
+    of param, and leaves everything else as it is.
+
+    With expand_coeffs each coefficient is expanded on its own, so that
+    coefficients which cancel come out as a literal zero and the degree
+    is exact.
+
+    Equations are solved for zero, so an Eq is reduced to the numerator of
+    lhs - rhs: denominators (homogeneous divides) don't move its roots.
+    '''
+    expr = _equation_numerator(expr)
+
+    coeffs = _coeff_terms(expr, param)
+    degree = max(coeffs.keys())
+
+    result = []
+    for power in range(degree, -1, -1):
+        c = Add(*coeffs.get(power, []))
+        if expand_coeffs:
+            c = expand(c)
+        result.append(c)
+
+    # drop leading terms that cancelled out
+    while len(result) > 1 and result[0] == 0:
+        result.pop(0)
+    return result
+
+def to_polynomial_fast(expr, param, expand_coeffs=True):
+    '''
+    Drop-in for to_polynomial that goes through polynomial_coeffs
+    instead of simplify and collect. Coefficients live in the EX domain,
+    so Poly doesn't try to expand them into a multivariate ring.
+    '''
+    coeffs = polynomial_coeffs(expr, param, expand_coeffs)
+    return Poly(coeffs, param, domain='EX')
+
+def polynomial_degree(expr, param):
+    '''
+    Degree of expr in param, from the expression structure alone. Never
+    builds coefficients, so it's cheap on huge expressions, but it is an
+    upper bound: leading terms that cancel still count. Use
+    polynomial_coeffs when that matters.
+    '''
+    expr = _equation_numerator(expr)
+
+    if not expr.has(param):
+        return 0
+    if expr == param:
+        return 1
+    if expr.is_Add:
+        return max(polynomial_degree(a, param) for a in expr.args)
+    if expr.is_Mul:
+        return sum(polynomial_degree(a, param) for a in expr.args)
+    if expr.is_Pow and expr.exp.is_Integer and expr.exp >= 0:
+        return polynomial_degree(expr.base, param) * int(expr.exp)
+
+    raise PolynomialError("%s is not a polynomial in %s" % (expr, param))
+
+def _coeff_terms(expr, param):
+    '''
+    Returns {power: [terms]}, the unsummed coefficients of expr in param
+    '''
+    if not expr.has(param):
+        return {0: [expr]}
+    if expr == param:
+        return {1: [S.One]}
+
+    if expr.is_Add:
+        result = {}
+        for arg in expr.args:
+            for power, terms in _coeff_terms(arg, param).items():
+                result.setdefault(power, []).extend(terms)
+        return result
+
+    if expr.is_Mul:
+        # gather the factors free of param first, they scale everything
+        scale = []
+        result = {0: [S.One]}
+        for arg in expr.args:
+            if not arg.has(param):
+                scale.append(arg)
+            else:
+                result = _multiply_coeff_terms(result, _coeff_terms(arg, param))
+        scale = Mul(*scale)
+        return {power: [scale * Add(*terms)] for power, terms in result.items()}
+
+    if expr.is_Pow and expr.exp.is_Integer and expr.exp >= 0:
+        base = _coeff_terms(expr.base, param)
+        result = {0: [S.One]}
+        for i in range(0, int(expr.exp)):
+            result = _multiply_coeff_terms(result, base)
+        return result
+
+    raise PolynomialError("%s is not a polynomial in %s" % (expr, param))
+
+def _multiply_coeff_terms(a, b):
+    a = {power: Add(*terms) for power, terms in a.items()}
+    b = {power: Add(*terms) for power, terms in b.items()}
+
+    result = {}
+    for power_a, coeff_a in a.items():
+        for power_b, coeff_b in b.items():
+            result.setdefault(power_a + power_b, []).append(coeff_a * coeff_b)
+    return result
+
 # not really needed, but it was educational to write
 def solve_quadratic(expr, t):
     poly = to_polynomial(expr, t)
@@ -81,8 +197,23 @@ def cross_2d(p1, p2):
 
 
 def trinomial(n, i, j, k):
-    return math.factorial(n) / (math.factorial(i) * math.factorial(j) * math.factorial(k))
+    # exact integer, so symbolic patches don't pick up float coefficients
+    return Integer(math.factorial(n) // (math.factorial(i) * math.factorial(j) * math.factorial(k)))
 
+@lru_cache(maxsize=None)
+def triangular_indices(degree):
+    '''
+    All (i, j, k) with i+j+k == degree, in the order triangular patches
+    store their points: 002, 011, 020, 101, 110, 200 for quadratics.
+    '''
+    indices = []
+    for i in range(0, degree+1):
+        for j in range(0, degree+1-i):
+            indices.append((i, j, degree-i-j))
+    return tuple(indices)
+
+# Bases are immutable sympy exprs, so share them between derivations
+@lru_cache(maxsize=None)
 def bernstein_basis(n, i, param):
     basis = binomial(n, i) * param**i * (1 - param)**(n-i)
 
@@ -100,11 +231,18 @@ def make_bezier(points, bases):
         raise Exception("Number of points %i should be equal to number of bases %i" % (
             len(points), len(bases)))
 
-    terms = [p * b for p, b in zip(points, bases)]
-    expr = reduce((lambda x, y: x + y), terms)
+    if isinstance(points, ControlNet) or isinstance(points[0], MatrixBase):
+        # One Add per coordinate, instead of a Matrix per term
+        expr = Matrix(combine(as_net(points, CURVE), bases))
+    else:
+        terms = [p * b for p, b in zip(points, bases)]
+        expr = reduce((lambda x, y: x + y), terms)
     return lambda t: expr
 
 def differentiate_curve_points(points):
+    if isinstance(points, ControlNet):
+        return points.derivative(1)
+
     points_dt = []
     input_degree = len(points)-1
     for i in range(0, input_degree):
@@ -114,53 +252,36 @@ def differentiate_curve_points(points):
 
 def make_bezier_patch_with_points(patch, u, v):
     '''
-    Given matrix of points and two parameters, constructs a function that
-    samples a position along the given surface. Arbitrary degree.
+    Given matrix of points (or a patch ControlNet) and two parameters,
+    constructs a function that samples a position along the given
+    surface. Arbitrary degree.
     '''
 
-    dimensions = patch[0][0].shape[0]  # Get point dimensions
+    net = as_net(patch, PATCH)
 
-    degree_u = len(patch[0])-1
-    degree_v = len(patch)-1
+    degree_u = net.shape[1]-1
+    degree_v = net.shape[0]-1
     bases_u = bezier_bases(degree_u, u)
     bases_v = bezier_bases(degree_v, v)
 
-    pos = Matrix([0]*dimensions)
-
-    for vIdx in range(0, degree_v+1):
-        for uIdx in range(0, degree_u+1):
-            pos += patch[vIdx][uIdx] * bases_u[uIdx] * bases_v[vIdx]
-
-    return pos
+    weights = [bases_u[uIdx] * bases_v[vIdx] for vIdx in range(0, degree_v+1) for uIdx in range(0, degree_u+1)]
+    return Matrix(combine(net, weights))
 
 def differentiate_patch_points(patch):
     '''
-    Todo: this calculates point deltas only,
-    but could actually return the full patch
-    derivative formulate, just zip with bersteins
+    Point deltas in u and v, as (patch_du, patch_dv). Degrees in u and v
+    may differ: patch_du has one column less, patch_dv one row less.
     '''
-
-    patch_du = []
-    patch_dv = []
-
-    input_degree = len(patch[0])-1
-    for v in range(0, input_degree):
-        du = []
-        dv = []
-        for u in range(0, input_degree):
-            du.append((input_degree) * (patch[v][u+1] - patch[v][u]))
-            dv.append((input_degree) * (patch[v+1][u] - patch[v][u]))
-
-        patch_du.append(du)
-        patch_dv.append(dv)
-
-    return (patch_du, patch_dv)
+    return (differentiate_patch_points_u(patch), differentiate_patch_points_v(patch))
 
 def differentiate_patch_points_u(patch):
+    if isinstance(patch, ControlNet):
+        return patch.derivative((1, 0))
+
     input_degree = len(patch[0])-1
     
     patch_du = []
-    for v in range(0, input_degree+1):
+    for v in range(0, len(patch)):
         du = []
         for u in range(0, input_degree):
             du.append((input_degree) * (patch[v][u+1] - patch[v][u]))
@@ -170,12 +291,15 @@ def differentiate_patch_points_u(patch):
     return patch_du
 
 def differentiate_patch_points_v(patch):
+    if isinstance(patch, ControlNet):
+        return patch.derivative((0, 1))
+
     input_degree = len(patch)-1
     
     patch_dv = []
     for v in range(0, input_degree):
         dv = []
-        for u in range(0, input_degree+1):
+        for u in range(0, len(patch[0])):
             dv.append((input_degree) * (patch[v+1][u] - patch[v][u]))
 
         patch_dv.append(dv)
@@ -0,0 +1,238 @@
+import os
+import sys
+import ctypes
+import platform
+import shutil
+import hashlib
+import subprocess
+from functools import lru_cache
+import numpy as np
+from sympy import MatrixBase
+from sympy.printing.c import C99CodePrinter
+from ramjet.cache import CACHE_DIR, evict
+from ramjet.kernels import infer_layout
+
+'''
+Native batched kernels from cse() output
+
+Same contract as ramjet.kernels.make_kernel, but the (common, exprs) pair
+is printed as C99 by sympy's C printer, compiled with the system compiler
+and called through ctypes. Worth it for deep cse chains, where the NumPy
+kernel spends its time allocating one temporary array per term: here every
+term is a register in a loop over the batch.
+
+The generated entry point is
+
+    void kernel(long rj_n, const double *p_in, const double *u_in, ..., double *output_0, ...)
+
+over C-contiguous float64 arrays, one per layout entry then one per
+output. Shared objects are cached under $RAMJET_CACHE_DIR/native, keyed by
+a hash of the C source, the compiler command and the CPU, so each formula
+is only compiled once per machine, and a cache shared between machines
+never hands one a -march=native build for another. They count towards the
+cse cache's budget and are evicted along with its entries, least recently
+used first.
+
+Set CC and RAMJET_CFLAGS to pick the compiler and flags.
+'''
+
+NATIVE_CACHE_DIR = os.path.join(CACHE_DIR, 'native')
+CFLAGS = os.environ.get('RAMJET_CFLAGS', '-O3 -march=native').split()
+
+
+def find_compiler():
+    for compiler in [os.environ.get('CC'), 'cc', 'gcc', 'clang']:
+        if compiler and shutil.which(compiler):
+            return compiler
+    raise Exception("No C compiler found, set CC to use native kernels")
+
+
+@lru_cache(maxsize=None)
+def cpu_id():
+    '''
+    What the default -march=native builds for: the architecture, and on
+    Linux the first CPU's model and feature flags
+    '''
+    parts = [platform.machine(), platform.processor()]
+    try:
+        with open('/proc/cpuinfo') as f:
+            for line in f:
+                if not line.strip():
+                    break
+                if line.split(':', 1)[0].strip() in ('model name', 'flags', 'Features', 'CPU part'):
+                    parts.append(line.strip())
+    except OSError:
+        pass
+    return '\n'.join(parts)
+
+
+def _entry_size(point_names, basis):
+    # Values per batch element for a layout entry
+    if basis is None:
+        return 1
+    if isinstance(point_names, str):
+        return len(basis)
+    return len(point_names) * len(basis)
+
+
+def _output_size(expr):
+    return expr.shape[0] * expr.shape[1] if isinstance(expr, MatrixBase) else 1
+
+
+def native_source(common, exprs, layout, name='kernel'):
+    '''
+    C source of a batched kernel, see make_native_kernel
+    '''
+    printer = C99CodePrinter()
+
+    # Loop variables and arguments are prefixed or suffixed, so they can't
+    # collide with the symbols unpacked into locals
+    args = ['long rj_n']
+    args += ['const double *restrict %s_in' % arg for arg, _, _ in layout]
+    args += ['double *restrict output_%i' % i for i in range(0, len(exprs))]
+
+    lines = ['#include <math.h>', '']
+    lines.append('void %s(%s)' % (name, ', '.join(args)))
+    lines.append('{')
+    lines.append('    for (long rj_i = 0; rj_i < rj_n; rj_i++) {')
+
+    # Unpack this element's inputs into one local per symbol
+    for arg, point_names, basis in layout:
+        size = _entry_size(point_names, basis)
+        if basis is None:
+            lines.append('        const double %s = %s_in[rj_i];' % (point_names, arg))
+            continue
+        names = [point_names] if isinstance(point_names, str) else point_names
+        for p, point_name in enumerate(names):
+            for axis, b in enumerate(basis):
+                lines.append('        const double %s_%s = %s_in[rj_i*%i + %i];' % (
+                    point_name, b, arg, size, p * len(basis) + axis))
+
+    lines.append('')
+    for symbol, expr in common:
+        lines.append('        const double %s = %s;' % (printer.doprint(symbol), printer.doprint(expr)))
+
+    lines.append('')
+    for i, expr in enumerate(exprs):
+        size = _output_size(expr)
+        if isinstance(expr, MatrixBase):
+            for j, e in enumerate(expr):
+                lines.append('        output_%i[rj_i*%i + %i] = %s;' % (i, size, j, printer.doprint(e)))
+        else:
+            lines.append('        output_%i[rj_i] = %s;' % (i, printer.doprint(expr)))
+
+    lines.append('    }')
+    lines.append('}')
+    return '\n'.join(lines) + '\n'
+
+
+def compile_native(source, cache_dir=None):
+    '''
+    Path of the shared object built from source, compiling it unless a
+    previous run already did
+    '''
+    cache_dir = cache_dir or NATIVE_CACHE_DIR
+    compiler = find_compiler()
+    command = [compiler, '-shared', '-fPIC', '-std=c99'] + CFLAGS
+
+    h = hashlib.sha256()
+    for part in [source, cpu_id()] + command:
+        h.update(part.encode())
+        h.update(b'\0')
+    key = h.hexdigest()
+
+    suffix = '.dylib' if sys.platform == 'darwin' else '.so'
+    library = os.path.join(cache_dir, key + suffix)
+    # Mark as recently used, for eviction, unless it's gone
+    try:
+        os.utime(library)
+        return library
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write both next to their final paths and swap them in, like
+    # store_cached, so concurrent builds never see each other's halves
+    source_path = os.path.join(cache_dir, key + '.c')
+    tmp_source_path = '%s.%i.tmp' % (source_path, os.getpid())
+    with open(tmp_source_path, 'w') as f:
+        f.write(source)
+    os.replace(tmp_source_path, source_path)
+
+    tmp_path = '%s.%i.tmp' % (library, os.getpid())
+    result = subprocess.run(command + ['-o', tmp_path, source_path, '-lm'],
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+    if result.returncode != 0:
+        raise Exception("Compiling %s failed:\n%s" % (source_path, result.stdout))
+    os.replace(tmp_path, library)
+
+    if cache_dir == NATIVE_CACHE_DIR:
+        evict()
+    return library
+
+
+def make_native_kernel(common, exprs, layout=None, name='kernel', cache_dir=None):
+    '''
+    Compiles (common, exprs) from cse() to a native function over batches
+    of control nets. Takes and returns arrays exactly like make_kernel:
+    one array per layout entry (in order, or by keyword), broadcast against
+    each other, and a tuple with one array per output.
+
+    The C source is kept on the function as .source, the layout as .layout
+    and the shared object's path as .library.
+    '''
+    exprs = list(exprs)
+    if layout is None:
+        layout = infer_layout(common, exprs)
+
+    source = native_source(common, exprs, layout, name)
+    library = compile_native(source, cache_dir)
+
+    array = np.ctypeslib.ndpointer(dtype=np.float64, flags='C_CONTIGUOUS')
+    function = getattr(ctypes.CDLL(library), name)
+    function.restype = None
+    function.argtypes = [ctypes.c_long] + [array] * (len(layout) + len(exprs))
+
+    arg_names = [arg for arg, _, _ in layout]
+    output_shapes = []
+    for expr in exprs:
+        if not isinstance(expr, MatrixBase):
+            output_shapes.append(())
+        else:
+            output_shapes.append((expr.shape[0],) if expr.shape[1] == 1 else expr.shape)
+
+    def kernel(*args, **kwargs):
+        values = list(args) + [kwargs[arg] for arg in arg_names[len(args):]]
+        if len(values) != len(layout):
+            raise Exception("Kernel %s takes %i arguments, got %i" % (name, len(layout), len(values)))
+
+        # Batch shape is whatever all the inputs broadcast to, like make_kernel
+        values = [np.asarray(v, dtype=np.float64) for v in values]
+        batch_shapes = []
+        for value, (_, point_names, basis) in zip(values, layout):
+            if basis is None:
+                batch_shapes.append(value.shape)
+            elif isinstance(point_names, str):
+                batch_shapes.append(value.shape[:-1])
+            else:
+                batch_shapes.append(value.shape[:-2])
+        shape = np.broadcast_shapes(*batch_shapes)
+        count = int(np.prod(shape))
+        outputs = [np.empty(shape + s) for s in output_shapes]
+        if count == 0:
+            return tuple(outputs)
+
+        inputs = []
+        for value, (_, point_names, basis), batch_shape in zip(values, layout, batch_shapes):
+            element_shape = value.shape[len(batch_shape):]
+            value = np.broadcast_to(value, shape + element_shape)
+            inputs.append(np.ascontiguousarray(value).reshape(count, -1))
+
+        function(count, *(inputs + outputs))
+        return tuple(outputs)
+
+    kernel.__name__ = name
+    kernel.source = source
+    kernel.layout = layout
+    kernel.library = library
+    return kernel
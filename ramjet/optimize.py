@@ -0,0 +1,210 @@
+from sympy import Add, Mul, Pow, Symbol, S, Function, PolynomialError
+from ramjet.math import polynomial_coeffs, polynomial_degree
+
+'''
+Flop-minimizing rewrites for generated code
+
+cse() removes repeated work, but what's left is still printed as expanded
+sums of monomials with math.pow for every power. Two cheap rewrites help:
+
+- Horner form in the curve/patch parameters: a*t^3 + b*t^2 + c*t + d
+  becomes d + t*(c + t*(b + t*a)), three muls instead of six and a pow
+- small integer powers of symbols as repeated products, x*x*x rather than
+  math.pow(x, 3), done by the printer with max_pow_expansion
+
+count_flops tallies what the printed C# costs, so print_code can report
+every kernel before and after.
+'''
+
+PARAMETERS = ('t', 'u', 'v', 'w')
+
+# Past this, pow is no slower than the chain of muls
+MAX_POW_EXPANSION = 4
+
+FLOP_KINDS = ('adds', 'muls', 'divs', 'sqrts', 'pows', 'funcs')
+
+
+def count_flops(exprs, max_pow_expansion=0):
+    '''
+    {kind: count} for exprs as CSharpCodePrinter prints them, with integer
+    powers up to max_pow_expansion of atoms costing muls rather than pows.
+    Subtraction counts as an add, negation and constant folding as free.
+    '''
+    flops = dict((kind, 0) for kind in FLOP_KINDS)
+    for expr in exprs:
+        _count(expr, max_pow_expansion, flops)
+    return flops
+
+
+def _count(expr, max_pow, flops):
+    if expr.is_Atom:
+        return
+
+    if expr.is_Add:
+        flops['adds'] += len(expr.args) - 1
+        for arg in expr.args:
+            _count(arg, max_pow, flops)
+    elif expr.is_Mul:
+        numerator = []
+        denominator = []
+        for arg in expr.args:
+            if arg == S.NegativeOne:
+                continue
+            if arg.is_Pow and arg.exp.is_Number and arg.exp.is_negative:
+                denominator.append(Pow(arg.base, -arg.exp, evaluate=False))
+            else:
+                numerator.append(arg)
+
+        flops['muls'] += max(0, len(numerator) - 1) + max(0, len(denominator) - 1)
+        if denominator:
+            flops['divs'] += 1
+        for arg in numerator + denominator:
+            _count(arg, max_pow, flops)
+    elif expr.is_Pow:
+        exp = expr.exp
+        if exp.is_Number and exp.is_negative:
+            flops['divs'] += 1
+            exp = -exp
+
+        if exp == S.Half:
+            flops['sqrts'] += 1
+        elif exp.is_Integer and int(exp) <= max_pow and expr.base.is_Atom:
+            flops['muls'] += int(exp) - 1
+        elif exp != S.One:
+            flops['pows'] += 1
+        _count(expr.base, max_pow, flops)
+        _count(exp, max_pow, flops)
+    else:
+        if isinstance(expr, Function):
+            flops['funcs'] += 1
+        for arg in expr.args:
+            _count(arg, max_pow, flops)
+
+
+def total_flops(flops):
+    return sum(flops.values())
+
+
+def horner_form(expr, params, max_pow_expansion=0):
+    '''
+    Nested Horner form of expr in the given parameters, outermost first,
+    with the coefficients Horner'd in the remaining ones. Parts that
+    aren't polynomial in a parameter are left alone, and so is anything
+    where the rewrite doesn't save flops.
+    '''
+    params = [p for p in params if expr.has(p)]
+    if not params or expr.is_Atom:
+        return expr
+
+    param = params[0]
+    rest = params[1:]
+    if _is_quotient(expr, params):
+        # A single quotient: numerator and denominator separately. Sums of
+        # fractions aren't put over a common denominator, which costs more
+        # than it saves, their terms are handled one by one below
+        numerator, denominator = expr.as_numer_denom()
+        result = Mul(horner_form(numerator, params, max_pow_expansion),
+                     Pow(horner_form(denominator, params, max_pow_expansion), -1, evaluate=False),
+                     evaluate=False)
+    else:
+        try:
+            degree = polynomial_degree(expr, param)
+        except PolynomialError:
+            return _horner_args(expr, params, max_pow_expansion)
+
+        if degree < 2:
+            result = horner_form(expr, rest, max_pow_expansion) if rest else expr
+        else:
+            coeffs = polynomial_coeffs(expr, param, expand_coeffs=False)
+            result = S.Zero
+            for i, c in enumerate(coeffs):
+                c = horner_form(c, rest, max_pow_expansion) if rest else c
+                if i == 0:
+                    result = c
+                else:
+                    # A leading coefficient of 1 needs no multiply
+                    term = param if result == S.One else Mul(param, result, evaluate=False)
+                    result = Add(term, c, evaluate=False)
+
+    before = total_flops(count_flops([expr], max_pow_expansion))
+    after = total_flops(count_flops([result], max_pow_expansion))
+    return result if after < before else expr
+
+
+def _is_quotient(expr, params):
+    # A product dividing by something in the parameters
+    return expr.is_Mul and any(
+        a.is_Pow and a.exp.is_negative and a.base.has(*params) for a in expr.args)
+
+
+def _horner_args(expr, params, max_pow_expansion):
+    # Not polynomial as a whole, but its parts may be
+    args = [horner_form(a, params, max_pow_expansion) for a in expr.args]
+    return expr.func(*args, evaluate=False) if expr.is_Add or expr.is_Mul else expr.func(*args)
+
+
+def find_parameters(common, exprs, names=PARAMETERS):
+    '''
+    Curve and patch parameters used by the terms, by name
+    '''
+    free = set()
+    for _, expr in common:
+        free |= expr.free_symbols
+    for expr in exprs:
+        free |= expr.free_symbols
+    by_name = dict((s.name, s) for s in free if isinstance(s, Symbol))
+    return [by_name[n] for n in names if n in by_name]
+
+
+def optimize_terms(common, exprs, params=None, max_pow_expansion=0):
+    '''
+    cse() output with every term and output rewritten in Horner form in
+    params (by default whichever of t, u, v, w appear), each on its own,
+    so the terms cse found stay shared and nothing grows. horner_form only
+    keeps rewrites that save flops, so this never costs more than its input.
+    Returns (common, exprs) like cse.
+    '''
+    if params is None:
+        params = find_parameters(common, exprs)
+    if not params:
+        return (common, exprs)
+
+    rewrite = lambda e: horner_form(e, params, max_pow_expansion)
+    common = [(symbol, rewrite(expr)) for symbol, expr in common]
+    exprs = [_map_matrix(expr, rewrite) for expr in exprs]
+    return (common, exprs)
+
+
+def _map_matrix(expr, func):
+    if hasattr(expr, 'applyfunc'):
+        return expr.applyfunc(func)
+    return func(expr)
+
+
+def flatten_terms(common, exprs):
+    '''
+    Every expression that gets printed, matrices flattened to entries
+    '''
+    flat = [expr for _, expr in common]
+    for expr in exprs:
+        if hasattr(expr, 'applyfunc'):
+            flat.extend(expr)
+        else:
+            flat.append(expr)
+    return flat
+
+
+def format_flops(before, after=None):
+    '''
+    One line per kind as a C# comment, with before -> after when given
+    '''
+    lines = ["/* flops"]
+    for kind in FLOP_KINDS + ('total',):
+        b = total_flops(before) if kind == 'total' else before[kind]
+        if after is None:
+            lines.append("   %-6s %8i" % (kind, b))
+        else:
+            a = total_flops(after) if kind == 'total' else after[kind]
+            lines.append("   %-6s %8i -> %8i" % (kind, b, a))
+    lines.append("*/")
+    return "\n".join(lines)
@@ -0,0 +1,149 @@
+import numpy as np
+from ramjet.curves import bernstein_matrix, differentiate_curve_points_np
+
+'''
+Numeric tensor product patches
+
+Counterpart to make_bezier_patch_with_points and differentiate_patch_points_u/_v.
+Control points are laid out as (K, degree_v+1, degree_u+1, dim) arrays, so
+points[k][v][u] matches patch[vIdx][uIdx] in the symbolic builders. Degrees
+in u and v are independent, and dim is 3 for Euclidean or 4 for homogeneous
+(BASIS_4D) points.
+'''
+
+
+def differentiate_patch_points_u_np(points):
+    # u already runs along the control point axis the curve helper expects
+    return differentiate_curve_points_np(points)
+
+
+def differentiate_patch_points_v_np(points):
+    points = np.asarray(points, dtype=np.float64)
+    # Move v onto that axis and back
+    return np.swapaxes(differentiate_curve_points_np(np.swapaxes(points, -3, -2)), -3, -2)
+
+
+def _sample(points, bases_u, bases_v, shared):
+    if shared:
+        # Tensor product bases as one (S, rows*cols) matrix, then one matmul
+        num_samples = bases_u.shape[0]
+        bases = (bases_v[:, :, np.newaxis] * bases_u[:, np.newaxis, :]).reshape(num_samples, -1)
+        return np.matmul(bases, points.reshape(points.shape[0], -1, points.shape[-1]))
+
+    # Per patch samples: two batched matmuls beat einsum's loops by a wide margin,
+    # first over u giving rows (K, S, degree_v+1, dim), then over v
+    num_patches, rows, cols, dimensions = points.shape
+    num_samples = bases_u.shape[1]
+    by_u = np.ascontiguousarray(np.swapaxes(points, 1, 2)).reshape(num_patches, cols, rows * dimensions)
+    rows_at_u = np.matmul(bases_u, by_u).reshape(num_patches, num_samples, rows, dimensions)
+    return np.matmul(bases_v[:, :, np.newaxis, :], rows_at_u)[:, :, 0, :]
+
+
+def evaluate_patches(points, u, v):
+    '''
+    Evaluates K patches at S (u,v) samples in one go.
+
+    points: (K, degree_v+1, degree_u+1, dim), dim 3 or 4
+    u, v: (S,) samples shared by all patches, or (K, S) per patch
+
+    Returns (position, tangent_u, tangent_v, normal), each (K, S, 3), with the
+    normal being the unnormalized cross(tangent_u, tangent_v). Homogeneous
+    patches are projected: positions are divided by w, and tangents follow
+    the quotient rule, (X_u - P * w_u) / w.
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    u = np.asarray(u, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+
+    if points.ndim != 4:
+        raise Exception("Expected points of shape (K, degree_v+1, degree_u+1, dim), got %s" % (points.shape,))
+    if u.shape != v.shape or u.ndim not in (1, 2):
+        raise Exception("Expected u, v of equal shape (S,) or (K, S), got %s and %s" % (u.shape, v.shape))
+
+    dimensions = points.shape[-1]
+    if dimensions not in (3, 4):
+        raise Exception("Expected 3d or homogeneous 4d points, got %id" % dimensions)
+
+    degree_v = points.shape[1] - 1
+    degree_u = points.shape[2] - 1
+    shared = u.ndim == 1
+
+    bases_u = bernstein_matrix(degree_u, u)
+    bases_v = bernstein_matrix(degree_v, v)
+
+    pos = _sample(points, bases_u, bases_v, shared)
+
+    if degree_u > 0:
+        bases_u_d = bernstein_matrix(degree_u - 1, u)
+        du = _sample(differentiate_patch_points_u_np(points), bases_u_d, bases_v, shared)
+    else:
+        du = np.zeros_like(pos)
+
+    if degree_v > 0:
+        bases_v_d = bernstein_matrix(degree_v - 1, v)
+        dv = _sample(differentiate_patch_points_v_np(points), bases_u, bases_v_d, shared)
+    else:
+        dv = np.zeros_like(pos)
+
+    if dimensions == 4:
+        w = pos[..., 3:]
+        pos = pos[..., :3] / w
+        du = (du[..., :3] - pos * du[..., 3:]) / w
+        dv = (dv[..., :3] - pos * dv[..., 3:]) / w
+
+    normal = np.cross(du, dv)
+    return (pos, du, dv, normal)
+
+
+def evaluate_patch_derivative(points, u, v, order_u=0, order_v=0):
+    '''
+    Mixed partial d^(order_u + order_v) / du^order_u dv^order_v of K patches,
+    (K, S, dim), with no projection of homogeneous points.
+    '''
+    return evaluate_patch_derivatives(points, u, v, [(order_u, order_v)])[0]
+
+
+def evaluate_patch_derivatives(points, u, v, orders):
+    '''
+    Several mixed partials at once, given as a list of (order_u, order_v).
+    Bernstein bases and derivative nets are shared between them.
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    u = np.asarray(u, dtype=np.float64)
+    v = np.asarray(v, dtype=np.float64)
+
+    degree_v = points.shape[1] - 1
+    degree_u = points.shape[2] - 1
+    shared = u.ndim == 1
+
+    bases_u = {}
+    bases_v = {}
+    nets_u = {0: points}
+    results = []
+    for order_u, order_v in orders:
+        if order_u > degree_u or order_v > degree_v:
+            results.append(np.zeros(points.shape[:1] + u.shape[-1:] + points.shape[-1:]))
+            continue
+
+        if order_u not in nets_u:
+            nets_u[order_u] = differentiate_curve_points_np(points, order_u)
+        net = nets_u[order_u]
+        if order_v > 0:
+            net = np.swapaxes(differentiate_curve_points_np(np.swapaxes(net, -3, -2), order_v), -3, -2)
+
+        if order_u not in bases_u:
+            bases_u[order_u] = bernstein_matrix(degree_u - order_u, u)
+        if order_v not in bases_v:
+            bases_v[order_v] = bernstein_matrix(degree_v - order_v, v)
+
+        results.append(_sample(net, bases_u[order_u], bases_v[order_v], shared))
+
+    return results
+
+
+def uv_grid(count_u, count_v):
+    '''
+    Flattened (u, v) samples of a regular grid over the unit square
+    '''
+    u, v = np.meshgrid(np.linspace(0, 1, count_u), np.linspace(0, 1, count_v))
+    return (u.ravel(), v.ravel())
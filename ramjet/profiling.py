@@ -0,0 +1,269 @@
+import os
+import sys
+import json
+import time
+import functools
+import tracemalloc
+from sympy import Basic, Expr, count_ops
+from sympy.matrices import MatrixBase
+
+'''
+Per-stage profiling of derivations
+
+A derivation spends its time in a handful of stages: building Bezier
+curves and patches, expand, diff, subs, cse and printing code. Profiler
+wraps all of them for the duration of a with block, so any derivation can
+be profiled without touching it:
+
+    with Profiler(modules=['silhouettes']) as profiler:
+        silhouettes.silhouette_quadratic_3d_edge()
+    print(profiler.format_table())
+    profiler.write_json('edge.profile.json')
+
+or from the command line, python run_derivations.py <pattern> --profile.
+
+Every stage call records wall time, count_ops of its inputs and of its
+result, and optionally the tracemalloc peak above what was allocated when
+it started. Only the outermost stage is recorded: the subs calls a cse
+makes count towards that cse. Only calls made from the instrumented
+modules are recorded too: sympy calls expand and diff all over its own
+internals, and those belong to whichever stage called into sympy.
+
+Time spent counting ops and reading tracemalloc is kept out of the stage
+and total times, and reported on its own. tracemalloc also slows down
+every allocation while it runs, which can't be taken out again, so memory
+is off unless asked for.
+'''
+
+# Module level functions per stage, wrapped by name wherever they're
+# imported. Derivation scripts pull these in with import *, so the
+# derivation modules themselves need patching too.
+STAGE_FUNCTIONS = {
+    'build': [
+        'bezier_bases',
+        'make_bezier',
+        'make_bezier_patch_with_points',
+        'make_bezier_power',
+        'make_bezier_patch_power',
+        'differentiate_curve_points',
+        'differentiate_patch_points',
+        'differentiate_patch_points_u',
+        'differentiate_patch_points_v',
+        'triangular_patch',
+        'triangular_patch_with_points',
+        'triangular_patch_3d_du',
+        'triangular_patch_3d_dv',
+    ],
+    'expand': ['expand'],
+    'diff': ['diff'],
+    'subs': [],
+    'cse': ['cse'],
+    'codegen': ['print_code', 'print_pretty'],
+}
+
+STAGE_METHODS = [
+    (Expr, 'expand', 'expand'),
+    (MatrixBase, 'expand', 'expand'),
+    (Expr, 'diff', 'diff'),
+    (MatrixBase, 'diff', 'diff'),
+    (Basic, 'subs', 'subs'),
+    (MatrixBase, 'subs', 'subs'),
+]
+
+STAGES = list(STAGE_FUNCTIONS.keys())
+
+RAMJET_MODULES = ['ramjet.math', 'ramjet.util', 'ramjet.cache', 'ramjet.basis']
+
+
+def ops_of(value):
+    '''
+    count_ops over expressions, matrices and (nested) lists of them
+    '''
+    if isinstance(value, MatrixBase):
+        return sum(count_ops(e) for e in value)
+    if isinstance(value, Basic):
+        return count_ops(value)
+    if isinstance(value, (list, tuple)):
+        return sum(ops_of(v) for v in value)
+    if isinstance(value, dict):
+        return sum(ops_of(k) + ops_of(v) for k, v in value.items())
+    return 0
+
+
+class Profiler:
+    def __init__(self, modules=[], count=True, memory=False):
+        '''
+        modules: names of the derivation modules to instrument, on top of
+        ramjet's own. count and memory switch off count_ops and tracemalloc,
+        which are the expensive parts of profiling.
+        '''
+        self.modules = RAMJET_MODULES + list(modules)
+        self.count = count
+        self.memory = memory
+        self.trace = []
+        self.seconds = 0
+        self.overhead = 0
+
+        self._depth = 0
+        self._patched = []
+        self._wrappers = {}
+
+    def __enter__(self):
+        self._start_tracemalloc = self.memory and not tracemalloc.is_tracing()
+        if self._start_tracemalloc:
+            tracemalloc.start()
+
+        for module_name in self.modules:
+            module = sys.modules.get(module_name)
+            if module is None:
+                module = __import__(module_name, fromlist=['_'])
+            for stage, names in STAGE_FUNCTIONS.items():
+                for name in names:
+                    original = getattr(module, name, None)
+                    if callable(original):
+                        self._patch(module, name, self._wrap(stage, name, original))
+
+        for cls, name, stage in STAGE_METHODS:
+            original = cls.__dict__[name]
+            self._patch(cls, name, self._wrap(stage, '%s.%s' % (cls.__name__, name), original))
+
+        self.overhead = 0
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self._start - self.overhead
+
+        for owner, name, original in reversed(self._patched):
+            setattr(owner, name, original)
+        self._patched = []
+        self._wrappers = {}
+
+        if self._start_tracemalloc:
+            tracemalloc.stop()
+        return False
+
+    def _patch(self, owner, name, wrapper):
+        self._patched.append((owner, name, vars(owner)[name]))
+        setattr(owner, name, wrapper)
+
+    def _wrap(self, stage, name, original):
+        # The same function imported into several modules gets one wrapper
+        if original in self._wrappers:
+            return self._wrappers[original]
+
+        profiler = self
+
+        @functools.wraps(original)
+        def wrapper(*args, **kwargs):
+            if profiler._depth > 0:
+                return original(*args, **kwargs)
+            caller = sys._getframe(1)
+            if caller.f_globals.get('__name__') not in profiler.modules:
+                return original(*args, **kwargs)
+            return profiler._record(stage, name, original, caller, args, kwargs)
+
+        self._wrappers[original] = wrapper
+        return wrapper
+
+    def _record(self, stage, name, original, caller, args, kwargs):
+        entered = time.perf_counter()
+        entry = {
+            'stage': stage,
+            'name': name,
+            'caller': '%s:%i' % (os.path.basename(caller.f_code.co_filename), caller.f_lineno),
+        }
+
+        self._depth += 1
+        try:
+            if self.count:
+                entry['ops_before'] = ops_of(list(args))
+
+            if self.memory:
+                tracemalloc.reset_peak()
+                allocated = tracemalloc.get_traced_memory()[0]
+
+            start = time.perf_counter()
+            try:
+                result = original(*args, **kwargs)
+            except Exception as e:
+                # Keep failed calls in the trace, they're usually the interesting ones
+                entry['seconds'] = time.perf_counter() - start
+                entry['error'] = '%s: %s' % (type(e).__name__, e)
+                self.trace.append(entry)
+                raise
+            entry['seconds'] = time.perf_counter() - start
+
+            if self.memory:
+                entry['peak_kb'] = max(0, tracemalloc.get_traced_memory()[1] - allocated) // 1024
+            if self.count:
+                entry['ops_after'] = ops_of(result)
+        finally:
+            self._depth -= 1
+            self.overhead += time.perf_counter() - entered - entry.get('seconds', 0)
+
+        self.trace.append(entry)
+        return result
+
+    def summary(self):
+        '''
+        Per stage totals: calls, seconds, ops before and after, and the
+        largest peak of any single call
+        '''
+        totals = {}
+        for stage in STAGES:
+            totals[stage] = {'calls': 0, 'seconds': 0.0, 'ops_before': 0, 'ops_after': 0, 'peak_kb': 0}
+        for entry in self.trace:
+            total = totals[entry['stage']]
+            total['calls'] += 1
+            total['seconds'] += entry['seconds']
+            total['ops_before'] += entry.get('ops_before', 0)
+            total['ops_after'] += entry.get('ops_after', 0)
+            total['peak_kb'] = max(total['peak_kb'], entry.get('peak_kb', 0))
+        return totals
+
+    def to_json(self):
+        return {
+            'seconds': self.seconds,
+            'profiling_seconds': self.overhead,
+            'stages': self.summary(),
+            'trace': self.trace,
+        }
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_json(), f, indent=2)
+
+    def format_table(self, slowest=10):
+        '''
+        Per stage totals, followed by the slowest individual calls
+        '''
+        lines = []
+        lines.append("%-10s %7s %10s %7s %12s %12s %10s" % (
+            "stage", "calls", "seconds", "%", "ops in", "ops out", "peak KB"))
+
+        staged = 0.0
+        for stage, total in self.summary().items():
+            staged += total['seconds']
+            lines.append("%-10s %7i %10.3f %6.1f%% %12i %12i %10i" % (
+                stage, total['calls'], total['seconds'], self._percent(total['seconds']),
+                total['ops_before'], total['ops_after'], total['peak_kb']))
+
+        other = max(0.0, self.seconds - staged)
+        lines.append("%-10s %7s %10.3f %6.1f%%" % ("other", "", other, self._percent(other)))
+        lines.append("%-10s %7s %10.3f" % ("total", "", self.seconds))
+        lines.append("%-10s %7s %10.3f    (not in total)" % ("profiling", "", self.overhead))
+
+        if slowest > 0 and self.trace:
+            lines.append("")
+            lines.append("%-10s %-36s %-28s %10s %12s %12s" % (
+                "stage", "call", "caller", "seconds", "ops in", "ops out"))
+            for entry in sorted(self.trace, key=lambda e: -e['seconds'])[:slowest]:
+                lines.append("%-10s %-36s %-28s %10.3f %12s %12s" % (
+                    entry['stage'], entry['name'], entry['caller'], entry['seconds'],
+                    entry.get('ops_before', '-'), entry.get('ops_after', '-')))
+
+        return "\n".join(lines)
+
+    def _percent(self, seconds):
+        return 100.0 * seconds / self.seconds if self.seconds > 0 else 0.0
@@ -0,0 +1,295 @@
+import math
+import numpy as np
+from functools import lru_cache
+from ramjet.basis import bernstein_to_power_np, power_to_bernstein_np
+
+'''
+Real roots of polynomials in Bernstein form, over [0,1]
+
+silhouette_quadratic_3d_edge ends in a quintic in u, quadratic_curve_on_quadratic_patch
+in a degree 8 polynomial in t, and solveset has nothing useful to say about
+either. Numerically though, they're easy: a Bezier function lies within the
+convex hull of its control points (i/n, c_i), so
+
+- if all c_i share a strict sign, there's no root in the interval
+- otherwise every root lies where the hull crosses zero, [t_min, t_max]
+
+Bezier clipping repeatedly cuts the interval down to [t_min, t_max] (via
+de Casteljau), which converges quadratically on simple roots. Whenever a clip
+fails to at least halve the interval there's likely more than one root inside,
+so we split it in the middle instead.
+
+Everything runs on a queue of intervals shared by the whole batch, so the
+Python loop is over clipping rounds, not over polynomials.
+'''
+
+
+LEFTOVER_SAMPLES = 5
+
+
+def split_bernstein(coeffs, t):
+    '''
+    de Casteljau split of (M, n+1) Bernstein coefficients at per row t,
+    returns the (left, right) coefficients, each (M, n+1)
+    '''
+    degree = coeffs.shape[1] - 1
+    t = t[:, np.newaxis]
+
+    left = np.empty_like(coeffs)
+    right = np.empty_like(coeffs)
+    work = coeffs.copy()
+    left[:, 0] = work[:, 0]
+    right[:, degree] = work[:, degree]
+    for level in range(1, degree+1):
+        work = work[:, :-1] + t * (work[:, 1:] - work[:, :-1])
+        left[:, level] = work[:, 0]
+        right[:, degree-level] = work[:, -1]
+    return (left, right)
+
+
+def _evaluate(coeffs, t):
+    # Values of (M, n+1) Bernstein coefficients at per row t, NaN t aside
+    t = np.where(np.isfinite(t), t, 0.0)
+    left, _ = split_bernstein(coeffs, t)
+    return left[:, -1]
+
+
+def restrict_bernstein(coeffs, t_min, t_max):
+    '''
+    Coefficients of the same function over [t_min, t_max] of the current interval
+    '''
+    _, right = split_bernstein(coeffs, t_min)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(t_min < 1, (t_max - t_min) / (1 - t_min), 1.0)
+    left, _ = split_bernstein(right, t)
+    return left
+
+
+@lru_cache(maxsize=None)
+def _product_matrix(m, n):
+    # Coefficient k of the product collects a_i b_j with i+j = k, weighted
+    # C(m,i) C(n,j) / C(m+n,k); flattened (i, j) -> k
+    matrix = np.zeros(((m+1) * (n+1), m+n+1))
+    for i in range(0, m+1):
+        for j in range(0, n+1):
+            matrix[i*(n+1) + j, i+j] = math.comb(m, i) * math.comb(n, j) / math.comb(m+n, i+j)
+    matrix.flags.writeable = False
+    return matrix
+
+
+def bernstein_product(a, b):
+    '''
+    Bernstein coefficients of the product of polynomials a (..., m+1) and
+    b (..., n+1), as (..., m+n+1)
+    '''
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    m, n = a.shape[-1] - 1, b.shape[-1] - 1
+    outer = a[..., :, np.newaxis] * b[..., np.newaxis, :]
+    return outer.reshape(outer.shape[:-2] + (-1,)) @ _product_matrix(m, n)
+
+
+def reduce_bernstein(coeffs, degree):
+    '''
+    Bernstein coefficients of a lower degree, for polynomials whose higher
+    power coefficients are known to cancel: those are dropped, whatever is
+    left of them by rounding included
+    '''
+    coeffs = np.asarray(coeffs, dtype=np.float64)
+    current = coeffs.shape[-1] - 1
+    if degree > current:
+        raise Exception("Can't reduce degree %i coefficients to degree %i" % (current, degree))
+    if degree == current:
+        return coeffs
+    power = coeffs @ bernstein_to_power_np(current).T
+    return power[..., :degree+1] @ power_to_bernstein_np(degree).T
+
+
+def hull_crossing(coeffs):
+    '''
+    Where the convex hull of the control points (i/n, c_i) meets zero, as
+    (t_min, t_max, crosses) per row. The hull's crossing is spanned by the
+    crossings of all segments between control points, so we take those.
+    '''
+    num_rows, num_coeffs = coeffs.shape
+    degree = num_coeffs - 1
+    if degree == 0:
+        crosses = coeffs[:, 0] == 0
+        return (np.zeros(num_rows), np.ones(num_rows), crosses)
+
+    i, j = np.triu_indices(num_coeffs, 1)
+    c_i = coeffs[:, i]
+    c_j = coeffs[:, j]
+    x_i = i / degree
+    x_j = j / degree
+
+    straddles = c_i * c_j <= 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        fraction = np.where(c_i != c_j, c_i / (c_i - c_j), 0.0)
+    x = x_i + (x_j - x_i) * np.clip(fraction, 0, 1)
+
+    t_min = np.where(straddles, x, np.inf).min(axis=1)
+    t_max = np.where(straddles, x, -np.inf).max(axis=1)
+    crosses = straddles.any(axis=1)
+    return (t_min, t_max, crosses)
+
+
+def bernstein_roots(coeffs, tolerance=1e-10, max_rounds=200):
+    '''
+    All real roots in [0,1] of N polynomials given by Bernstein coefficients.
+
+    coeffs: (N, degree+1)
+
+    Returns (roots, counts): roots is (N, degree) sorted ascending and padded
+    with NaN, counts is (N,). Each reported root lies within tolerance of an
+    interval where the function's control polygon crosses zero, which holds
+    a true root for simple roots; clustered or multiple roots closer than
+    tolerance come back as one. Intervals max_rounds doesn't narrow down
+    are only reported where the function changes sign across them or comes
+    within tolerance of zero (coefficients scaled to a largest of 1), as
+    sampled at LEFTOVER_SAMPLES points. Polynomials that are identically zero get a count of -1.
+    '''
+    coeffs = np.asarray(coeffs, dtype=np.float64)
+    if coeffs.ndim != 2:
+        raise Exception("Expected coefficients of shape (N, degree+1), got %s" % (coeffs.shape,))
+
+    num_polys, num_coeffs = coeffs.shape
+    degree = num_coeffs - 1
+
+    # Normalize rows, it doesn't move the roots and keeps the hull test sane
+    scale = np.abs(coeffs).max(axis=1)
+    zero = scale == 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        work = np.where(zero[:, np.newaxis], 0.0, coeffs / scale[:, np.newaxis])
+
+    queue_poly = np.nonzero(~zero)[0]
+    queue_a = np.zeros(queue_poly.shape[0])
+    queue_b = np.ones(queue_poly.shape[0])
+    queue_coeffs = work[queue_poly]
+
+    found_poly = []
+    found_lo = []
+    found_hi = []
+
+    for i in range(0, max_rounds):
+        if queue_poly.shape[0] == 0:
+            break
+
+        t_min, t_max, crosses = hull_crossing(queue_coeffs)
+
+        queue_poly = queue_poly[crosses]
+        queue_a = queue_a[crosses]
+        queue_b = queue_b[crosses]
+        queue_coeffs = queue_coeffs[crosses]
+        t_min = t_min[crosses]
+        t_max = t_max[crosses]
+
+        width = queue_b - queue_a
+        lo = queue_a + t_min * width
+        hi = queue_a + t_max * width
+
+        # Narrow enough: report, this interval is done
+        done = (hi - lo) <= tolerance
+        found_poly.append(queue_poly[done])
+        found_lo.append(lo[done])
+        found_hi.append(hi[done])
+
+        keep = ~done
+        queue_poly = queue_poly[keep]
+        queue_a = queue_a[keep]
+        queue_b = queue_b[keep]
+        queue_coeffs = queue_coeffs[keep]
+        t_min = t_min[keep]
+        t_max = t_max[keep]
+        lo = lo[keep]
+        hi = hi[keep]
+
+        # Good clips shrink to the hull, poor ones split in half
+        clip = (t_max - t_min) <= 0.5
+        split = ~clip
+
+        clipped = restrict_bernstein(queue_coeffs[clip], t_min[clip], t_max[clip])
+
+        half = np.full(split.sum(), 0.5)
+        left, right = split_bernstein(queue_coeffs[split], half)
+        mid = 0.5 * (queue_a[split] + queue_b[split])
+
+        queue_poly = np.concatenate([queue_poly[clip], queue_poly[split], queue_poly[split]])
+        queue_a = np.concatenate([lo[clip], queue_a[split], mid])
+        queue_b = np.concatenate([hi[clip], mid, queue_b[split]])
+        queue_coeffs = np.concatenate([clipped, left, right])
+
+    # A hull can cross zero where the function doesn't, so intervals still
+    # open after max_rounds only count if the function changes sign, or
+    # comes within tolerance of zero for double roots, at one of a few
+    # samples across their hull crossing
+    if queue_poly.shape[0] > 0:
+        t_min, t_max, crosses = hull_crossing(queue_coeffs)
+        t_min, t_max = np.clip(t_min, 0, 1), np.clip(t_max, 0, 1)
+        values = np.stack([_evaluate(queue_coeffs, t_min + (t_max - t_min) * s)
+                           for s in np.linspace(0, 1, LEFTOVER_SAMPLES)], axis=1)
+        root = crosses & (((values.min(axis=1) <= 0) & (values.max(axis=1) >= 0)) |
+                          (np.abs(values).min(axis=1) <= tolerance))
+        width = queue_b - queue_a
+        found_poly.append(queue_poly[root])
+        found_lo.append((queue_a + t_min * width)[root])
+        found_hi.append((queue_a + t_max * width)[root])
+
+    return _gather_roots(num_polys, degree, zero, tolerance,
+                         np.concatenate(found_poly) if found_poly else np.zeros(0, dtype=np.int64),
+                         np.concatenate(found_lo) if found_lo else np.zeros(0),
+                         np.concatenate(found_hi) if found_hi else np.zeros(0))
+
+
+def _gather_roots(num_polys, degree, zero, tolerance, poly, lo, hi):
+    '''
+    Merges touching root intervals per polynomial and packs their midpoints
+    into a fixed width array
+    '''
+    roots = np.full((num_polys, max(degree, 1)), np.nan)
+    counts = np.zeros(num_polys, dtype=np.int64)
+    counts[zero] = -1
+
+    order = np.lexsort((lo, poly))
+    poly = poly[order]
+    lo = lo[order]
+    hi = hi[order]
+
+    # A new root starts at every new polynomial, or when there's a gap
+    # between this interval and the previous one
+    starts = np.ones(poly.shape[0], dtype=bool)
+    if poly.shape[0] > 1:
+        # Offset each polynomial's [0,1] by 2 * its index, so one running
+        # maximum over everything never leaks from one polynomial into the next
+        running_hi = np.maximum.accumulate(hi + 2 * poly) - 2 * poly
+        same_poly = poly[1:] == poly[:-1]
+        starts[1:] = ~same_poly | (lo[1:] > running_hi[:-1] + tolerance)
+
+    group = np.cumsum(starts) - 1
+    num_groups = group[-1] + 1 if group.shape[0] > 0 else 0
+    group_poly = poly[starts]
+    group_lo = lo[starts]
+    group_hi = np.full(num_groups, -np.inf)
+    np.maximum.at(group_hi, group, hi)
+    midpoints = 0.5 * (group_lo + group_hi)
+
+    # Slot of each group within its polynomial
+    first_group = np.searchsorted(group_poly, group_poly, side='left')
+    slot = np.arange(0, num_groups) - first_group
+
+    fits = slot < roots.shape[1]
+    roots[group_poly[fits], slot[fits]] = midpoints[fits]
+    np.add.at(counts, group_poly[fits], 1)
+    return (roots, counts)
+
+
+def polynomial_roots(coeffs, tolerance=1e-10):
+    '''
+    Same as bernstein_roots, for power basis coefficients ordered highest
+    power first like Poly.all_coeffs(). Only roots in [0,1] are returned.
+    '''
+    coeffs = np.asarray(coeffs, dtype=np.float64)
+    degree = coeffs.shape[1] - 1
+    power = coeffs[:, ::-1]  # lowest power first
+    bernstein = np.einsum('ij,nj->ni', power_to_bernstein_np(degree), power)
+    return bernstein_roots(bernstein, tolerance)
@@ -0,0 +1,145 @@
+import numpy as np
+from ramjet.patches import evaluate_patch_derivatives
+
+'''
+Batched silhouette solver for tensor product patches
+
+silhouettes.silhouette_quadratic_3d_gradient(_2nd) derive the gradient of
+dot(viewdir, normal)^2 symbolically. This is the runtime side: for many
+patches and a view point, find (u,v) where the view direction grazes the
+surface, i.e.
+
+g(u,v) = dot(pos - viewPoint, cross(pos_u, pos_v)) = 0
+
+Silhouettes are curves in (u,v), so each seed converges to its own point on
+them. We run Levenberg-Marquardt on the scalar residual g, with the
+minimum-norm step -g * grad(g) / (|grad(g)|^2 * (1 + lambda)). Since pos_u is
+orthogonal to the normal, grad(g) only needs the normal's derivatives:
+
+g_u = dot(pos - viewPoint, pos_uu x pos_v + pos_u x pos_uv)
+g_v = dot(pos - viewPoint, pos_uv x pos_v + pos_u x pos_vv)
+
+Convergence is measured on the cosine between view direction and normal,
+so the tolerance doesn't depend on the scale of the scene.
+'''
+
+
+def seed_grid(seeds_per_axis):
+    '''
+    (S, 2) seeds at the cell centers of a regular grid over the unit square
+    '''
+    steps = (np.arange(0, seeds_per_axis) + 0.5) / seeds_per_axis
+    u, v = np.meshgrid(steps, steps)
+    return np.stack([u.ravel(), v.ravel()], axis=-1)
+
+
+def silhouette_residual(points, viewpoint, u, v):
+    '''
+    Returns (g, g_u, g_v, cosine) at per patch samples u, v of shape (K, S)
+    '''
+    pos, du, dv, duu, duv, dvv = evaluate_patch_derivatives(
+        points, u, v, [(0, 0), (1, 0), (0, 1), (2, 0), (1, 1), (0, 2)])
+
+    viewdir = pos - viewpoint[:, np.newaxis, :]
+    normal = np.cross(du, dv)
+    normal_u = np.cross(duu, dv) + np.cross(du, duv)
+    normal_v = np.cross(duv, dv) + np.cross(du, dvv)
+
+    g = np.einsum('ksd,ksd->ks', viewdir, normal)
+    g_u = np.einsum('ksd,ksd->ks', viewdir, normal_u)
+    g_v = np.einsum('ksd,ksd->ks', viewdir, normal_v)
+
+    scale = np.linalg.norm(viewdir, axis=-1) * np.linalg.norm(normal, axis=-1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosine = np.where(scale > 0, np.abs(g) / scale, np.inf)
+
+    return (g, g_u, g_v, cosine)
+
+
+def solve_silhouettes(points, viewpoint, seeds=None, seeds_per_axis=3,
+                      max_iterations=32, tolerance=1e-9, damping=1e-3):
+    '''
+    Finds silhouette points on K patches, from S seeds per patch.
+
+    points: (K, degree_v+1, degree_u+1, 3), quadratic patches being (K, 3, 3, 3)
+    viewpoint: (3,) or (K, 3)
+    seeds: (S, 2) or (K, S, 2) starting (u,v), defaults to seed_grid(seeds_per_axis)
+
+    Returns (uv, converged, iterations) of shapes (K, S, 2), (K, S), (K, S).
+    Seeds that run off the patch or stall at a minimum of g^2 that isn't a
+    root come back with converged False.
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    num_patches = points.shape[0]
+
+    viewpoint = np.broadcast_to(np.asarray(viewpoint, dtype=np.float64), (num_patches, 3))
+
+    if seeds is None:
+        seeds = seed_grid(seeds_per_axis)
+    seeds = np.asarray(seeds, dtype=np.float64)
+    if seeds.ndim == 2:
+        seeds = np.broadcast_to(seeds, (num_patches,) + seeds.shape)
+
+    # Work on a flat list of seeds, so each iteration only touches the ones
+    # still going: (A, 1) samples on their own copy of the patch
+    shape = seeds.shape[:-1]
+    patch_of = np.repeat(np.arange(0, num_patches), shape[1])
+    u = seeds[..., 0].ravel().copy()
+    v = seeds[..., 1].ravel().copy()
+    lam = np.full(u.shape, damping)
+    slow_steps = np.zeros(u.shape, dtype=np.int64)
+    iterations = np.zeros(u.shape, dtype=np.int64)
+
+    def residual(seed_idx, u, v):
+        patches = patch_of[seed_idx]
+        results = silhouette_residual(points[patches], viewpoint[patches], u[:, np.newaxis], v[:, np.newaxis])
+        return [r[:, 0] for r in results]
+
+    everything = np.arange(0, u.shape[0])
+    g, g_u, g_v, cosine = residual(everything, u, v)
+    converged = cosine <= tolerance
+    active = everything[~converged]
+
+    for i in range(0, max_iterations):
+        if active.shape[0] == 0:
+            break
+
+        # Marquardt scaling: lambda is relative to the gradient, so unitless
+        grad_sq = g_u[active]**2 + g_v[active]**2
+        step = -g[active] / (grad_sq * (1 + lam[active]) + 1e-300)
+        u_new = np.clip(u[active] + step * g_u[active], 0, 1)
+        v_new = np.clip(v[active] + step * g_v[active], 0, 1)
+
+        # Seeds pushed against the patch border by the clamp won't get anywhere
+        moved = (u_new != u[active]) | (v_new != v[active])
+
+        g_new, g_u_new, g_v_new, cosine_new = residual(active, u_new, v_new)
+
+        # Newton near a root shrinks g by orders of magnitude per step, so a
+        # run of barely improving steps means we're sliding into a minimum
+        # of g^2 that isn't a root, typically along the patch border
+        improved = np.abs(g_new) < np.abs(g[active])
+        slow = improved & (np.abs(g_new) > 0.9 * np.abs(g[active]))
+        slow_steps[active] = np.where(slow, slow_steps[active] + 1, 0)
+
+        # Accept steps that reduce the residual and trust the model more,
+        # otherwise stay put and damp harder
+        accepted = active[improved]
+        u[accepted] = u_new[improved]
+        v[accepted] = v_new[improved]
+        g[accepted] = g_new[improved]
+        g_u[accepted] = g_u_new[improved]
+        g_v[accepted] = g_v_new[improved]
+        cosine[accepted] = cosine_new[improved]
+        lam[active] = np.where(improved, lam[active] * 0.1, lam[active] * 10)
+
+        iterations[active] += 1
+        converged = cosine <= tolerance
+
+        # Give up on seeds stuck at the border, sliding, or whose damping
+        # says no step is going to help
+        keep = ~converged[active] & moved & (slow_steps[active] < 4) & (lam[active] <= 1e12)
+        active = active[keep]
+
+    uv = np.stack([u, v], axis=-1).reshape(shape + (2,))
+    return (uv, converged.reshape(shape), iterations.reshape(shape))
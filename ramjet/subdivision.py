@@ -0,0 +1,262 @@
+import numpy as np
+from functools import lru_cache
+from ramjet.math import triangular_indices
+from ramjet.triangles import shifted_point_indices, triangle_degree
+
+'''
+de Casteljau subdivision of curves and patches, batched
+
+Splitting a Bezier net at a parameter gives the nets of both pieces, each
+of the same degree and each within the convex hull of the original. Root
+isolation, culling, intersection and tessellation all work by splitting
+until pieces are small or flat enough.
+
+Layouts are those of ramjet.curves, ramjet.patches and ramjet.triangles:
+
+- curves:    (N, degree+1, dim)
+- patches:   (K, degree_v+1, degree_u+1, dim)
+- triangles: (K, M, dim), points in ramjet.math.triangular_indices order
+
+with dim anything, 2d, 3d or homogeneous 4d points alike. Parameters are
+a scalar shared by the batch or one per net. Every function takes an
+optional out tuple of preallocated arrays, shaped like the input, to write
+the pieces into; this is what recursive subdivision wants, as the pieces
+of one round are the input of the next.
+'''
+
+
+def _outputs(points, count, out):
+    if out is None:
+        return tuple(np.empty_like(points) for _ in range(0, count))
+    if len(out) != count or any(o.shape != points.shape for o in out):
+        raise Exception("Expected %i output arrays of shape %s" % (count, points.shape))
+    return out
+
+
+def _batch_parameter(t, points):
+    # Scalar or (N,), shaped to broadcast over one control point's worth of a net
+    t = np.asarray(t, dtype=np.float64)
+    if t.ndim == 0:
+        return t
+    if t.shape != points.shape[:1]:
+        raise Exception("Expected one parameter per net, %i, got %s" % (points.shape[0], t.shape))
+    return t.reshape(t.shape + (1,) * (points.ndim - 2))
+
+
+def _split_axis(points, t, axis, left, right):
+    # de Casteljau along one axis of control points, every level in place
+    work = np.moveaxis(points, axis, 0).copy()
+    left_axis = np.moveaxis(left, axis, 0)
+    right_axis = np.moveaxis(right, axis, 0)
+
+    degree = work.shape[0] - 1
+    left_axis[0] = work[0]
+    right_axis[degree] = work[degree]
+    for level in range(1, degree+1):
+        count = degree + 1 - level
+        delta = work[1:count+1] - work[:count]
+        delta *= t
+        work[:count] += delta
+        left_axis[level] = work[0]
+        right_axis[degree-level] = work[count-1]
+    return (left, right)
+
+
+def split_curves(points, t=0.5, out=None):
+    '''
+    Splits N curves at t, giving the control points of [0, t] and [t, 1],
+    each (N, degree+1, dim)
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 3:
+        raise Exception("Expected points of shape (N, degree+1, dim), got %s" % (points.shape,))
+    left, right = _outputs(points, 2, out)
+    return _split_axis(points, _batch_parameter(t, points), 1, left, right)
+
+
+def _patch_points(points):
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 4:
+        raise Exception("Expected points of shape (K, degree_v+1, degree_u+1, dim), got %s" % (points.shape,))
+    return points
+
+
+def split_patches_u(points, u=0.5, out=None):
+    '''
+    Splits K patches at u, giving the patches over [0, u] and [u, 1] in u
+    '''
+    points = _patch_points(points)
+    left, right = _outputs(points, 2, out)
+    return _split_axis(points, _batch_parameter(u, points), 2, left, right)
+
+
+def split_patches_v(points, v=0.5, out=None):
+    '''
+    Splits K patches at v, giving the patches over [0, v] and [v, 1] in v
+    '''
+    points = _patch_points(points)
+    left, right = _outputs(points, 2, out)
+    return _split_axis(points, _batch_parameter(v, points), 1, left, right)
+
+
+def split_patches(points, u=0.5, v=0.5, out=None):
+    '''
+    Splits K patches at (u, v) into four, in the order
+    (low u low v, high u low v, low u high v, high u high v)
+    '''
+    points = _patch_points(points)
+    quarters = _outputs(points, 4, out)
+    low_u, high_u = split_patches_u(points, u)
+    v = _batch_parameter(v, points)
+    _split_axis(low_u, v, 1, quarters[0], quarters[2])
+    _split_axis(high_u, v, 1, quarters[1], quarters[3])
+    return quarters
+
+
+def _triangle_points(points):
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 3:
+        raise Exception("Expected points of shape (K, M, dim), got %s" % (points.shape,))
+    return points
+
+
+def _barycentric(uvw, points):
+    # (3,) shared or (K, 3) per triangle, to (K or 1, 1, 3)
+    uvw = np.asarray(uvw, dtype=np.float64)
+    if uvw.shape not in ((3,), (points.shape[0], 3)):
+        raise Exception("Expected barycentric (3,) or (%i, 3), got %s" % (points.shape[0], uvw.shape))
+    return uvw.reshape(-1, 1, 3)
+
+
+@lru_cache(maxsize=None)
+def _split_gather(degree):
+    # Every de Casteljau level stacked into one array, level r holding degree
+    # n-r points: where each sub-triangle's points sit in that stack.
+    # Sub-triangle a replaces corner a with the split point, and takes its
+    # point (i, j, k) from level ijk[a], at ijk with ijk[a] zeroed.
+    offsets = [0]
+    lookups = []
+    for level in range(0, degree+1):
+        indices = triangular_indices(degree - level)
+        lookups.append({tuple(ijk): n for n, ijk in enumerate(indices)})
+        offsets.append(offsets[-1] + len(indices))
+
+    gathers = []
+    for axis in range(0, 3):
+        gather = []
+        for ijk in triangular_indices(degree):
+            level = ijk[axis]
+            ijk = list(ijk)
+            ijk[axis] = 0
+            gather.append(offsets[level] + lookups[level][tuple(ijk)])
+        gathers.append(np.array(gather, dtype=np.int64))
+    return (offsets, gathers)
+
+
+def split_triangles(points, uvw, out=None):
+    '''
+    Splits K triangular patches at the barycentric point uvw into three,
+    each (K, M, dim). Piece a (0, 1, 2 for u, v, w) is the triangle with
+    corner a moved to uvw, so it keeps the edge opposite that corner.
+    '''
+    points = _triangle_points(points)
+    degree = triangle_degree(points.shape[1])
+    pieces = _outputs(points, 3, out)
+    uvw = _barycentric(uvw, points)
+
+    offsets, gathers = _split_gather(degree)
+    levels = np.empty((points.shape[0], offsets[-1], points.shape[2]))
+    levels[:, :offsets[1]] = points
+    for level in range(1, degree+1):
+        above = levels[:, offsets[level-1]:offsets[level]]
+        current = levels[:, offsets[level]:offsets[level+1]]
+        current[:] = 0.0
+        for axis in range(0, 3):
+            current += uvw[..., axis:axis+1] * above[:, shifted_point_indices(degree - level + 1, axis)]
+
+    for piece, gather in zip(pieces, gathers):
+        np.take(levels, gather, axis=1, out=piece)
+    return pieces
+
+
+@lru_cache(maxsize=None)
+def _blossom_arguments(degree):
+    # For point (i, j, k): which corner to blossom with at each level, i
+    # times the new u corner, j times v, k times w
+    corners = []
+    for i, j, k in triangular_indices(degree):
+        corners.append([0] * i + [1] * j + [2] * k)
+    return np.array(corners, dtype=np.int64).reshape(-1, degree)
+
+
+def _blossom(points, corners):
+    # One de Casteljau pyramid per output point, all run side by side:
+    # work is (K, M_out, M_level, dim)
+    degree = triangle_degree(points.shape[1])
+    arguments = _blossom_arguments(degree)
+    work = np.broadcast_to(points[:, np.newaxis], (points.shape[0], len(arguments)) + points.shape[1:])
+    for level in range(0, degree):
+        # (K or 1, M_out, 3) barycentric argument of each output at this level
+        uvw = corners[:, arguments[:, level]]
+        work = sum(uvw[..., axis, np.newaxis, np.newaxis] * work[:, :, shifted_point_indices(degree - level, axis)]
+                   for axis in range(0, 3))
+    return work[:, :, 0]
+
+
+@lru_cache(maxsize=64)
+def _restriction_matrix(degree, corners):
+    # Restricting is linear in the points, so for corners shared by the
+    # batch it's one (M, M) matrix: the restriction of the identity
+    num_points = (degree+1) * (degree+2) // 2
+    identity = np.eye(num_points)[np.newaxis]
+    matrix = _blossom(identity, np.array(corners).reshape(1, 3, 3))[0]
+    matrix.flags.writeable = False
+    return matrix
+
+
+def restrict_triangles(points, corners, out=None):
+    '''
+    Control points of K triangular patches over a sub-triangle, given by
+    the barycentric coordinates of its corners: (3, 3) shared or (K, 3, 3)
+    per patch, one row per corner of the new u, v, w. Point (i, j, k) of
+    the result is the blossom of the patch at i u corners, j v corners and
+    k w corners.
+    '''
+    points = _triangle_points(points)
+    degree = triangle_degree(points.shape[1])
+    corners = np.asarray(corners, dtype=np.float64)
+    if corners.shape not in ((3, 3), (points.shape[0], 3, 3)):
+        raise Exception("Expected corners (3, 3) or (%i, 3, 3), got %s" % (points.shape[0], corners.shape))
+
+    result = _outputs(points, 1, None if out is None else (out,))[0]
+    if degree == 0:
+        result[:] = points
+    elif corners.ndim == 2:
+        np.matmul(_restriction_matrix(degree, tuple(corners.ravel())), points, out=result)
+    else:
+        result[:] = _blossom(points, corners)
+    return result
+
+
+# Corners of the four midpoint children in the parent's barycentric
+# coordinates: the three corner triangles, then the middle one
+MIDPOINT_CORNERS = np.array([
+    [[1, 0, 0], [0.5, 0.5, 0], [0.5, 0, 0.5]],
+    [[0.5, 0.5, 0], [0, 1, 0], [0, 0.5, 0.5]],
+    [[0.5, 0, 0.5], [0, 0.5, 0.5], [0, 0, 1]],
+    [[0, 0.5, 0.5], [0.5, 0, 0.5], [0.5, 0.5, 0]],
+])
+MIDPOINT_CORNERS.flags.writeable = False
+
+
+def subdivide_triangles(points, out=None):
+    '''
+    Splits K triangular patches at their edge midpoints into four, the
+    corner children of u, v and w then the middle one, laid out as in
+    MIDPOINT_CORNERS. All four keep the parent's orientation.
+    '''
+    points = _triangle_points(points)
+    children = _outputs(points, 4, out)
+    for child, corners in zip(children, MIDPOINT_CORNERS):
+        restrict_triangles(points, corners, out=child)
+    return children
@@ -0,0 +1,620 @@
+import struct
+import numpy as np
+from functools import lru_cache
+from ramjet.emit import _opened
+from ramjet.curves import bernstein_matrix
+from ramjet.patches import evaluate_patches
+from ramjet.math import triangular_indices
+from ramjet.triangles import triangle_degree, evaluate_triangles, triangle_derivative
+
+'''
+Adaptive tessellation of Bezier patches into triangle meshes
+
+Each patch gets its own segment counts rather than one dense grid for all:
+an interior count per parameter direction, and one count per boundary
+edge. Counts come from the second differences of the control points, via
+the classic bound on how far a Bezier surface strays from its piecewise
+linear interpolant over a uniform m_u by m_v grid:
+
+    1/8 * (du(du-1) M_uu / m_u^2 + 2 du dv M_uv / (m_u m_v) + dv(dv-1) M_vv / m_v^2)
+
+with M_uu, M_uv and M_vv the largest second differences in the net. The
+curve version, n(n-1)/8 * M / m^2, sets the edge counts, and the same
+along the three edge directions covers triangular patches. Flat patches
+come out as two triangles, or one for triangular patches.
+
+Patches sharing an edge must place the same vertices along it, or the
+mesh cracks. Edges are matched by their control points, either way round,
+and every patch on an edge uses the largest count any of them asks for:
+their interior counts along it, and the curve bound of the edge itself.
+Where that's more than a patch's interior count, its interior grid is
+shrunk by one ring and stitched to the edge vertices, as hardware
+tessellators do.
+
+Evaluating each patch at its own edge parameters would still leave
+sharers a rounding error apart, more so when one runs the edge the other
+way. So each shared edge is evaluated once, as a curve in the orientation
+whose control points sort first, and every patch on it copies those
+positions in, reversed where it runs the other way: sharers get the very
+same floats. Normals stay per patch.
+
+Given a view point the tolerance becomes an angle, pixel size over focal
+length say: each patch and edge is held to tolerance * distance to its
+nearest control point (at least near), so far away patches get coarser.
+
+Homogeneous (4d) nets are measured in 4d, scaled by sqrt(1 + |x|^2) / w
+over the net, as projecting x = X / w moves an error in (X, w) by at most
+that much to first order. Close, but not a strict bound.
+
+Output streams in chunks of whole patches with at most chunk_vertices
+vertices each, as tuples (positions, normals, params, triangles, patch_ids):
+
+- positions, normals: (V, 3), normals unnormalized
+- params:             (V, 2) (u, v), or (V, 3) barycentric for triangles
+- triangles:          (T, 3) uint32 indices into the chunk, counterclockwise
+                      seen from the normal side
+- patch_ids:          (V,) index of the patch each vertex came from
+'''
+
+MAX_SEGMENTS = 64
+CHUNK_VERTICES = 65536
+
+MESH_MAGIC = b'RJMESH\0\0'
+MESH_VERSION = 1
+
+
+def _projected(points):
+    if points.shape[-1] == 4:
+        return points[..., :3] / points[..., 3:]
+    return points
+
+
+def _rational_scale(points, axes):
+    # First order factor from errors in homogeneous to projected points
+    if points.shape[-1] != 4:
+        return 1.0
+    projected = _projected(points)
+    extent = np.sqrt(1 + np.max(np.sum(projected * projected, axis=-1), axis=axes))
+    return extent / np.min(points[..., 3], axis=axes)
+
+
+def _max_norm(differences, axes):
+    if differences.size == 0:
+        return np.zeros(differences.shape[:1])
+    return np.linalg.norm(differences, axis=-1).max(axis=axes)
+
+
+def _segments(curvature, tolerance, max_segments):
+    # Smallest m with curvature / (8 m^2) <= tolerance
+    with np.errstate(divide='ignore', invalid='ignore'):
+        m = np.ceil(np.sqrt(curvature / (8 * tolerance)))
+    m = np.where(np.isfinite(m), m, max_segments)
+    return np.clip(m, 1, max_segments).astype(np.int64)
+
+
+def _tolerances(points, tolerance, view_point, near, axes):
+    # Per net tolerance, scaled by distance in screen space mode
+    if view_point is None:
+        return np.full(points.shape[:1], float(tolerance))
+    distance = np.linalg.norm(points - np.asarray(view_point, dtype=np.float64), axis=-1).min(axis=axes)
+    return tolerance * np.maximum(distance, near)
+
+
+def _curve_segments(edges, tolerance, view_point, near, max_segments):
+    # edges: (E, n+1, dim)
+    degree = edges.shape[1] - 1
+    curvature = degree * (degree - 1) * _max_norm(np.diff(edges, n=2, axis=1), (1,))
+    curvature = curvature * _rational_scale(edges, (1,))
+    return _segments(curvature, _tolerances(_projected(edges), tolerance, view_point, near, (1,)), max_segments)
+
+
+def _canonical_edges(edges):
+    # (ids, reversed) of edges (E, n+1, dim): ids as in shared_edges, and
+    # True where an edge runs against its canonical orientation, the one
+    # of its two control point orders that sorts first
+    num_edges = edges.shape[0]
+    rows = np.concatenate([edges.reshape(num_edges, -1), edges[:, ::-1].reshape(num_edges, -1)])
+    _, inverse = np.unique(rows, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    forward, backward = inverse[:num_edges], inverse[num_edges:]
+    return (np.minimum(forward, backward), backward < forward)
+
+
+def shared_edges(edges):
+    '''
+    (E,) ids of E edge control polygons, (E, n+1, dim), equal for edges
+    with the same control points in either direction
+    '''
+    return _canonical_edges(edges)[0]
+
+
+def _by_length(edges):
+    # Only edges of the same degree can be shared
+    by_length = {}
+    for side, edge in enumerate(edges):
+        by_length.setdefault(edge.shape[1], []).append(side)
+    return by_length.values()
+
+
+def _edge_segments(edges, interior, tolerance, view_point, near, max_segments):
+    # edges: list of (K, n+1, dim) per side, interior: list of (K,) counts
+    # along each. Returns one (K,) count per side, agreed between sharers.
+    counts = []
+    for edge, inner in zip(edges, interior):
+        bound = _curve_segments(edge, tolerance, view_point, near, max_segments)
+        counts.append(np.maximum(bound, inner))
+
+    for sides in _by_length(edges):
+        ids = shared_edges(np.concatenate([edges[side] for side in sides]))
+        merged = np.concatenate([counts[side] for side in sides])
+        agreed = np.zeros(ids.max() + 1, dtype=np.int64)
+        np.maximum.at(agreed, ids, merged)
+        for n, side in enumerate(sides):
+            counts[side] = agreed[ids[n * len(counts[side]):(n + 1) * len(counts[side])]]
+    return counts
+
+
+def _edge_vertices(edges, counts):
+    '''
+    Projected vertices along every edge, evaluated once per shared edge in
+    its canonical orientation. edges and counts are one (K, n+1, dim) and
+    one (K,) per side, counts agreed by _edge_segments. Returns (positions
+    (E, 3), starts (S, K), reversed (S, K)) for S sides: vertex k of side
+    s of patch i is positions[starts[s, i] + k], or + counts[s][i] - k
+    where reversed[s, i].
+    '''
+    blocks = []
+    total = 0
+    starts = [None] * len(edges)
+    reversed_ = [None] * len(edges)
+    for sides in _by_length(edges):
+        num_patches = len(edges[sides[0]])
+        merged = np.concatenate([edges[side] for side in sides])
+        ids, flipped = _canonical_edges(merged)
+        _, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+
+        canonical = np.where(flipped[first, np.newaxis, np.newaxis], merged[first, ::-1], merged[first])
+        edge_counts = np.concatenate([counts[side] for side in sides])[first]
+        edge_starts = np.concatenate([[0], np.cumsum(edge_counts + 1)[:-1]])
+        block = np.empty((edge_starts[-1] + edge_counts[-1] + 1, 3))
+
+        # One batched evaluation per count
+        degree = merged.shape[1] - 1
+        for count in np.unique(edge_counts):
+            selected = np.flatnonzero(edge_counts == count)
+            along = np.arange(0, count+1)
+            points = bernstein_matrix(degree, along / count) @ canonical[selected]
+            block[edge_starts[selected, np.newaxis] + along] = _projected(points)
+
+        for n, side in enumerate(sides):
+            patches = slice(n * num_patches, (n + 1) * num_patches)
+            starts[side] = total + edge_starts[inverse.reshape(-1)[patches]]
+            reversed_[side] = flipped[patches]
+        blocks.append(block)
+        total += len(block)
+    return (np.concatenate(blocks), np.stack(starts), np.stack(reversed_))
+
+
+def _patch_edges(points):
+    # Edge control polygons v=0, u=1, v=1, u=0, each running along u or v
+    return [points[:, 0], points[:, :, -1], points[:, -1], points[:, :, 0]]
+
+
+def patch_segments(points, tolerance, view_point=None, near=1e-3, max_segments=MAX_SEGMENTS):
+    '''
+    (K, 6) segment counts of K tensor product patches: interior m_u, m_v,
+    then the edges v=0, u=1, v=1, u=0
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    projected = _projected(points)
+    degree_v = points.shape[1] - 1
+    degree_u = points.shape[2] - 1
+
+    scale = _rational_scale(points, (1, 2))
+    m_uu = scale * _max_norm(np.diff(points, n=2, axis=2), (1, 2))
+    m_vv = scale * _max_norm(np.diff(points, n=2, axis=1), (1, 2))
+    m_uv = scale * _max_norm(np.diff(np.diff(points, axis=1), axis=2), (1, 2))
+
+    # Split so the three terms of the bound add up to at most tolerance,
+    # 8/3 rather than 8 as each direction carries its share of the mixed one
+    tolerances = _tolerances(projected, tolerance, view_point, near, (1, 2))
+    uu = degree_u * (degree_u - 1) * m_uu
+    vv = degree_v * (degree_v - 1) * m_vv
+    uv = degree_u * degree_v * m_uv
+    m_u = _segments(3 * (uu + uv), tolerances, max_segments)
+    m_v = _segments(3 * (vv + uv), tolerances, max_segments)
+
+    counts = _edge_segments(_patch_edges(points), [m_u, m_v, m_u, m_v], tolerance, view_point, near, max_segments)
+    return np.stack([m_u, m_v] + counts, axis=-1)
+
+
+@lru_cache(maxsize=None)
+def _triangle_stencils(degree):
+    # Second differences of a triangular net along the three edge
+    # directions, as index triples (a, b, c) for p_a - 2 p_b + p_c
+    lookup = {tuple(ijk): n for n, ijk in enumerate(triangular_indices(degree))}
+    stencils = []
+    for ijk in triangular_indices(degree - 2):
+        for a, b in [(0, 1), (1, 2), (2, 0)]:
+            first = list(ijk)
+            middle = list(ijk)
+            last = list(ijk)
+            first[a] += 2
+            middle[a] += 1
+            middle[b] += 1
+            last[b] += 2
+            stencils.append((lookup[tuple(first)], lookup[tuple(middle)], lookup[tuple(last)]))
+    return np.array(stencils, dtype=np.int64).reshape(-1, 3)
+
+
+@lru_cache(maxsize=None)
+def _triangle_edges(degree):
+    # Point indices along the edge where coordinate a is zero, running from
+    # the corner of a+2 to the corner of a+1
+    edges = []
+    for axis in range(0, 3):
+        along = (axis + 1) % 3
+        edge = [(n, ijk[along]) for n, ijk in enumerate(triangular_indices(degree)) if ijk[axis] == 0]
+        edges.append([n for n, _ in sorted(edge, key=lambda e: e[1])])
+    return np.array(edges, dtype=np.int64)
+
+
+def _triangle_edge_points(points):
+    return [points[:, edge] for edge in _triangle_edges(triangle_degree(points.shape[1]))]
+
+
+def triangle_segments(points, tolerance, view_point=None, near=1e-3, max_segments=MAX_SEGMENTS):
+    '''
+    (K, 4) segment counts of K triangular patches: interior m, then the
+    edges u=0, v=0, w=0
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    projected = _projected(points)
+    degree = triangle_degree(points.shape[1])
+
+    # Twice the curve bound: a triangle spans two independent directions
+    curvature = np.zeros(points.shape[:1])
+    if degree >= 2:
+        a, b, c = _triangle_stencils(degree).T
+        curvature = 2 * degree * (degree - 1) * _max_norm(points[:, a] - 2 * points[:, b] + points[:, c], (1,))
+        curvature = curvature * _rational_scale(points, (1,))
+    m = _segments(curvature, _tolerances(projected, tolerance, view_point, near, (1,)), max_segments)
+
+    counts = _edge_segments(_triangle_edge_points(points), [m, m, m], tolerance, view_point, near, max_segments)
+    return np.stack([m] + counts, axis=-1)
+
+
+''' Templates: (params, triangles) per combination of segment counts '''
+
+
+class _TemplateBuilder:
+    def __init__(self):
+        self.params = []
+        self.ids = {}
+        self.triangles = []
+
+    def vertex(self, param):
+        # Edge vertices are made by every side touching them, keep one
+        key = tuple(round(p, 12) for p in param)
+        if key not in self.ids:
+            self.ids[key] = len(self.params)
+            self.params.append(param)
+        return self.ids[key]
+
+    def stitch(self, outer, inner):
+        # Strip between two vertex rows, each a list of (param along the
+        # side, vertex id) running the same way
+        a = 0
+        b = 0
+        while a < len(outer) - 1 or b < len(inner) - 1:
+            if b == len(inner) - 1 or (a < len(outer) - 1 and outer[a+1][0] <= inner[b+1][0]):
+                self.triangles.append((outer[a][1], outer[a+1][1], inner[b][1]))
+                a += 1
+            else:
+                self.triangles.append((outer[a][1], inner[b+1][1], inner[b][1]))
+                b += 1
+
+    def build(self):
+        params = np.array(self.params, dtype=np.float64)
+        triangles = np.array(self.triangles, dtype=np.uint32).reshape(-1, 3)
+
+        # Counterclockwise in (u, v), which is the normal's side
+        uv = params[:, :2]
+        e1 = uv[triangles[:, 1]] - uv[triangles[:, 0]]
+        e2 = uv[triangles[:, 2]] - uv[triangles[:, 0]]
+        flip = e1[:, 0] * e2[:, 1] - e1[:, 1] * e2[:, 0] < 0
+        triangles[flip] = triangles[flip][:, [0, 2, 1]]
+
+        params.flags.writeable = False
+        triangles.flags.writeable = False
+        return (params, triangles)
+
+
+def _grid(builder, columns, rows, start_u, end_u, start_v, end_v):
+    # Regular grid of quads, two triangles each
+    # Zero columns or rows is a single line of vertices, the inner grid of a ring
+    ids = [[builder.vertex((start_u + (end_u - start_u) * i / max(columns, 1),
+                            start_v + (end_v - start_v) * j / max(rows, 1)))
+            for i in range(0, columns+1)] for j in range(0, rows+1)]
+    for j in range(0, rows):
+        for i in range(0, columns):
+            builder.triangles.append((ids[j][i], ids[j][i+1], ids[j+1][i+1]))
+            builder.triangles.append((ids[j][i], ids[j+1][i+1], ids[j+1][i]))
+    return ids
+
+
+@lru_cache(maxsize=4096)
+def patch_template(segments):
+    '''
+    (params (V, 2), triangles (T, 3)) for counts as given by patch_segments
+    '''
+    m_u, m_v, bottom, right, top, left = segments
+    builder = _TemplateBuilder()
+    if (bottom, top, right, left) == (m_u, m_u, m_v, m_v):
+        _grid(builder, m_u, m_v, 0.0, 1.0, 0.0, 1.0)
+        return builder.build()
+
+    # Interior grid one ring in, then the ring stitched side by side
+    m_u = max(m_u, 2)
+    m_v = max(m_v, 2)
+    inner = _grid(builder, m_u - 2, m_v - 2, 1 / m_u, 1 - 1 / m_u, 1 / m_v, 1 - 1 / m_v)
+
+    def edge(count, fixed, axis):
+        vertices = []
+        for k in range(0, count+1):
+            s = k / count
+            param = (s, fixed) if axis == 0 else (fixed, s)
+            vertices.append((s, builder.vertex(param)))
+        return vertices
+
+    def inner_side(ids, axis):
+        return [(builder.params[i][axis], i) for i in ids]
+
+    builder.stitch(edge(bottom, 0.0, 0), inner_side(inner[0], 0))
+    builder.stitch(edge(top, 1.0, 0), inner_side(inner[-1], 0))
+    builder.stitch(edge(left, 0.0, 1), inner_side([row[0] for row in inner], 1))
+    builder.stitch(edge(right, 1.0, 1), inner_side([row[-1] for row in inner], 1))
+    return builder.build()
+
+
+def _triangle_grid(builder, m, offset, scale):
+    # Regular triangular grid of level m, scaled and offset in (u, v, w)
+    def vertex(i, j):
+        k = m - i - j
+        return builder.vertex(tuple(offset + scale * c / max(m, 1) for c in (i, j, k)))
+
+    ids = dict(((i, j), vertex(i, j)) for i in range(0, m+1) for j in range(0, m+1-i))
+    for i in range(0, m):
+        for j in range(0, m-i):
+            builder.triangles.append((ids[(i, j)], ids[(i+1, j)], ids[(i, j+1)]))
+            if i + j + 2 <= m:
+                builder.triangles.append((ids[(i+1, j)], ids[(i+1, j+1)], ids[(i, j+1)]))
+    return ids
+
+
+@lru_cache(maxsize=4096)
+def triangle_template(segments):
+    '''
+    (params (V, 3), triangles (T, 3)) for counts as given by triangle_segments
+    '''
+    m = segments[0]
+    edges = segments[1:]
+    builder = _TemplateBuilder()
+    if all(e == m for e in edges):
+        _triangle_grid(builder, m, 0.0, 1.0)
+        return builder.build()
+
+    # Inner triangle at integer coordinates >= 1 of a level m grid, which
+    # is a level m-3 grid of its own
+    m = max(m, 3)
+    inner = _triangle_grid(builder, m - 3, 1 / m, (m - 3) / m)
+    inner_params = [(builder.params[i], i) for i in set(inner.values())]
+
+    for axis in range(0, 3):
+        along = (axis + 1) % 3
+        other = (axis + 2) % 3
+        count = edges[axis]
+        outer = []
+        for k in range(0, count+1):
+            param = [0.0, 0.0, 0.0]
+            param[along] = k / count
+            param[other] = 1 - k / count
+            outer.append((k / count, builder.vertex(tuple(param))))
+
+        # Inner vertices next to this edge, at coordinate 1/m, by the same
+        # parameter along it
+        side = [(p[along] / (p[along] + p[other]), i) for p, i in inner_params if abs(p[axis] - 1 / m) < 1e-12]
+        builder.stitch(outer, sorted(side))
+    return builder.build()
+
+
+''' Evaluation and chunking '''
+
+# Template vertices on each edge, as (axis fixed, its value, axis along),
+# in the order and direction of _patch_edges and _triangle_edges
+PATCH_SIDES = [(1, 0.0, 0), (0, 1.0, 1), (1, 1.0, 0), (0, 0.0, 1)]
+TRIANGLE_SIDES = [(axis, 0.0, (axis + 1) % 3) for axis in range(0, 3)]
+
+
+def _side_vertices(params, side):
+    # Template vertex ids along one side, by increasing parameter
+    fixed, value, along = side
+    ids = np.flatnonzero(params[:, fixed] == value)
+    return ids[np.argsort(params[ids, along], kind='stable')]
+
+
+def _edge_layout(params, sides):
+    # Edge vertices of a template, all sides in one go, as (vertex ids,
+    # side, index along the side, last index on the side)
+    ids = [_side_vertices(params, side) for side in sides]
+    return (np.concatenate(ids),
+            np.concatenate([np.full(len(i), n) for n, i in enumerate(ids)]),
+            np.concatenate([np.arange(0, len(i)) for i in ids]),
+            np.concatenate([np.full(len(i), len(i) - 1) for i in ids]))
+
+
+def _evaluate_patches(points, params):
+    pos, _, _, normal = evaluate_patches(points, params[:, 0], params[:, 1])
+    return (pos, normal)
+
+
+def _evaluate_triangles(points, params):
+    pos, du, dv = evaluate_triangles(points, params)
+    dw = triangle_derivative(points, params, 2)
+    if points.shape[-1] == 4:
+        # Quotient rule, like evaluate_patches does for rational patches
+        w = pos[..., 3:]
+        pos = pos[..., :3] / w
+        du, dv, dw = [(d[..., :3] - pos * d[..., 3:]) / w for d in (du, dv, dw)]
+    return (pos, np.cross(du - dw, dv - dw))
+
+
+def _chunks(points, segments, template, evaluate, edges, sides, chunk_vertices):
+    keys = [tuple(int(s) for s in row) for row in segments]
+    templates = [template(key) for key in keys]
+
+    layouts = {}
+    for key, (params, _) in zip(keys, templates):
+        if key not in layouts:
+            layouts[key] = _edge_layout(params, sides)
+
+    start = 0
+    while start < len(keys):
+        # Whole patches, as many as fit
+        end = start
+        num_vertices = 0
+        while end < len(keys) and (end == start or num_vertices + len(templates[end][0]) <= chunk_vertices):
+            num_vertices += len(templates[end][0])
+            end += 1
+        yield _build_chunk(points, keys, templates, evaluate, edges, layouts, start, end)
+        start = end
+
+
+def _build_chunk(points, keys, templates, evaluate, edges, layouts, start, end):
+    offsets = np.cumsum([0] + [len(templates[i][0]) for i in range(start, end)])
+    num_vertices = offsets[-1]
+    positions = np.empty((num_vertices, 3))
+    normals = np.empty((num_vertices, 3))
+    params = np.empty((num_vertices, templates[start][0].shape[1]))
+    patch_ids = np.empty(num_vertices, dtype=np.int64)
+
+    # One batched evaluation per distinct template in the chunk
+    groups = {}
+    for i in range(start, end):
+        groups.setdefault(keys[i], []).append(i)
+    for key, members in groups.items():
+        template_params = templates[members[0]][0]
+        pos, normal = evaluate(points[members], template_params)
+        for n, i in enumerate(members):
+            vertices = slice(offsets[i - start], offsets[i - start + 1])
+            positions[vertices] = pos[n]
+            normals[vertices] = normal[n]
+            params[vertices] = template_params
+            patch_ids[vertices] = i
+
+    # Edge vertices from the one evaluation of each edge, see _edge_vertices
+    edge_positions, edge_starts, edge_reversed = edges
+    chunk_layouts = [layouts[keys[i]] for i in range(start, end)]
+    ids, side, along, last = [np.concatenate([layout[n] for layout in chunk_layouts]) for n in range(0, 4)]
+    patch = np.repeat(np.arange(start, end), [len(layout[0]) for layout in chunk_layouts])
+    along = np.where(edge_reversed[side, patch], last - along, along)
+    positions[offsets[patch - start] + ids] = edge_positions[edge_starts[side, patch] + along]
+
+    triangles = np.concatenate([templates[i][1] + np.uint32(offsets[i - start]) for i in range(start, end)])
+    return (positions, normals, params, triangles, patch_ids)
+
+
+def tessellate_patch_chunks(points, tolerance, view_point=None, near=1e-3,
+                            max_segments=MAX_SEGMENTS, chunk_vertices=CHUNK_VERTICES):
+    '''
+    Tessellates K tensor product patches, (K, degree_v+1, degree_u+1, dim)
+    with dim 3 or 4, yielding mesh chunks as described above
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 4 or points.shape[-1] not in (3, 4):
+        raise Exception("Expected points of shape (K, degree_v+1, degree_u+1, 3 or 4), got %s" % (points.shape,))
+    segments = patch_segments(points, tolerance, view_point, near, max_segments)
+    edges = _edge_vertices(_patch_edges(points), list(segments[:, 2:].T))
+    return _chunks(points, segments, patch_template, _evaluate_patches, edges, PATCH_SIDES, chunk_vertices)
+
+
+def tessellate_triangle_chunks(points, tolerance, view_point=None, near=1e-3,
+                               max_segments=MAX_SEGMENTS, chunk_vertices=CHUNK_VERTICES):
+    '''
+    Tessellates K triangular patches, (K, M, dim) with dim 3 or 4,
+    yielding mesh chunks as described above
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    if points.ndim != 3 or points.shape[-1] not in (3, 4):
+        raise Exception("Expected points of shape (K, M, 3 or 4), got %s" % (points.shape,))
+    segments = triangle_segments(points, tolerance, view_point, near, max_segments)
+    edges = _edge_vertices(_triangle_edge_points(points), list(segments[:, 1:].T))
+    return _chunks(points, segments, triangle_template, _evaluate_triangles, edges, TRIANGLE_SIDES, chunk_vertices)
+
+
+def merge_chunks(chunks):
+    '''
+    One (positions, normals, params, triangles, patch_ids) mesh from chunks
+    '''
+    chunks = list(chunks)
+    offsets = np.cumsum([0] + [len(chunk[0]) for chunk in chunks])
+    merged = [np.concatenate([chunk[n] for chunk in chunks]) for n in (0, 1, 2)]
+    triangles = np.concatenate([chunk[3].astype(np.int64) + offset for chunk, offset in zip(chunks, offsets)])
+    patch_ids = np.concatenate([chunk[4] for chunk in chunks])
+    return tuple(merged) + (triangles, patch_ids)
+
+
+def tessellate_patches(points, tolerance, **settings):
+    return merge_chunks(tessellate_patch_chunks(points, tolerance, **settings))
+
+
+def tessellate_triangles(points, tolerance, **settings):
+    return merge_chunks(tessellate_triangle_chunks(points, tolerance, **settings))
+
+
+''' Binary meshes '''
+
+
+def write_mesh(target, chunks):
+    '''
+    Streams chunks to a path or binary file: magic and version, then per
+    chunk the vertex and triangle counts (uint32), float32 positions and
+    normals, and uint32 triangles, ending with an empty chunk. Returns the
+    vertex and triangle totals.
+    '''
+    num_vertices = 0
+    num_triangles = 0
+    with _opened(target, 'wb') as f:
+        f.write(MESH_MAGIC + struct.pack('<I', MESH_VERSION))
+        for positions, normals, _, triangles, _ in chunks:
+            f.write(struct.pack('<II', len(positions), len(triangles)))
+            f.write(positions.astype('<f4').tobytes())
+            f.write(normals.astype('<f4').tobytes())
+            f.write(triangles.astype('<u4').tobytes())
+            num_vertices += len(positions)
+            num_triangles += len(triangles)
+        f.write(struct.pack('<II', 0, 0))
+    return (num_vertices, num_triangles)
+
+
+def read_mesh(source):
+    '''
+    Chunks of a mesh written by write_mesh, as (positions, normals, triangles)
+    '''
+    chunks = []
+    with _opened(source, 'rb') as f:
+        header = f.read(len(MESH_MAGIC) + 4)
+        if header[:len(MESH_MAGIC)] != MESH_MAGIC:
+            raise Exception("%s is not a ramjet mesh" % source)
+        version, = struct.unpack('<I', header[len(MESH_MAGIC):])
+        if version != MESH_VERSION:
+            raise Exception("Unsupported mesh version %i" % version)
+
+        while True:
+            num_vertices, num_triangles = struct.unpack('<II', f.read(8))
+            if num_vertices == 0 and num_triangles == 0:
+                return chunks
+            positions = np.frombuffer(f.read(num_vertices * 12), dtype='<f4').reshape(-1, 3)
+            normals = np.frombuffer(f.read(num_vertices * 12), dtype='<f4').reshape(-1, 3)
+            triangles = np.frombuffer(f.read(num_triangles * 12), dtype='<u4').reshape(-1, 3)
+            chunks.append((positions, normals, triangles))
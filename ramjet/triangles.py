@@ -0,0 +1,125 @@
+import math
+from functools import lru_cache
+import numpy as np
+from ramjet.math import triangular_indices
+
+'''
+Numeric triangular (barycentric) Bezier patches
+
+Counterpart to triangular_patch_with_points and triangular_patch_3d_du/_dv
+in triangular_patch.py. Control points are laid out as (K, M, dim) arrays
+with M = (degree+1)(degree+2)/2 points per patch, in the same order the
+symbolic builders consume them (002, 011, 020, 101, 110, 200 for quadratics).
+
+Barycentric samples are (S, 3) arrays of (u, v, w), shared by all patches,
+or (K, S, 3) per patch.
+'''
+
+
+@lru_cache(maxsize=None)
+def _index_array(degree):
+    # ramjet.math.triangular_indices as an (M, 3) int array
+    indices = np.array(triangular_indices(degree), dtype=np.int64).reshape(-1, 3)
+    indices.flags.writeable = False
+    return indices
+
+
+@lru_cache(maxsize=None)
+def multinomial_weights(degree):
+    '''
+    Exact n! / (i! j! k!) per point, as python ints and as float64
+    '''
+    exact = tuple(math.factorial(degree) // (math.factorial(i) * math.factorial(j) * math.factorial(k))
+                  for i, j, k in triangular_indices(degree))
+    weights = np.array(exact, dtype=np.float64)
+    weights.flags.writeable = False
+    return (exact, weights)
+
+
+@lru_cache(maxsize=None)
+def shifted_point_indices(degree, axis):
+    '''
+    For each (i, j, k) of degree-1, the index of the degree point with
+    one added along axis (0 for u, 1 for v, 2 for w): p_(i+1)jk for u.
+    '''
+    lookup = {ijk: n for n, ijk in enumerate(triangular_indices(degree))}
+    shifted = []
+    for ijk in triangular_indices(degree-1):
+        ijk = list(ijk)
+        ijk[axis] += 1
+        shifted.append(lookup[tuple(ijk)])
+    shifted = np.array(shifted, dtype=np.int64)
+    shifted.flags.writeable = False
+    return shifted
+
+
+def triangle_bases(degree, uvw):
+    '''
+    All degree n Bernstein bases n!/(i!j!k!) u^i v^j w^k at the given
+    barycentric samples. Returns uvw.shape[:-1] + (M,)
+    '''
+    uvw = np.asarray(uvw, dtype=np.float64)
+    indices = _index_array(degree)
+    _, weights = multinomial_weights(degree)
+
+    # powers[..., p, axis] = uvw[..., axis] ** p, built by repeated products
+    powers = np.empty(uvw.shape[:-1] + (degree+1, 3))
+    powers[..., 0, :] = 1.0
+    for p in range(1, degree+1):
+        powers[..., p, :] = powers[..., p-1, :] * uvw
+
+    bases = powers[..., indices[:, 0], 0] * powers[..., indices[:, 1], 1] * powers[..., indices[:, 2], 2]
+    return bases * weights
+
+
+def _sample(points, bases):
+    if bases.ndim == 2:
+        return np.einsum('sm,kmd->ksd', bases, points)
+    return np.einsum('ksm,kmd->ksd', bases, points)
+
+
+def evaluate_triangles(points, uvw, degree=None):
+    '''
+    Evaluates K triangular patches at S barycentric samples.
+
+    points: (K, M, dim)
+    uvw: (S, 3) or (K, S, 3)
+
+    Returns (position, d_du, d_dv), each (K, S, dim). The derivatives match
+    triangular_patch_3d_du/_dv: partials in u and v with w held fixed. The
+    tangent along the surface with w = 1-u-v is d_du - d_dw, which
+    triangle_derivative(points, uvw, 2) provides.
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    uvw = np.asarray(uvw, dtype=np.float64)
+    degree = triangle_degree(points.shape[1]) if degree is None else degree
+
+    pos = _sample(points, triangle_bases(degree, uvw))
+    du = triangle_derivative(points, uvw, 0, degree)
+    dv = triangle_derivative(points, uvw, 1, degree)
+    return (pos, du, dv)
+
+
+def triangle_derivative(points, uvw, axis, degree=None):
+    '''
+    Partial derivative along one barycentric coordinate, (K, S, dim):
+    n * sum over degree n-1 of weights * p_(ijk + e_axis) * bases
+    '''
+    points = np.asarray(points, dtype=np.float64)
+    degree = triangle_degree(points.shape[1]) if degree is None else degree
+    if degree == 0:
+        uvw = np.asarray(uvw)
+        return np.zeros(points.shape[:1] + uvw.shape[-2:-1] + points.shape[-1:])
+
+    shifted = points[:, shifted_point_indices(degree, axis), :]
+    return degree * _sample(shifted, triangle_bases(degree-1, uvw))
+
+
+def triangle_degree(num_points):
+    '''
+    Inverse of M = (n+1)(n+2)/2
+    '''
+    degree = int(round((math.sqrt(8 * num_points + 1) - 3) / 2))
+    if (degree+1) * (degree+2) // 2 != num_points:
+        raise Exception("%i points don't make up a triangular patch" % num_points)
+    return degree
@@ -1,6 +1,11 @@
+import os
+import sys
 from sympy import *
 from sympy.physics.vector import *
 import matplotlib.pyplot as plt
+from ramjet.csharp import CSharpCodePrinter
+
+OPTIMIZE_CODE = os.environ.get('RAMJET_OPTIMIZE_CODE', '0') not in ('', '0')
 
 
 def invert_dict(dict):
@@ -49,131 +54,29 @@ def print_pretty(common, exprs):
         pprint(expr)
 
 
-def print_code(common, exprs):
-    print("\n/*----------------terms-------------------*/\n")
-
-    for t in common:
-        print(csharp(t))
-
-    print("\n/*--------------solutions------------------*/\n")
-
-    for i, expr in enumerate(exprs):
-        print("float output_%d = " % i + replace_vector_vars(ccode(expr)) + ";")
-
-
-'''
-Poor man's CodeGen: take ccode output, and format it to valid
-C# through very dodge string manipulation
-
-Todo: make a proper sympy codegen module for C#, or pipe results
-into Roslyn AST using F# or something...
-'''
-
-
-def csharp(code):
-    code = ccode(code)
-    code = code[1:-1]
-
-    comma_idx = code.find(",")
-    code = code[0:comma_idx] + " =" + code[comma_idx+1:]
-    code = "float " + code + ";"
-
-    code = format_math_funcs(code)
-    code = replace_vector_vars(code)
-    code = format_floats(code)
-
-    return code
-
-def format_math_funcs(code):
-    code = code.replace("pow", "math.pow")
-    code = code.replace("sqrt", "math.sqrt")
-    return code
-
-def replace_vector_vars(code):
+def print_code(common, exprs, printer=None, optimize=None, name=None, layout=None):
     '''
-    Scan through string finding occurances of 'identifier{n}_{x,y,z}'
-    Replace each with 'curve[*].*'
+    Prints cse() output as C#, headed by its symbol layout and what it
+    costs in flops, see ramjet.emit. The control points in layout, a
+    ramjet.kernels layout, are printed as arrays; by default that's the p
+    net. Pass a CSharpCodePrinter to configure indexing further, see
+    ramjet.csharp.
+
+    With optimize (default: the RAMJET_OPTIMIZE_CODE environment variable)
+    terms are rewritten into Horner form in t, u, v, w and small integer
+    powers are multiplied out, see ramjet.optimize.
+
+    name goes into the header. Left out, it comes from the enclosing
+    ramjet.emit.kernel_name block, which run_derivations opens with each
+    derivation's name.
     '''
+    from ramjet.emit import emit_code
+    emit_code(common, exprs, sys.stdout, printer, optimize, name, layout=layout)
+
 
-    # tri_quad_indices = {
-    #     "002" : 0,
-    #     "011" : 1,
-    #     "020" : 2,
-    #     "101" : 3,
-    #     "110" : 4,
-    #     "200" : 5,
-    # }
-
-    tri_quart_indices = {
-        "004": 0,
-        "013": 1,
-        "022": 2,
-        "031": 3,
-        "040": 4,
-        "103": 5,
-        "112": 6,
-        "121": 7,
-        "130": 8,
-        "202": 9,
-        "211": 10,
-        "220": 11,
-        "301": 12,
-        "310": 13,
-        "400": 14,
-    }
-
-    bases = ['x', 'y', 'z', 'w']
-
-    pos = 0
-    while True:
-        pos = code.find('_', pos)
-        if pos <= 1:
-            break
-
-        # in bases and code[pos-1].isdigit()
-        if code[pos-1] == 'p' and code[pos+1].isdigit():
-            # Quad point indexing, e.g. p_0.x -> p[0].x
-
-            numDigits = 1
-            while (code[pos+numDigits+1].isdigit()):
-                numDigits+=1
-
-            index = int(code[pos+1:pos+1+numDigits]) - 1
-
-            code = code[0:pos-1] + "p[" + str(index) + "]." + code[pos+1+numDigits+1:]
-        
-        # elif code[pos-1] == 't':
-        #     # Tri point indexing, e.g. t_101.x -> p[3].x
-        #     # Todo: find out which degree of patch we're dealing with
-
-        #     idxString = code[pos+2:pos+5]
-        #     idx = tri_quart_indices[idxString]
-
-        #     code = code[pos] + "p[" + idx + "]." + code[pos+5:]
-
-        else:
-            pos += 1
-    return code
-
-def find_identifier_backwards_from(code, end):
-    for i in range(end, -1, -1):
-        if code[i].isalpha():
-            return i
-    return 0
-
-def format_floats(code):
+def csharp(term, printer=None):
     '''
-    Scan through string finding occurances of 'n.n'
-    Replace each with 'n.nf'
+    C# declaration for a single (symbol, expr) term of cse() output
     '''
-    pos = 0
-    while True:
-        pos = code.find('.', pos)
-        if pos == -1:
-            break
-
-        if code[pos-1].isdigit() and code[pos+1].isdigit() and code[pos+2] != 'f':
-            code = code[0:pos+2] + "f" + code[pos+2:]
-        else:
-            pos += 1
-    return code
+    printer = CSharpCodePrinter() if printer is None else printer
+    return printer.declaration(*term)
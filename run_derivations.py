@@ -0,0 +1,208 @@
+import os
+import sys
+import time
+import inspect
+import argparse
+import importlib
+import traceback
+import multiprocessing
+from fnmatch import fnmatch
+from contextlib import redirect_stdout, redirect_stderr
+
+'''
+Runs derivations in parallel
+
+Instead of commenting functions in and out of each script's main(), pick
+derivations by name and run them in a pool of worker processes. Every
+derivation gets its own output file holding whatever it prints, which for
+most of them is the generated C#.
+
+    python run_derivations.py --list
+    python run_derivations.py 'silhouettes.*gradient*' --jobs 8 --timeout 600
+    python run_derivations.py quadratic_patch_3d_normals -o generated
+    python run_derivations.py 'triangular_patch.cubic*' --profile
+
+Derivations are the zero-argument functions defined in the derivation
+scripts, minus main. Patterns match either module.function or function.
+
+With --profile, each derivation also gets a per-stage breakdown (see
+ramjet.profiling) next to its output, as .profile.json and .profile.txt.
+'''
+
+DERIVATION_MODULES = [
+    'silhouettes',
+    'curvature_inflections',
+    'triangular_patch',
+    'dynamics',
+]
+
+
+def discover_derivations(modules=DERIVATION_MODULES):
+    '''
+    Returns [(module_name, function_name)] in source order
+    '''
+    derivations = []
+    for module_name in modules:
+        module = importlib.import_module(module_name)
+        functions = []
+        for name, func in vars(module).items():
+            if not inspect.isfunction(func) or func.__module__ != module_name:
+                continue
+            if name == 'main' or name.startswith('_'):
+                continue
+            if len(inspect.signature(func).parameters) > 0:
+                continue  # helpers, like set_to_zero or triangular_patch
+            functions.append((func.__code__.co_firstlineno, name))
+
+        for _, name in sorted(functions):
+            derivations.append((module_name, name))
+    return derivations
+
+
+def select_derivations(derivations, patterns):
+    if not patterns:
+        return derivations
+
+    selected = []
+    for module_name, name in derivations:
+        full_name = '%s.%s' % (module_name, name)
+        if any(fnmatch(full_name, p) or fnmatch(name, p) for p in patterns):
+            selected.append((module_name, name))
+    return selected
+
+
+def output_path(output_dir, module_name, name):
+    return os.path.join(output_dir, '%s.%s.cs' % (module_name, name))
+
+
+def run_derivation(module_name, name, path, profile=False):
+    '''
+    Worker process entry point: runs one derivation with its prints going
+    to path. Exit code 0 on success, 1 if the derivation raised.
+    '''
+    from sympy import init_printing
+    from ramjet.emit import kernel_name
+    init_printing(pretty_print=True, use_unicode=True, num_columns=180)
+
+    with open(path, 'w') as f, redirect_stdout(f), redirect_stderr(f):
+        try:
+            module = importlib.import_module(module_name)
+            # Kernels are named after the derivation printing them
+            with kernel_name(name):
+                if profile:
+                    profile_derivation(module, name, os.path.splitext(path)[0])
+                else:
+                    getattr(module, name)()
+        except Exception:
+            traceback.print_exc()
+            f.flush()
+            os._exit(1)
+        f.flush()
+    os._exit(0)
+
+
+def profile_derivation(module, name, path_base):
+    from ramjet.profiling import Profiler
+
+    profiler = Profiler(modules=[module.__name__])
+    try:
+        with profiler:
+            getattr(module, name)()
+    finally:
+        # Failed derivations are the ones most worth a look
+        profiler.write_json(path_base + '.profile.json')
+        with open(path_base + '.profile.txt', 'w') as f:
+            f.write(profiler.format_table() + '\n')
+
+
+def run_pool(tasks, output_dir, jobs, timeout, profile=False, poll_interval=0.1):
+    '''
+    Runs tasks with at most jobs processes at once, killing any that go
+    past timeout seconds. Returns [(module_name, name, status, seconds)]
+    with status one of 'ok', 'failed', 'timeout'.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    context = multiprocessing.get_context('spawn')
+
+    pending = list(tasks)
+    running = []
+    results = []
+
+    while pending or running:
+        while pending and len(running) < jobs:
+            module_name, name = pending.pop(0)
+            path = output_path(output_dir, module_name, name)
+            process = context.Process(target=run_derivation, args=(module_name, name, path, profile))
+            process.start()
+            running.append((process, module_name, name, time.perf_counter()))
+
+        still_running = []
+        for process, module_name, name, start in running:
+            elapsed = time.perf_counter() - start
+
+            if process.exitcode is not None:
+                status = 'ok' if process.exitcode == 0 else 'failed'
+            elif timeout is not None and elapsed > timeout:
+                process.terminate()
+                process.join()
+                status = 'timeout'
+            else:
+                still_running.append((process, module_name, name, start))
+                continue
+
+            process.join()
+            results.append((module_name, name, status, elapsed))
+            print("%-8s %8.1fs  %s.%s" % (status, elapsed, module_name, name))
+            sys.stdout.flush()
+
+        running = still_running
+        if running:
+            time.sleep(poll_interval)
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run derivations in a process pool")
+    parser.add_argument('patterns', nargs='*',
+                        help="fnmatch patterns on module.function or function, default all")
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                        help="worker processes, default one per core")
+    parser.add_argument('-t', '--timeout', type=float, default=None,
+                        help="seconds before a derivation is killed, default none")
+    parser.add_argument('-o', '--output-dir', default='generated',
+                        help="directory for per derivation output files")
+    parser.add_argument('-p', '--profile', action='store_true',
+                        help="write a per-stage profile next to each output")
+    parser.add_argument('-O', '--optimize', action='store_true',
+                        help="Horner form of each cse term and output, where it saves flops, and power expansion in generated code")
+    parser.add_argument('-l', '--list', action='store_true',
+                        help="list matching derivations and exit")
+    args = parser.parse_args()
+
+    tasks = select_derivations(discover_derivations(), args.patterns)
+
+    if args.optimize:
+        # Read by ramjet.util when the workers import it
+        os.environ['RAMJET_OPTIMIZE_CODE'] = '1'
+
+    if args.list:
+        for module_name, name in tasks:
+            print('%s.%s' % (module_name, name))
+        return 0
+
+    if not tasks:
+        print("No derivations match %s" % ' '.join(args.patterns))
+        return 1
+
+    results = run_pool(tasks, args.output_dir, max(1, args.jobs), args.timeout, args.profile)
+
+    failures = [r for r in results if r[2] != 'ok']
+    print("\n%i ok, %i failed, %i timed out" % (
+        len(results) - len(failures),
+        len([r for r in failures if r[2] == 'failed']),
+        len([r for r in failures if r[2] == 'timeout'])))
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
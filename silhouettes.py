@@ -4,6 +4,7 @@ from sympy.physics.vector import *
 from functools import reduce
 from ramjet.math import *
 from ramjet.util import *
+from ramjet.cache import cached_cse
 
 def set_to_zero(symbs, expr):
     subs = { k: v for k, v in map(lambda s: [s, 0], symbs) }
@@ -60,7 +61,7 @@ def silhouette_cubic_2d():
     solution = expand(solution)
     solution = to_oriented_cubic_curve_3d_xyz(solution)
 
-    poly = to_polynomial(solution, t)
+    poly = to_polynomial_fast(solution, t)
     print("Got polynomial of degree: " + str(poly.degree()))
 
     pprint(solution)
@@ -107,7 +108,7 @@ def silhouette_quadratic_2d():
     solution = viewdir.dot(normal)
     solution = expand(solution)
 
-    poly = to_polynomial(solution, t)
+    poly = to_polynomial_fast(solution, t)
     print("Got polynomial of degree: " + str(poly.degree()))
 
     solution = solveset(solution, t)
@@ -261,8 +262,6 @@ def silhouette_quadratic_3d_gradient_wrt_embedded_cubic():
         [symbolic_vector_3d('p4'), symbolic_vector_3d('p5'), symbolic_vector_3d('p6')],
         [symbolic_vector_3d('p7'), symbolic_vector_3d('p8'), symbolic_vector_3d('p9')]
     ]
-   
-    pos = make_bezier_patch_with_points(patch, u, v)
 
     patch_du = [
         [symbolic_vector_3d('du1'), symbolic_vector_3d('du2')],
@@ -273,16 +272,8 @@ def silhouette_quadratic_3d_gradient_wrt_embedded_cubic():
         [symbolic_vector_3d('dv1'), symbolic_vector_3d('dv2'), symbolic_vector_3d('dv3')],
         [symbolic_vector_3d('dv4'), symbolic_vector_3d('dv5'), symbolic_vector_3d('dv6')]
     ]
- 
-    tangents_u = make_bezier_patch_with_points(patch_du, u, v)
-    tangents_v = make_bezier_patch_with_points(patch_dv, u, v)
-
-    normal = tangents_u.cross(tangents_v)
 
     viewpos = symbolic_vector_3d('viewPoint')
-    viewdir = pos - viewpos
-
-    solution = viewdir.dot(normal)**2
 
     uv1 = symbolic_vector_2d('uv1')
     uv2 = symbolic_vector_2d('uv2')
@@ -290,18 +281,33 @@ def silhouette_quadratic_3d_gradient_wrt_embedded_cubic():
     uv4 = symbolic_vector_2d('uv4')
     uvs = (uv1, uv2, uv3, uv4)
 
-    bases_uv = bezier_bases(3, t)
-    uv = make_bezier(uvs, bases_uv)(t)
+    def derive():
+        pos = make_bezier_patch_with_points(patch, u, v)
 
-    solution = solution.subs(u, uv[0]).subs(v, uv[1])
+        tangents_u = make_bezier_patch_with_points(patch_du, u, v)
+        tangents_v = make_bezier_patch_with_points(patch_dv, u, v)
 
-    partials = []
-    for p in uvs:
-        partials.append(diff(solution, p))
-        # partials.append(diff(solution, p[0]))
-        # partials.append(diff(solution, p[1]))
+        normal = tangents_u.cross(tangents_v)
 
-    common, exprs = cse(partials, numbered_symbols('a'))
+        viewdir = pos - viewpos
+
+        solution = viewdir.dot(normal)**2
+
+        bases_uv = bezier_bases(3, t)
+        uv = make_bezier(uvs, bases_uv)(t)
+
+        solution = solution.subs(u, uv[0]).subs(v, uv[1])
+
+        partials = []
+        for p in uvs:
+            partials.append(diff(solution, p))
+            # partials.append(diff(solution, p[0]))
+            # partials.append(diff(solution, p[1]))
+
+        return partials
+
+    common, exprs = cached_cse('silhouette_quadratic_3d_gradient_wrt_embedded_cubic',
+                               (patch, patch_du, patch_dv, viewpos, uvs, (u, v, t)), derive)
     print_code(common, exprs)
 
 def silhouette_quadratic_3d_gradient_wrt_embedded_cubic_tangents():
@@ -434,7 +440,7 @@ def silhouette_quadratic_3d_edge():
     solution = solution.subs(v, 0)
     solution = expand(solution)
 
-    poly = to_polynomial(solution, u)
+    poly = to_polynomial_fast(solution, u)
     print("Got polynomial of degree: %i"%poly.degree())
 
     solution_horned = horner(solution, wrt=u)
@@ -574,7 +580,7 @@ def silhouette_quadratic_3d_quadratic_normals():
     solution = expand(solution)
     print(solution)
 
-    poly = to_polynomial(solution, u)
+    poly = to_polynomial_fast(solution, u)
     print("Got polynomial of degree: %i"%poly.degree())
     # 4th degree poly in u, so we need to find more clever workarounds
 
@@ -691,7 +697,7 @@ def silhouette_quadratic_3d_homogeneous_edge_explicit():
 
     solution = Eq(normal[2], 0)
     solution = solution.subs(v, 0)
-    poly = to_polynomial(solution, u)
+    poly = to_polynomial_fast(solution, u)
     print("Degree: " + str(poly.degree()))
     # Yields a degree 3 polynomial
 
@@ -769,11 +775,11 @@ def quadratic_2d_bezier():
 
     common, exprs = cse(p, numbered_symbols('a'))
     print("Point:")
-    print_code(common, exprs)
+    print_code(common, exprs, name='quadratic_2d_bezier_point')
 
     common, exprs = cse(pd, numbered_symbols('a'))
     print("Tangent:")
-    print_code(common, exprs)
+    print_code(common, exprs, name='quadratic_2d_bezier_tangent')
 
 def quartic_bezier_3d():
     '''
@@ -983,7 +989,7 @@ def cubic_curve_on_quadratic_patch():
 
     p = patch.subs(u, uv[0]).subs(v, uv[1])
 
-    poly = to_polynomial(p[0], t)
+    poly = to_polynomial_fast(p[0], t)
     print("Got polynomial of degree: " + str(poly.degree()))
 
     common, exprs = cse(p, numbered_symbols('a'))
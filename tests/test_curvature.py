@@ -0,0 +1,42 @@
+import numpy as np
+from ramjet.curvature import curvatures, curvature_extrema, MAXIMUM, MINIMUM
+
+
+def dense_extrema(points, samples=20001):
+    # Interior local extrema of sampled curvature, as (t, kind)
+    t = np.linspace(0, 1, samples)
+    k = curvatures(points[np.newaxis], t)[0]
+    rising = np.diff(k) > 0
+    turns = np.nonzero(rising[1:] != rising[:-1])[0] + 1
+    return [(t[i], MAXIMUM if not rising[i] else MINIMUM) for i in turns]
+
+
+def test_curvature_extrema_against_dense_sampling():
+    rng = np.random.default_rng(20)
+    for dim in [2, 3]:
+        points = rng.uniform(-1, 1, (30, 4, dim))
+        roots, counts, kinds = curvature_extrema(points)
+        for n in range(0, len(points)):
+            expected = dense_extrema(points[n])
+            found = [(r, k) for r, k in zip(roots[n, :counts[n]], kinds[n, :counts[n]]) if k != 0]
+            # Extrema closer to the ends than the grid resolves are skipped
+            found = [(r, k) for r, k in found if 1e-3 < r < 1 - 1e-3]
+            assert len(found) == len(expected)
+            for (r, kind), (t, expected_kind) in zip(found, expected):
+                assert abs(r - t) < 1e-3
+                assert kind == expected_kind
+
+
+def test_curvatures_of_a_parabola():
+    # x = 2t - 1, y = x^2, curvature 2 / (1 + 4x^2)^(3/2)
+    points = np.array([[[-1.0, 1.0], [0.0, -1.0], [1.0, 1.0]]])
+    t = np.linspace(0, 1, 9)
+    x = 2 * t - 1
+    np.testing.assert_allclose(curvatures(points, t)[0], 2 / (1 + 4 * x * x) ** 1.5, rtol=1e-12)
+
+
+def test_straight_curves():
+    points = np.array([[[0.0, 0.0], [1.0, 1.0], [2.0, 2.0], [3.0, 3.0]]])
+    roots, counts, kinds = curvature_extrema(points)
+    assert counts[0] == -1
+    assert np.isnan(roots).all()
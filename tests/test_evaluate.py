@@ -0,0 +1,102 @@
+import numpy as np
+from sympy import symbols, lambdify, diff, Matrix
+from ramjet.math import bezier_bases, make_bezier, make_bezier_patch_with_points, triangular_indices, trinomial
+from ramjet.curves import evaluate_curves
+from ramjet.patches import evaluate_patches, evaluate_patch_derivatives
+from ramjet.triangles import evaluate_triangles
+
+t, u, v, w = symbols('t u v w')
+
+
+def sympy_curve(points):
+    # Position and first two derivatives as functions of t, from ramjet.math
+    degree = len(points) - 1
+    curve = make_bezier([Matrix(p) for p in points], bezier_bases(degree, t))(t)
+    return [lambdify(t, curve), lambdify(t, diff(curve, t)), lambdify(t, diff(curve, t, 2))]
+
+
+def test_curves_match_sympy():
+    rng = np.random.default_rng(3)
+    for degree in [1, 2, 3, 5]:
+        points = rng.uniform(-1, 1, (4, degree+1, 3))
+        samples = np.linspace(0, 1, 7)
+        result = evaluate_curves(points, samples, order=2)
+        assert result.shape == (3, 4, 7, 3)
+
+        for n in range(0, 4):
+            functions = sympy_curve(points[n])
+            for k, f in enumerate(functions):
+                expected = np.array([np.ravel(f(s)) for s in samples])
+                np.testing.assert_allclose(result[k, n], expected, atol=1e-12)
+
+
+def test_curves_per_curve_parameters():
+    rng = np.random.default_rng(4)
+    points = rng.uniform(-1, 1, (5, 4, 2))
+    samples = rng.uniform(0, 1, (5, 3))
+    result = evaluate_curves(points, samples)
+    for n in range(0, 5):
+        np.testing.assert_allclose(result[0, n], evaluate_curves(points[n:n+1], samples[n])[0, 0])
+
+
+def test_patches_match_sympy():
+    rng = np.random.default_rng(5)
+    points = rng.uniform(-1, 1, (2, 3, 4, 3))  # degree 3 in u, 2 in v
+    uv = rng.uniform(0, 1, (6, 2))
+    position, tangent_u, tangent_v, normal = evaluate_patches(points, uv[:, 0], uv[:, 1])
+
+    for k in range(0, 2):
+        patch = [[Matrix(points[k, j, i]) for i in range(0, 4)] for j in range(0, 3)]
+        surface = make_bezier_patch_with_points(patch, u, v)
+        functions = [lambdify((u, v), e) for e in (surface, diff(surface, u), diff(surface, v))]
+        for s, (us, vs) in enumerate(uv):
+            p, du, dv = (np.ravel(f(us, vs)) for f in functions)
+            np.testing.assert_allclose(position[k, s], p, atol=1e-12)
+            np.testing.assert_allclose(tangent_u[k, s], du, atol=1e-12)
+            np.testing.assert_allclose(tangent_v[k, s], dv, atol=1e-12)
+            np.testing.assert_allclose(normal[k, s], np.cross(du, dv), atol=1e-12)
+
+
+def test_patch_derivatives_against_finite_differences():
+    rng = np.random.default_rng(6)
+    points = rng.uniform(-1, 1, (3, 3, 3, 3))
+    us = rng.uniform(0.1, 0.9, 5)
+    vs = rng.uniform(0.1, 0.9, 5)
+    h = 1e-5
+    duv = evaluate_patch_derivatives(points, us, vs, [(1, 1)])[0]
+    corners = [evaluate_patch_derivatives(points, us + a * h, vs + b * h, [(0, 0)])[0]
+               for a, b in [(1, 1), (1, -1), (-1, 1), (-1, -1)]]
+    numeric = (corners[0] - corners[1] - corners[2] + corners[3]) / (4 * h * h)
+    np.testing.assert_allclose(duv, numeric, atol=1e-4)
+
+
+def test_homogeneous_patches_project():
+    rng = np.random.default_rng(7)
+    points = rng.uniform(0.5, 1.5, (1, 3, 3, 4))
+    us = np.linspace(0, 1, 5)
+    vs = np.linspace(1, 0, 5)
+    position, tangent_u, _, _ = evaluate_patches(points, us, vs)
+    h = 1e-6
+    plus = evaluate_patches(points, us + h, vs)[0]
+    minus = evaluate_patches(points, us - h, vs)[0]
+
+    x = evaluate_patch_derivatives(points, us, vs, [(0, 0)])[0]
+    np.testing.assert_allclose(position, x[..., :3] / x[..., 3:], atol=1e-12)
+    np.testing.assert_allclose(tangent_u, (plus - minus) / (2 * h), atol=1e-5)
+
+
+def test_triangles_match_sympy():
+    rng = np.random.default_rng(8)
+    degree = 3
+    indices = triangular_indices(degree)
+    points = rng.uniform(-1, 1, (2, len(indices), 3))
+    uvw = rng.dirichlet([1, 1, 1], 6)
+    position, d_du, d_dv = evaluate_triangles(points, uvw)
+
+    for k in range(0, 2):
+        surface = sum((trinomial(degree, i, j, l) * u**i * v**j * w**l * Matrix(points[k, n])
+                       for n, (i, j, l) in enumerate(indices)), Matrix([0, 0, 0]))
+        functions = [lambdify((u, v, w), e) for e in (surface, diff(surface, u), diff(surface, v))]
+        for s, sample in enumerate(uvw):
+            for result, f in zip((position, d_du, d_dv), functions):
+                np.testing.assert_allclose(result[k, s], np.ravel(f(*sample)), atol=1e-12)
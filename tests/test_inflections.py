@@ -0,0 +1,63 @@
+import numpy as np
+from ramjet.curves import evaluate_curves
+from ramjet.inflections import inflections
+
+
+def signed_curvature_numerator(points, t):
+    # cross(pd, pdd) of 2d curves, sampled
+    _, pd, pdd = evaluate_curves(points, t, order=2)
+    return pd[..., 0] * pdd[..., 1] - pd[..., 1] * pdd[..., 0]
+
+
+def test_inflections_against_dense_sampling():
+    rng = np.random.default_rng(30)
+    points = rng.uniform(-1, 1, (300, 4, 2))
+    roots, counts, cusps = inflections(points)
+
+    t = np.linspace(0, 1, 20001)
+    values = signed_curvature_numerator(points, t)
+    sign_changes = (np.sign(values[:, 1:]) != np.sign(values[:, :-1])).sum(axis=1)
+    np.testing.assert_array_equal(counts, sign_changes)
+
+    for n in range(0, len(points)):
+        at_roots = signed_curvature_numerator(points[n:n+1], roots[n, :counts[n]])[0]
+        np.testing.assert_allclose(at_roots, 0, atol=1e-9)
+    assert not cusps.any()
+
+
+def test_inflections_of_an_s_curve():
+    # Point symmetric about its middle, so it inflects at t = 1/2
+    points = np.array([[[0.0, 0.0], [1.0, 1.0], [2.0, -1.0], [3.0, 0.0]]])
+    roots, counts, cusps = inflections(points)
+    assert counts[0] == 1
+    np.testing.assert_allclose(roots[0, 0], 0.5, atol=1e-12)
+
+
+def test_planar_and_twisted_3d_cubics():
+    rng = np.random.default_rng(31)
+    planar = rng.uniform(-1, 1, (20, 4, 2))
+    rotation, _ = np.linalg.qr(rng.normal(size=(3, 3)))
+    lifted = np.concatenate([planar, np.zeros((20, 4, 1))], axis=-1) @ rotation.T
+
+    expected, expected_counts, _ = inflections(planar)
+    roots, counts, _ = inflections(lifted)
+    np.testing.assert_array_equal(counts, expected_counts)
+    np.testing.assert_allclose(roots, expected, atol=1e-9)
+
+    # A twisted cubic never lies in a plane, so never inflects
+    twisted = np.array([[[0.0, 0.0, 0.0], [1/3, 0.0, 0.0], [2/3, 1/3, 0.0], [1.0, 1.0, 1.0]]])
+    _, counts, _ = inflections(twisted)
+    assert counts[0] == 0
+
+
+def test_straight_and_cusp():
+    straight = np.array([[[0.0, 0.0], [1.0, 2.0], [2.0, 4.0], [3.0, 6.0]]])
+    assert inflections(straight)[1][0] == -1
+
+    # Crossing inner control points give a cusp at t = 1/2
+    cusp = np.array([[[0.0, 0.0], [1.0, 1.0], [0.0, 1.0], [1.0, 0.0]]])
+    roots, counts, cusps = inflections(cusp)
+    assert counts[0] >= 1
+    assert cusps[0, :counts[0]].any()
+    _, pd, _ = evaluate_curves(cusp, roots[0, :counts[0]][cusps[0, :counts[0]]], order=2)
+    np.testing.assert_allclose(pd, 0, atol=1e-9)
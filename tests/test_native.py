@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from sympy import symbols, cse, diff, sqrt, numbered_symbols
+from ramjet.math import make_bezier_patch_with_points, symbolic_vector_3d
+from ramjet.kernels import make_kernel, point_layout
+from ramjet.patches import evaluate_patches
+from ramjet import native
+
+u, v = symbols('u v')
+
+
+@pytest.fixture
+def compiler():
+    try:
+        return native.find_compiler()
+    except Exception as e:
+        pytest.skip(str(e))
+
+
+def patch_derivation():
+    # Position and unit normal of a biquadratic patch, like silhouettes.py
+    patch = [[symbolic_vector_3d('p%i' % (3 * j + i + 1)) for i in range(0, 3)] for j in range(0, 3)]
+    position = make_bezier_patch_with_points(patch, u, v)
+    normal = diff(position, u).cross(diff(position, v))
+    unit_normal = normal / sqrt(normal.dot(normal))
+    common, exprs = cse([position, unit_normal], numbered_symbols('a'))
+    layout = [point_layout('p', 9, ['x', 'y', 'z']), ('u', 'u', None), ('v', 'v', None)]
+    return (common, exprs, layout)
+
+
+def test_native_matches_numpy(compiler, tmp_path):
+    common, exprs, layout = patch_derivation()
+    numpy_kernel = make_kernel(common, exprs, layout)
+    native_kernel = native.make_native_kernel(common, exprs, layout, cache_dir=str(tmp_path))
+
+    rng = np.random.default_rng(40)
+    points = rng.uniform(-1, 1, (200, 9, 3))
+    us, vs = rng.uniform(0, 1, (2, 200))
+    expected = numpy_kernel(points, us, vs)
+    result = native_kernel(points, us, vs)
+    for e, r in zip(expected, result):
+        assert r.shape == e.shape
+        np.testing.assert_allclose(r, e, rtol=1e-12, atol=1e-12)
+
+    # And both agree with the batched evaluator
+    position, _, _, normal = evaluate_patches(points.reshape(200, 3, 3, 3), us[:, None], vs[:, None])
+    np.testing.assert_allclose(result[0], position[:, 0], atol=1e-12)
+    np.testing.assert_allclose(result[1], normal[:, 0] / np.linalg.norm(normal[:, 0], axis=-1, keepdims=True),
+                               atol=1e-10)
+
+
+def test_native_broadcasts_and_takes_empty_batches(compiler, tmp_path):
+    common, exprs, layout = patch_derivation()
+    kernel = native.make_native_kernel(common, exprs, layout, cache_dir=str(tmp_path))
+
+    rng = np.random.default_rng(41)
+    points = rng.uniform(-1, 1, (9, 3))
+    grid = np.linspace(0, 1, 5)
+    position, normal = kernel(points, grid[:, None], grid[None, :])
+    assert position.shape == (5, 5, 3) and normal.shape == (5, 5, 3)
+    np.testing.assert_allclose(position, make_kernel(common, exprs, layout)(points, grid[:, None], grid[None, :])[0])
+
+    position, normal = kernel(np.zeros((0, 9, 3)), np.zeros(0), np.zeros(0))
+    assert position.shape == (0, 3) and normal.shape == (0, 3)
+
+
+def test_native_builds_are_cached(compiler, tmp_path):
+    common, exprs, layout = patch_derivation()
+    first = native.make_native_kernel(common, exprs, layout, cache_dir=str(tmp_path))
+    second = native.make_native_kernel(common, exprs, layout, cache_dir=str(tmp_path))
+    assert first.library == second.library
+    assert len(list(tmp_path.glob('*.c'))) == 1
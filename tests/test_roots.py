@@ -0,0 +1,66 @@
+from math import comb
+import numpy as np
+from ramjet.basis import power_to_bernstein_np
+from ramjet.roots import bernstein_roots
+
+
+def bernstein_from_roots(roots, scale=1.0):
+    # Bernstein coefficients of scale * prod(t - r)
+    power = np.array([scale])
+    for r in roots:
+        power = np.convolve(power, [1.0, -r])
+    # np.convolve gives highest powers first, the basis tables lowest first
+    return power_to_bernstein_np(len(roots)) @ power[::-1]
+
+
+def _bases(n, t):
+    t = np.asarray(t, dtype=np.float64)[:, np.newaxis]
+    i = np.arange(0, n+1)
+    return np.array([comb(n, k) for k in i]) * t**i * (1 - t)**(n - i)
+
+
+def test_known_roots():
+    rng = np.random.default_rng(1)
+    expected = []
+    coeffs = []
+    for _ in range(0, 50):
+        inside = np.sort(rng.uniform(0.05, 0.95, rng.integers(1, 4)))
+        outside = rng.uniform(1.5, 3.0, 5 - len(inside))
+        expected.append(inside)
+        coeffs.append(bernstein_from_roots(np.concatenate([inside, outside]), rng.uniform(0.5, 2.0)))
+
+    roots, counts = bernstein_roots(np.array(coeffs))
+    assert roots.shape == (50, 5)
+    for r, c, e in zip(roots, counts, expected):
+        assert c == len(e)
+        np.testing.assert_allclose(r[:c], e, atol=1e-8)
+        assert np.isnan(r[c:]).all()
+
+
+def test_against_dense_sampling():
+    # Every sign change seen on a fine grid is a root, and vice versa
+    rng = np.random.default_rng(2)
+    coeffs = rng.uniform(-1, 1, (200, 6))
+    roots, counts = bernstein_roots(coeffs)
+
+    t = np.linspace(0, 1, 4001)
+    values = coeffs @ _bases(5, t).T
+    sign_changes = (np.sign(values[:, 1:]) != np.sign(values[:, :-1])).sum(axis=1)
+    np.testing.assert_array_equal(counts, sign_changes)
+
+    for c, r, row in zip(counts, roots, coeffs):
+        at_roots = _bases(5, r[:c]) @ row
+        np.testing.assert_allclose(at_roots, 0, atol=1e-8)
+
+
+def test_no_roots_and_zero_polynomial():
+    roots, counts = bernstein_roots(np.array([[1.0, 0.5, 2.0], [0.0, 0.0, 0.0], [-1.0, -3.0, -0.5]]))
+    np.testing.assert_array_equal(counts, [0, -1, 0])
+    assert np.isnan(roots).all()
+
+
+def test_roots_at_the_ends():
+    roots, counts = bernstein_roots(np.array([[0.0, 1.0, 2.0], [2.0, 1.0, 0.0]]))
+    np.testing.assert_array_equal(counts, [1, 1])
+    np.testing.assert_allclose(roots[:, 0], [0.0, 1.0], atol=1e-10)
+
@@ -0,0 +1,68 @@
+import numpy as np
+from ramjet.curves import evaluate_curves
+from ramjet.patches import evaluate_patch_derivatives
+from ramjet.triangles import evaluate_triangles
+from ramjet.subdivision import (split_curves, split_patches, split_triangles, restrict_triangles,
+                                subdivide_triangles, MIDPOINT_CORNERS)
+
+
+def test_split_curves():
+    rng = np.random.default_rng(10)
+    points = rng.uniform(-1, 1, (6, 4, 3))
+    t = rng.uniform(0.1, 0.9, 6)
+    left, right = split_curves(points, t)
+
+    s = np.linspace(0, 1, 11)
+    np.testing.assert_allclose(evaluate_curves(left, s)[0],
+                               evaluate_curves(points, t[:, None] * s)[0], atol=1e-12)
+    np.testing.assert_allclose(evaluate_curves(right, s)[0],
+                               evaluate_curves(points, t[:, None] + (1 - t[:, None]) * s)[0], atol=1e-12)
+
+
+def test_split_patches():
+    rng = np.random.default_rng(11)
+    points = rng.uniform(-1, 1, (3, 3, 4, 3))
+    u, v = 0.3, 0.6
+    quarters = split_patches(points, u, v)
+
+    s = rng.uniform(0, 1, (2, 20))
+    ranges = [((0, u), (0, v)), ((u, 1), (0, v)), ((0, u), (v, 1)), ((u, 1), (v, 1))]
+    for quarter, ((u0, u1), (v0, v1)) in zip(quarters, ranges):
+        inner = evaluate_patch_derivatives(quarter, s[0], s[1], [(0, 0)])[0]
+        outer = evaluate_patch_derivatives(points, u0 + (u1 - u0) * s[0], v0 + (v1 - v0) * s[1], [(0, 0)])[0]
+        np.testing.assert_allclose(inner, outer, atol=1e-12)
+
+
+def _to_parent(corners, uvw):
+    # Barycentric samples of a child, in the parent's coordinates
+    return uvw @ corners
+
+
+def test_split_triangles():
+    rng = np.random.default_rng(12)
+    points = rng.uniform(-1, 1, (2, 10, 3))  # cubic
+    uvw = np.array([0.2, 0.5, 0.3])
+    pieces = split_triangles(points, uvw)
+
+    samples = rng.dirichlet([1, 1, 1], 15)
+    for a, piece in enumerate(pieces):
+        # Piece a has corner a moved to uvw
+        corners = np.eye(3)
+        corners[a] = uvw
+        expected = evaluate_triangles(points, _to_parent(corners, samples))[0]
+        np.testing.assert_allclose(evaluate_triangles(piece, samples)[0], expected, atol=1e-12)
+
+
+def test_restrict_and_subdivide_triangles():
+    rng = np.random.default_rng(13)
+    points = rng.uniform(-1, 1, (3, 6, 3))  # quadratic
+    samples = rng.dirichlet([1, 1, 1], 15)
+
+    corners = rng.dirichlet([1, 1, 1], 3)
+    restricted = restrict_triangles(points, corners)
+    np.testing.assert_allclose(evaluate_triangles(restricted, samples)[0],
+                               evaluate_triangles(points, _to_parent(corners, samples))[0], atol=1e-12)
+
+    for child, corners in zip(subdivide_triangles(points), MIDPOINT_CORNERS):
+        np.testing.assert_allclose(evaluate_triangles(child, samples)[0],
+                                   evaluate_triangles(points, _to_parent(corners, samples))[0], atol=1e-12)
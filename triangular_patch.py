@@ -4,6 +4,7 @@ from sympy.physics.vector import *
 from functools import reduce
 from ramjet.math import *
 from ramjet.util import *
+from ramjet.cache import cached_cse
 
 '''
 Todo:
@@ -32,17 +33,12 @@ The results of which match the paper. Meh.
 def triangular_patch(symbols, degree, basis):
     patch = Matrix([0]*len(basis))
 
-    for i in range(0, degree+1):
-        for j in range(0, degree+1):
-            for k in range(0, degree+1):
-                if (i+j+k != degree):
-                    continue
-
-                tri = trinomial(degree, i, j, k)
-                p_ijk = symbolic_vector('p%i%i%i' % (
-                    i, j, k), basis) * tri * (symbols[0]**i * symbols[1]**j * symbols[2]**k)
-                print('%i%i%i' % (i, j, k))
-                patch += p_ijk
+    for i, j, k in triangular_indices(degree):
+        tri = trinomial(degree, i, j, k)
+        p_ijk = symbolic_vector('p%i%i%i' % (
+            i, j, k), basis) * tri * (symbols[0]**i * symbols[1]**j * symbols[2]**k)
+        print('%i%i%i' % (i, j, k))
+        patch += p_ijk
 
     return patch
 
@@ -51,19 +47,11 @@ def triangular_patch_with_points(points, symbols, degree):
     dimensions = points[0].shape[0]
     patch = Matrix([0]*dimensions)
 
-    pointIdx = 0
-
-    for i in range(0, degree+1):
-        for j in range(0, degree+1):
-            for k in range(0, degree+1):
-                if (i+j+k != degree):
-                    continue
-
-                tri = trinomial(degree, i, j, k)
-                p_ijk = points[pointIdx] * tri * \
-                    (symbols[0]**i * symbols[1]**j * symbols[2]**k)
-                pointIdx += 1
-                patch += p_ijk
+    for pointIdx, (i, j, k) in enumerate(triangular_indices(degree)):
+        tri = trinomial(degree, i, j, k)
+        p_ijk = points[pointIdx] * tri * \
+            (symbols[0]**i * symbols[1]**j * symbols[2]**k)
+        patch += p_ijk
 
     return patch
 
@@ -71,16 +59,11 @@ def triangular_patch_with_points(points, symbols, degree):
 def triangular_patch_3d_du(symbols, degree):
     patch = Matrix([0, 0, 0])
 
-    for i in range(0, degree):
-        for j in range(0, degree):
-            for k in range(0, degree):
-                if (i+j+k != degree-1):
-                    continue
-
-                tri = trinomial(degree, i, j, k)
-                p_ijk = symbolic_vector_3d('p%i%i%i' % (
-                    i+1, j, k)) * tri * (symbols[0]**i * symbols[1]**j * symbols[2]**k)
-                patch += p_ijk
+    for i, j, k in triangular_indices(degree-1):
+        tri = trinomial(degree, i, j, k)
+        p_ijk = symbolic_vector_3d('p%i%i%i' % (
+            i+1, j, k)) * tri * (symbols[0]**i * symbols[1]**j * symbols[2]**k)
+        patch += p_ijk
 
     return patch
 
@@ -88,16 +71,11 @@ def triangular_patch_3d_du(symbols, degree):
 def triangular_patch_3d_dv(symbols, degree):
     patch = Matrix([0, 0, 0])
 
-    for i in range(0, degree):
-        for j in range(0, degree):
-            for k in range(0, degree):
-                if (i+j+k != degree-1):
-                    continue
-
-                tri = trinomial(degree, i, j, k)
-                p_ijk = symbolic_vector_3d('p%i%i%i' % (
-                    i, j+1, k)) * tri * (symbols[0]**i * symbols[1]**j * symbols[2]**k)
-                patch += p_ijk
+    for i, j, k in triangular_indices(degree-1):
+        tri = trinomial(degree, i, j, k)
+        p_ijk = symbolic_vector_3d('p%i%i%i' % (
+            i, j+1, k)) * tri * (symbols[0]**i * symbols[1]**j * symbols[2]**k)
+        patch += p_ijk
 
     return patch
 
@@ -218,7 +196,7 @@ def quadratic_rational_triangular_patch_3d_embedded_line():
     uvw = make_bezier((uvw1, uvw2), bases_uv)(t)
 
     p = patch.subs(u, uvw[0]).subs(v, uvw[1]).subs(w, uvw[2])
-    poly = to_polynomial(p[0], t)
+    poly = to_polynomial_fast(p[0], t)
     print("Got polynomial of degree: %i" % (poly.degree()))
     # pprint(expand(p[0]))
 
@@ -248,7 +226,7 @@ def quadratic_rational_sphere_octant_3d_embedded_line():
     uvw = make_bezier((uvw1, uvw2), bases_uv)(t)
 
     p = patch.subs(u, uvw[0]).subs(v, uvw[1]).subs(w, uvw[2])
-    poly = to_polynomial(p[0], t)
+    poly = to_polynomial_fast(p[0], t)
     print("Got polynomial of degree: %i" % (poly.degree()))
 
     pprint(p[0])
@@ -367,19 +345,23 @@ def cubic_triangular_patch_3d_silhouette_gradient():
     u, v, w = symbols('u v w')
     # w = 1 - u - v
 
-    patch = triangular_patch((u, v, w), 3, BASIS_3D)
-    patch_du = diff(patch, u)
-    patch_dv = diff(patch, v)
+    def derive():
+        patch = triangular_patch((u, v, w), 3, BASIS_3D)
+        patch_du = diff(patch, u)
+        patch_dv = diff(patch, v)
 
-    patch_normal = patch_du.cross(patch_dv)
+        patch_normal = patch_du.cross(patch_dv)
 
-    viewpoint = Matrix([0, 0, 0])
-    viewdir = patch - viewpoint
+        viewpoint = Matrix([0, 0, 0])
+        viewdir = patch - viewpoint
 
-    silhouette = viewdir.dot(patch_normal)**2
+        silhouette = viewdir.dot(patch_normal)**2
 
-    grad_u = diff(silhouette, u)
-    grad_v = diff(silhouette, v)
+        grad_u = diff(silhouette, u)
+        grad_v = diff(silhouette, v)
 
-    common, exprs = cse((grad_u, grad_v), numbered_symbols('a'))
+        return (grad_u, grad_v)
+
+    common, exprs = cached_cse('cubic_triangular_patch_3d_silhouette_gradient',
+                               ((u, v, w), 3, BASIS_3D), derive)
     print_code(common, exprs)